@@ -1,10 +1,14 @@
 import argparse as arg
+import os
+import time
 import numpy as np
 import Use_Data as data
+from star_catalog import StarCatalog
 import matplotlib.pyplot as plt
 from pathlib import Path
 from matplotlib import rc
-from os import listdir
+from matplotlib.figure import Figure
+from multiprocessing import Pool
 
 #rc('text', usetex=True) # For latex in plots
 
@@ -33,7 +37,7 @@ def plotdata(toPlot,
     filepath = folder + "/" + filename
 
     # Get data and header from file
-    arr, header = data.txt2array2D(filepath)
+    arr, header = data.load_array2D(filepath)
 
     # Set up for the plotting loop
     plotlen = len(toPlot)
@@ -60,11 +64,47 @@ def plotdata(toPlot,
     if ylim != [0, 0]: plt.ylim(ylim)
     plt.figure(1, dpi=300)
     plt.legend()
-    if save: plt.savefig(filepath[:-4] + ".png")
+    if save: plt.savefig(filepath.rsplit(".", 1)[0] + ".png")
     if not save: plt.show()
     plt.close()
 
 
+def render_star(job):
+    """
+	render_star draws the plot of one star without pyplot so it can run
+	in a worker process, and saves it as a png next to the star file
+
+	Args:
+		job (tuple): names of values to be plotted, filename, folder and
+			title of the plot
+
+	Return:
+		(tuple): filename and the seconds it took to plot
+	"""
+    toPlot, filename, folder, title = job
+    start = time.time()
+    filepath = folder + "/" + filename
+    arr, header = data.read_columns(filepath)
+
+    fig = Figure(dpi=300)
+    ax = fig.add_subplot()
+    for item in toPlot:
+        if item in header:
+            pltarr = arr[header.index(item)]
+            ax.plot(arr[0], pltarr / max(pltarr), label=item)
+
+        else:  # If toPlot value doesn't exist tell the user
+            print("There's no", item, "in the", filename, "file")
+
+    ax.set_title(title)
+    ax.set_xlabel('Radius (m)')
+    ax.set_ylabel('Components / Max Value')
+    ax.legend()
+    fig.savefig(filepath.rsplit(".", 1)[0] + ".png")
+
+    return filename, time.time() - start
+
+
 def plotall(toPlot,
             folder="Star_Files",
             save=False,
@@ -73,40 +113,47 @@ def plotall(toPlot,
             ytitle="",
             xlim=[0, 0],
             ylim=[0, 0],
-            divmax=True):
+            divmax=True,
+            processes=None,
+            force=False):
     """
-	plotdata takes in an array with the names of columns that are 
-	to be plotted and optionally a folder which contains the files 
-	as well as many plotting options for all the files in the folder 
-	that end in .txt
+	plotall saves a png of the given columns for all the files in the
+	folder that end in .txt or .star. Stars are plotted in parallel and
+	any star whose png is newer than its file is skipped.
 	
 	Args:
 		toPlot (np.array): array of names of values to be plotted
 		folder (str): folder name without forward slash
+		processes (int): number of worker processes, all cores if None
+		force (bool): plot every star even if its png is up to date
 	"""
-    files = listdir(folder + "/")  # Get list of files in folder
+    files = data.star_files(folder)  # Get list of star files in folder
 
+    jobs = []
     for file in files:
-        if file[-4:] == ".txt":  # Only continue for text files
-            name = file.split("_")  # Get file name to make title
-            title = (name[5] + ' Core, ' + name[7][:2] + ' Star, T$_c$ = ' +
-                     name[1] + ', $\\rho_c$ = ' + name[3][5:])
+        filepath = folder + "/" + file
+        png = filepath.rsplit(".", 1)[0] + ".png"
+        if (not force and os.path.exists(png) and
+                os.path.getmtime(png) >= os.path.getmtime(filepath)):
+            continue
 
-            # Plot data with the proper title
-            plotdata(
-                toPlot,
-                file,
-                save=True,
-                title=title,
-                xtitle='Radius (m)',
-                ytitle='Components / Max Value')
+        name = file.split("_")  # Get file name to make title
+        title = (name[5] + ' Core, ' + name[7][:2] + ' Star, T$_c$ = ' +
+                 name[1] + ', $\\rho_c$ = ' + name[3][5:])
+        jobs.append((toPlot, file, folder, title))
 
-            print("Plotted star:", title)
-            print()
+    print("Plotting", len(jobs), "of", len(files), "stars")
+    start = time.time()
+    with Pool(processes) as pool:
+        for file, seconds in pool.imap_unordered(render_star, jobs):
+            print("Plotted star: {} in {:.2f} s".format(file, seconds))
+    print("Plotted {} stars in {:.2f} s".format(len(jobs), time.time() - start))
 
 
 def plotmass_lum(folder="Star_Files"):
-    files = listdir(folder + "/")  # Get list of files in folder
+    # Get the surface values of every star from the catalog
+    catalog = StarCatalog(folder)
+    catalog.refresh()
     # Make temp and lum arrays
     luminosityH = []
     luminosityHe = []
@@ -115,26 +162,19 @@ def plotmass_lum(folder="Star_Files"):
     radiusHe = []
     radiusC = []
 
-    for file in files:  # Loop through the files
-        if file[-4:] == ".txt":  # If it's a text file
-            # Get the text file data
-            arr, header = data.txt2array2D(folder + "/" + file)
-
-            name = file.split("_")
-
-            if name[5] == "Hydrogen":
-                luminosityH.append(arr[header.index("luminosity")][-1])
-                radiusH.append(arr[header.index("radius")][-1])
+    for core, luminosity, radius in catalog.select(
+            ["core", "luminosity", "radius"]):
+        if core == "Hydrogen":
+            luminosityH.append(luminosity)
+            radiusH.append(radius)
 
-            if name[5] == "Helium":
-                luminosityHe.append(arr[header.index("luminosity")][-1])
-                radiusHe.append(arr[header.index("radius")][-1])
+        if core == "Helium":
+            luminosityHe.append(luminosity)
+            radiusHe.append(radius)
 
-            if name[5] == "Carbon":
-                luminosityC.append(arr[header.index("luminosity")][-1])
-                radiusC.append(arr[header.index("radius")][-1])
-
-            print("Got star", file)
+        if core == "Carbon":
+            luminosityC.append(luminosity)
+            radiusC.append(radius)
 
     luminosityH = np.array(luminosityH)/3.828e26
     luminosityHe = np.array(luminosityHe)/3.828e26
@@ -169,7 +209,9 @@ def plotmass_lum(folder="Star_Files"):
     plt.legend()
     plt.show()
 def plotmass_radius(folder="Star_Files"):
-    files = listdir(folder + "/")  # Get list of files in folder
+    # Get the surface values of every star from the catalog
+    catalog = StarCatalog(folder)
+    catalog.refresh()
     # Make temp and lum arrays
     massH = []
     massHe = []
@@ -178,26 +220,18 @@ def plotmass_radius(folder="Star_Files"):
     radiusHe = []
     radiusC = []
 
-    for file in files:  # Loop through the files
-        if file[-4:] == ".txt":  # If it's a text file
-            # Get the text file data
-            arr, header = data.txt2array2D(folder + "/" + file)
-
-            name = file.split("_")
-
-            if name[5] == "Hydrogen":
-                massH.append(arr[header.index("mass")][-1])
-                radiusH.append(arr[header.index("radius")][-1])
-
-            if name[5] == "Helium":
-                massHe.append(arr[header.index("mass")][-1])
-                radiusHe.append(arr[header.index("radius")][-1])
+    for core, mass, radius in catalog.select(["core", "mass", "radius"]):
+        if core == "Hydrogen":
+            massH.append(mass)
+            radiusH.append(radius)
 
-            if name[5] == "Carbon":
-                massC.append(arr[header.index("mass")][-1])
-                radiusC.append(arr[header.index("radius")][-1])
+        if core == "Helium":
+            massHe.append(mass)
+            radiusHe.append(radius)
 
-            print("Got star", file)
+        if core == "Carbon":
+            massC.append(mass)
+            radiusC.append(radius)
 
     massH = np.array(massH)/1988e30
     massHe = np.array(massHe)/1988e30
@@ -233,7 +267,9 @@ def plotmass_radius(folder="Star_Files"):
     plt.show()
 
 def plotmain(folder="Star_Files"):
-    files = listdir(folder + "/")  # Get list of files in folder
+    # Get the surface values of every star from the catalog
+    catalog = StarCatalog(folder)
+    catalog.refresh()
     # Make temp and lum arrays
     temperatureH = []
     luminosityH = []
@@ -242,41 +278,19 @@ def plotmain(folder="Star_Files"):
     temperatureC = []
     luminosityC = []
 
-    for file in files:  # Loop through the files
-        if file[-4:] == ".txt":  # If it's a text file
-            # Get the text file data
-            arr, header = data.txt2array2D(folder + "/" + file)
+    for core, temperature, luminosity in catalog.select(
+            ["core", "temperature", "luminosity"]):
+        if core == "Hydrogen":
+            temperatureH.append(temperature)
+            luminosityH.append(luminosity / 3.828e26)
 
-            name = file.split("_")
+        if core == "Helium":
+            temperatureHe.append(temperature)
+            luminosityHe.append(luminosity / 3.828e26)
 
-            if name[5] == "Hydrogen":
-                for item in header:  # Find the temp and lum columns
-                    if item == 'temperature':  # Add to temp
-                        temperatureH.append(arr[header.index(item)][-1])
-
-                    elif item == 'luminosity':  # Add to lum
-                        luminosityH.append(
-                            arr[header.index(item)][-1] / 3.828e26)
-
-            if name[5] == "Helium":
-                for item in header:  # Find the temp and lum columns
-                    if item == 'temperature':  # Add to temp
-                        temperatureHe.append(arr[header.index(item)][-1])
-
-                    elif item == 'luminosity':  # Add to lum
-                        luminosityHe.append(
-                            arr[header.index(item)][-1] / 3.828e26)
-
-            if name[5] == "Carbon":
-                for item in header:  # Find the temp and lum columns
-                    if item == 'temperature':  # Add to temp
-                        temperatureC.append(arr[header.index(item)][-1])
-
-                    elif item == 'luminosity':  # Add to lum
-                        luminosityC.append(
-                            arr[header.index(item)][-1] / 3.828e26)
-
-            print("Got star", file)
+        if core == "Carbon":
+            temperatureC.append(temperature)
+            luminosityC.append(luminosity / 3.828e26)
 
     plt.scatter(
         np.log10(temperatureH),
@@ -360,6 +374,10 @@ if __name__ == '__main__':
         'fileName',
         help='Enter the file name that contains the star that you want to plot',
         default="")
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='With all, plot every star even if its png is up to date')
 
     args = parser.parse_args()
     toPlot = ['density', 'temperature', 'opticaldepth', 'mass', 'luminosity']
@@ -369,7 +387,7 @@ if __name__ == '__main__':
     ytitle = "Test Y Axis"
 
     if args.fileName == "all":
-        plotall(toPlot)
+        plotall(toPlot, force=args.force)
         print("All star plot png's created and saved")
 
     elif args.fileName == "main":
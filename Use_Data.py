@@ -1,7 +1,53 @@
 import os
+import json
+import queue
+import threading
+import numpy as np
 from pathlib import Path
 
 
+def txt_path(filename="", folder="Star_Files", extension=".txt"):
+    """
+    txt_path gives the path array2D2txt writes a file called filename
+    to before it checks for existing files
+
+    Args:
+        filename (str): identifier for file
+        folder (str): folder name without forward slash
+        extension (str): file extension to use
+
+    Return:
+        (str): Path of the text file
+    """
+    # Create path to file
+    filepath = folder + "/" + filename
+    # Make defualt name
+    default = "star" + extension
+
+    # If no file name is set come name it the default
+    if filepath == folder + "/":
+        filepath += default
+
+    # Add extension if there is none
+    if not filepath.endswith(extension): filepath += extension
+
+    return filepath
+
+
+def check_columns(array, filename=""):
+    """
+    check_columns makes sure every column of a 2D array about to be saved
+    has the same length, as a short column would cut the others short
+
+    Raises:
+        ValueError: If the columns have different lengths
+    """
+    lengths = [len(column) for column in array]
+    if len(set(lengths)) > 1:
+        raise ValueError("Columns of {} have different lengths: {}".format(
+            filename, lengths))
+
+
 def array2D2txt(array, header=[], filename="", folder="Star_Files"):
     """
     results2txt takes in a 2D array, a filename without an extension, and a
@@ -13,21 +59,21 @@ def array2D2txt(array, header=[], filename="", folder="Star_Files"):
         array (np.array): data to be written to a file
         filename (str): identifier for file
         folder (str): folder name without forward slash
+
+    Returns:
+        (str): Path of the file written, which has a number appended if
+            the file already existed
+
+    Raises:
+        ValueError: If the columns have different lengths
     """
+    check_columns(array, filename)
+
     # Checks if there is a folder and makes one if there is not
     Path(folder).mkdir(parents=True, exist_ok=True)
 
     # Create path to file
-    filepath = folder + "/" + filename
-    # Make defualt name
-    default = "star.txt"
-
-    # If no file name is set come name it the default
-    if filepath == folder + "/":
-        filepath += default
-
-    # Add .txt extension if there is none
-    if filepath[-4:] != ".txt": filepath += ".txt"
+    filepath = txt_path(filename, folder)
 
     # Conditions for if a file name is given
     if os.path.exists(filepath):
@@ -45,19 +91,68 @@ def array2D2txt(array, header=[], filename="", folder="Star_Files"):
 
     # Write header if there is one
     if header != []:
-        ln = len(header)
-        for i in range(ln):
-            n = text_file.write(str(header[i]) + "\t")
-        n = text_file.write("\n")
+        n = text_file.write("".join(str(item) + "\t" for item in header) + "\n")
 
-    # Write content
-    for i in range(len(array[0])):
-        for j in array:
-            n = text_file.write(str(j[i]) + "\t")
-        n = text_file.write("\n")
+    # Format whole columns at once and write the content in a single call
+    columns = [[str(x) for x in np.asarray(j).tolist()] for j in array]
+    n = text_file.write("".join("\t".join(line) + "\t\n" for line in zip(*columns)))
 
     # Close text file
     text_file.close()
+    return filepath
+
+
+class BackgroundWriter:
+    """
+    Writes star files on a separate thread so the caller can
+    carry on solving the next star while the last one is written
+    """
+
+    def __init__(self, max_pending=4):
+        """
+        Starts the writer thread
+
+        Args:
+            max_pending (int): Number of files that can wait to be written
+                before submit blocks
+        """
+        self.jobs = queue.Queue(max_pending)
+        self.errors = []
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, array, header=[], filename="", folder="Star_Files",
+               write=None, **kwargs):
+        """
+        Queues a file to be written, takes the same arguments as array2D2txt.
+        write picks another writer such as array2D2bin, any extra keyword
+        arguments are passed on to it.
+        """
+        write = array2D2txt if write is None else write
+        self.jobs.put((write, (array, header, filename, folder), kwargs))
+
+    def run(self):
+        """
+        Writes queued files until close is called
+        """
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+
+            write, args, kwargs = job
+            try:
+                write(*args, **kwargs)
+            except Exception as error:
+                print("Failed writing", args[2], error)
+                self.errors.append((args[2], error))
+
+    def close(self):
+        """
+        Waits for every queued file to be written and stops the thread
+        """
+        self.jobs.put(None)
+        self.thread.join()
 
 
 def txt2array2D(filepath):
@@ -97,3 +192,207 @@ def txt2array2D(filepath):
     text_file.close()
 
     return array, header
+
+
+def txt_tail(filepath, block=4096):
+    """
+    txt_tail reads the last line of a text file by seeking back from the end
+    of the file, so the size of the file does not matter
+
+    Args:
+        filepath (str): file path to read
+        block (int): number of bytes read from the end at a time
+
+    Return:
+        (str): last non empty line, or "" if there is none
+    """
+    with open(filepath, "rb") as text_file:
+        size = text_file.seek(0, os.SEEK_END)
+        while True:
+            start = max(size - block, 0)
+            text_file.seek(start)
+            lines = text_file.read().rstrip().split(b"\n")
+            # Stop once a whole line is in the block
+            if len(lines) > 1 or start == 0:
+                return lines[-1].decode()
+            block *= 2
+
+
+def read_columns(filepath, columns=None, rows="all"):
+    """
+    read_columns reads some of the columns and rows of a star file of
+    either format. Text files are parsed in one vectorized call, and when
+    only the first or last row is wanted just that line is read.
+
+    Args:
+        filepath (str): file path to read
+        columns (list): names of the columns to read, all of them if None
+        rows (str or int): "all", "first", "last" or a stride taking every
+            n-th row
+
+    Return:
+        (np.array, list): Selected columns as the rows of a 2D array and
+            their names
+    """
+    if rows == "all":
+        selection = slice(None)
+    elif rows == "first":
+        selection = slice(0, 1)
+    elif rows == "last":
+        selection = slice(-1, None)
+    else:
+        selection = slice(None, None, rows)
+
+    if filepath.endswith(".star"):
+        array, header = bin2array2D(filepath)
+    else:
+        with open(filepath, "r") as text_file:
+            header = text_file.readline().split("\t")[:-1]
+            if rows == "last":
+                text = txt_tail(filepath)
+                # A file with only a header has no rows
+                if text.split() == header:
+                    text = ""
+            elif rows == "first":
+                text = text_file.readline()
+            else:
+                text = text_file.read()
+
+        array = np.array(text.split(), dtype=float).reshape(-1, len(header)).T
+
+    if columns is None:
+        columns = header
+    indices = [header.index(column) for column in columns]
+
+    return np.array(array[:, selection][indices]), list(columns)
+
+
+# Binary star files start with this magic string and the length of a JSON
+# header. The columns follow as contiguous little endian doubles, aligned
+# to BIN_ALIGN bytes so they can be memory mapped.
+BIN_MAGIC = b"STARCOL1"
+BIN_ALIGN = 64
+
+
+def array2D2bin(array, header=[], filename="", folder="Star_Files",
+                metadata=None):
+    """
+    array2D2bin saves a 2D array as a binary columnar .star file. The file
+    holds a self describing header with the column names, the number of
+    rows and any metadata such as the star parameters and converged rho_c.
+    An existing file with the same name is replaced.
+
+    Args:
+        array (np.array): data to be written to a file, one column per row
+        header (list): name of each column
+        filename (str): identifier for file
+        folder (str): folder name without forward slash
+        metadata (dict): anything JSON serializable to store with the data
+
+    Returns:
+        (str): Path of the file written
+
+    Raises:
+        ValueError: If the columns have different lengths
+    """
+    metadata = {} if metadata is None else metadata
+    check_columns(array, filename)
+    Path(folder).mkdir(parents=True, exist_ok=True)
+    filepath = txt_path(filename, folder, ".star")
+
+    rows = len(array[0])
+    columns = np.array([np.asarray(column, dtype="<f8") for column in array])
+
+    description = json.dumps({
+        "columns": [str(item) for item in header],
+        "rows": rows,
+        "dtype": "<f8",
+        "metadata": metadata
+    }, default=str).encode()
+    offset = len(BIN_MAGIC) + 8 + len(description)
+    offset += -offset % BIN_ALIGN
+
+    # Write next to the final file and move it over so readers never see
+    # a partly written star
+    temporary = filepath + ".tmp"
+    with open(temporary, "wb") as bin_file:
+        bin_file.write(BIN_MAGIC)
+        bin_file.write(len(description).to_bytes(8, "little"))
+        bin_file.write(description.ljust(offset - len(BIN_MAGIC) - 8))
+        bin_file.write(columns.tobytes())
+    os.replace(temporary, filepath)
+    return filepath
+
+
+def bin_header(filepath):
+    """
+    bin_header reads the header of a binary .star file
+
+    Return:
+        (dict): columns, rows, dtype, metadata and the offset of the data
+    """
+    with open(filepath, "rb") as bin_file:
+        if bin_file.read(len(BIN_MAGIC)) != BIN_MAGIC:
+            raise ValueError(filepath + " is not a binary star file")
+        length = int.from_bytes(bin_file.read(8), "little")
+        description = json.loads(bin_file.read(length))
+
+    offset = len(BIN_MAGIC) + 8 + length
+    description["offset"] = offset + (-offset % BIN_ALIGN)
+    return description
+
+
+def bin2array2D(filepath):
+    """
+    bin2array2D memory maps a binary .star file. Nothing is read from disk
+    until it is used, so taking one column or the last row only reads
+    those values.
+
+    Args:
+        filepath (str): file path to search for and read in
+
+    Return:
+        (np.memmap, list): Columns of the file as the rows of a read only
+            2D array and the column names
+    """
+    description = bin_header(filepath)
+    array = np.memmap(
+        filepath,
+        dtype=description["dtype"],
+        mode="r",
+        offset=description["offset"],
+        shape=(len(description["columns"]), description["rows"]))
+
+    return array, description["columns"]
+
+
+def load_array2D(filepath):
+    """
+    load_array2D reads a star file of either format, .star files with
+    bin2array2D and anything else with txt2array2D
+
+    Return:
+        (array, list): Columns of the file and the column names
+    """
+    if filepath.endswith(".star"):
+        return bin2array2D(filepath)
+
+    return txt2array2D(filepath)
+
+
+def star_files(folder="Star_Files"):
+    """
+    star_files lists the star files in a folder, one per star. When a star
+    was saved in both formats only the .star file is listed.
+
+    Return:
+        (list): File names sorted by name
+    """
+    files = os.listdir(folder)
+    stars = [file for file in files if file.endswith(".star")]
+    stars += [
+        file for file in files
+        if file.endswith(".txt") and file[:-4] + ".star" not in stars
+    ]
+
+    return sorted(stars)
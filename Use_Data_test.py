@@ -0,0 +1,66 @@
+"""
+Checks star files of both formats read back what was written
+"""
+import numpy as np
+import pytest
+import Use_Data as data
+
+HEADER = ["radius", "temperature", "mass"]
+
+
+def profile(rows=50):
+    """
+    Columns spanning many orders of magnitude like a star's do
+    """
+    random = np.random.default_rng(370)
+    return list(random.lognormal(10, 5, size=(len(HEADER), rows)))
+
+
+@pytest.mark.parametrize("save", [data.array2D2txt, data.array2D2bin])
+def test_round_trip(tmp_path, save):
+    array = profile()
+    filepath = save(array, HEADER, "star", str(tmp_path))
+
+    loaded, header = data.load_array2D(filepath)
+    assert list(header) == HEADER
+    np.testing.assert_array_equal(np.asarray(loaded), np.array(array))
+
+
+@pytest.mark.parametrize("save", [data.array2D2txt, data.array2D2bin])
+def test_read_columns(tmp_path, save):
+    array = profile()
+    filepath = save(array, HEADER, "star", str(tmp_path))
+
+    columns, header = data.read_columns(filepath, ["mass", "radius"])
+    assert header == ["mass", "radius"]
+    np.testing.assert_array_equal(columns, np.array(array)[[2, 0]])
+
+    last, header = data.read_columns(filepath, ["temperature"], "last")
+    np.testing.assert_array_equal(last, [[array[1][-1]]])
+
+
+def test_txt_numbers_taken_names(tmp_path):
+    first = data.array2D2txt(profile(), HEADER, "star", str(tmp_path))
+    second = data.array2D2txt(profile(), HEADER, "star", str(tmp_path))
+
+    assert first == data.txt_path("star", str(tmp_path))
+    assert second != first
+    np.testing.assert_array_equal(data.load_array2D(second)[0],
+                                  data.load_array2D(first)[0])
+
+
+def test_bin_metadata(tmp_path):
+    filepath = data.array2D2bin(profile(), HEADER, "star", str(tmp_path),
+                                metadata={"rho_c": 1.5})
+    assert data.bin_header(filepath)["metadata"] == {"rho_c": 1.5}
+
+    filepath = data.array2D2bin(profile(), HEADER, "other", str(tmp_path))
+    assert data.bin_header(filepath)["metadata"] == {}
+
+
+@pytest.mark.parametrize("save", [data.array2D2txt, data.array2D2bin])
+def test_ragged_columns(tmp_path, save):
+    array = profile()
+    array[1] = array[1][:-1]
+    with pytest.raises(ValueError):
+        save(array, HEADER, "star", str(tmp_path))
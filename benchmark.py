@@ -0,0 +1,368 @@
+"""
+Non interactive benchmarks of the star solver, the make_star shooting
+loop, star file I/O and the catalog plots. Every workload is timed and the
+results it produced are hashed, so a speed up that changes the stars shows
+up as a changed checksum. Results are appended to a JSON lines file and
+compared with the last run that used the same settings.
+
+    python benchmark.py --engine fused --stars 2
+"""
+import argparse as arg
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import warnings
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import jit_step
+import stellar_properties as starprop
+import make_star as ms
+import Use_Data as data
+import Plot_Data as plot
+from star_catalog import StarCatalog
+
+# Central temperature and a fixed central density for each core type
+SOLVE_STARS = {
+    "Hydrogen": (20768539.81, 72755.8),
+    "Helium": (100000000, 20000000000),
+    "Carbon": (500000000, 6000000000)
+}
+
+
+def checksum(columns):
+    """
+    Hashes the exact bytes of a list of columns
+
+    Returns:
+        (str): Start of the hex digest
+    """
+    digest = hashlib.sha256()
+    for column in columns:
+        digest.update(np.ascontiguousarray(column, dtype=float).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def timed(function, repeats=1):
+    """
+    Runs function repeats times
+
+    Returns:
+        (float, any): Best time in seconds and the result of the last run
+    """
+    best = np.inf
+    for i in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_solve(engine, tableau, controller, variable, table_tolerance,
+                jit, repeats):
+    """
+    Times Star.solve for every core type at a fixed central density. Physics
+    tables and compiled steps are made by the first repeat, so the best time
+    leaves them out.
+    """
+    steps = starprop.LOG_RADIUS_STEPS if variable == "log_radius" else {}
+    results = {}
+    for core, (temperature, density) in SOLVE_STARS.items():
+
+        def solve():
+            star = starprop.Star(cent_density=density,
+                                 cent_temperature=temperature,
+                                 core=core,
+                                 engine=engine,
+                                 tableau=tableau,
+                                 controller=controller,
+                                 variable=variable,
+                                 table_tolerance=table_tolerance,
+                                 jit=jit,
+                                 **steps)
+            star.solve()
+            return star
+
+        seconds, star = timed(solve, repeats)
+        results["solve_" + core] = {
+            "seconds": seconds,
+            "points": star.points,
+            "checksum": checksum(ms.star_profile(star))
+        }
+        print("Solved {} star in {:.2f} s".format(core, seconds))
+
+    return results
+
+
+def bench_make_star(engine, tableau, controller, variable, table_tolerance,
+                    jit, method, lines):
+    """
+    Times full make_star runs for starlist lines and hashes the saved files
+    """
+    results = {}
+    for line in lines:
+        line = line.replace("\n", "").split(", ")
+        name = "Tc_{:.2e}_rhoc_guess{:.2e}_Core_{}_Type_{}".format(
+            float(line[0]), float(line[1]), line[2], line[3].strip())
+
+        written = []
+        seconds, rho_c = timed(lambda: ms.make_star(
+            float(line[0]), float(line[1]), line[2], name, engine=engine,
+            method=method, tableau=tableau, controller=controller,
+            variable=variable, table_tolerance=table_tolerance, jit=jit,
+            written=written))
+        array, header = data.read_columns(written[-1])
+        results["make_star_" + name] = {
+            "seconds": seconds,
+            "rho_c": rho_c,
+            "checksum": checksum(array)
+        }
+        print("Made star {} in {:.2f} s".format(name, seconds))
+
+    return results
+
+
+def bench_io(rows, repeats, folder="Bench_IO"):
+    """
+    Times writing and reading a large synthetic profile in both formats
+    """
+    random = np.random.default_rng(370)
+    array = list(random.lognormal(10, 5, size=(23, rows)))
+    header = ["radius"] + ms.SAVE_VARIABLE
+    txt = data.txt_path("large", folder)
+    star = data.txt_path("large", folder, ".star")
+
+    def write_txt():
+        if os.path.exists(txt):
+            os.remove(txt)
+        data.array2D2txt(array, header, "large", folder)
+
+    workloads = {
+        "write_txt": write_txt,
+        "read_txt": lambda: data.txt2array2D(txt)[0],
+        "read_columns_txt": lambda: data.read_columns(txt)[0],
+        "read_last_txt": lambda: data.read_columns(txt, ["mass"], "last")[0],
+        "write_star": lambda: data.array2D2bin(array, header, "large", folder),
+        "read_star": lambda: data.read_columns(star)[0],
+        "read_last_star": lambda: data.read_columns(star, ["mass"],
+                                                    "last")[0],
+    }
+
+    results = {}
+    for key, function in workloads.items():
+        seconds, result = timed(function, repeats)
+        results["io_" + key] = {
+            "seconds": seconds,
+            "checksum": None if result is None else checksum(result)
+        }
+        print("{} of {} rows in {:.3f} s".format(key, rows, seconds))
+
+    return results
+
+
+def bench_plots(copies, folder="Bench_Plots"):
+    """
+    Times the catalog build and the HR and mass-radius plots over copies of
+    a solved star of every core type
+    """
+    Path = os.path.join
+    os.makedirs(folder, exist_ok=True)
+    for core, (temperature, density) in SOLVE_STARS.items():
+        star = starprop.Star(cent_density=density,
+                             cent_temperature=temperature,
+                             core=core,
+                             engine="fused")
+        star.solve()
+        array = ms.star_profile(star)
+        template = data.array2D2txt(array, ["radius"] + ms.SAVE_VARIABLE,
+                                    "template", folder)
+        for index in range(copies):
+            shutil.copy(template,
+                        Path(folder, "Tc_{}_rhoc_guess{:.2e}_Core_{}_Type_MS.txt"
+                             .format(index, density, core)))
+        os.remove(template)
+
+    catalog = StarCatalog(folder)
+    results = {}
+    workloads = {
+        "catalog_build": lambda: catalog.refresh(processes=1),
+        "catalog_refresh": lambda: catalog.refresh(processes=1),
+        "plotmain": lambda: plot.plotmain(folder),
+        "plotmass_lum": lambda: plot.plotmass_lum(folder),
+        "plotmass_radius": lambda: plot.plotmass_radius(folder),
+    }
+    for key, function in workloads.items():
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            seconds, result = timed(function)
+        plt.close("all")
+        results["plot_" + key] = {"seconds": seconds}
+        print("{} of {} stars in {:.3f} s".format(key, 3 * copies, seconds))
+
+    results["plot_catalog_build"]["checksum"] = checksum(
+        np.array(catalog.select(["temperature", "luminosity", "radius",
+                                 "mass"])).T)
+    return results
+
+
+def git_commit():
+    """
+    Returns:
+        (str or None): Commit the working tree is on, if it is a git repo
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+
+def compare(previous, current):
+    """
+    Prints the speed of every workload against the previous run and flags
+    any checksum that changed
+    """
+    print()
+    print("Compared with", previous["commit"], previous["date"])
+    for key, result in current["results"].items():
+        if key not in previous["results"]:
+            continue
+        before = previous["results"][key]
+        line = "{:60} {:8.3f} s {:6.2f}x".format(
+            key, result["seconds"], before["seconds"] / result["seconds"])
+        if before.get("checksum") != result.get("checksum"):
+            line += "  RESULTS CHANGED"
+        print(line)
+
+
+def main(args):
+    results_path = os.path.abspath(args.results)
+    with open(args.starlist) as starlist:
+        lines = [line for line in starlist if "#" not in line]
+    lines = lines[:args.stars]
+
+    settings = {
+        "engine": args.engine,
+        "tableau": args.tableau,
+        "controller": args.controller,
+        "variable": args.variable,
+        "table_tolerance": args.table_tolerance,
+        "jit": args.jit and jit_step.JIT_AVAILABLE,
+        "method": args.method,
+        "stars": args.stars,
+        "rows": args.rows,
+        "copies": args.copies
+    }
+    results = {}
+
+    # Everything is written in a scratch folder so Star_Files is untouched
+    start = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            results.update(bench_solve(args.engine, args.tableau,
+                                       args.controller, args.variable,
+                                       args.table_tolerance, args.jit,
+                                       args.repeats))
+            results.update(bench_make_star(args.engine, args.tableau,
+                                           args.controller, args.variable,
+                                           args.table_tolerance, args.jit,
+                                           args.method, lines))
+            results.update(bench_io(args.rows, args.repeats))
+            results.update(bench_plots(args.copies))
+        finally:
+            os.chdir(start)
+
+    record = {
+        "commit": git_commit(),
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "machine": platform.node(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "settings": settings,
+        "results": results
+    }
+
+    previous = None
+    if os.path.exists(results_path):
+        with open(results_path) as results_file:
+            for line in results_file:
+                entry = json.loads(line)
+                if entry["settings"] == settings:
+                    previous = entry
+    if previous is not None:
+        compare(previous, record)
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(results_path), exist_ok=True)
+        with open(results_path, "a") as results_file:
+            results_file.write(json.dumps(record) + "\n")
+        print("Results added to", results_path)
+
+
+if __name__ == '__main__':
+    parser = arg.ArgumentParser(description="Benchmarks the star solver")
+    parser.add_argument('--engine',
+                        choices=['object', 'fused', 'batch', 'rosenbrock'],
+                        default='fused',
+                        help='Star engine used for the solve and make_star workloads')
+    parser.add_argument('--tableau',
+                        choices=['fehlberg', 'cash_karp', 'dopri5', 'dop853'],
+                        default='fehlberg',
+                        help='Runge-Kutta method used by the solve and make_star workloads')
+    parser.add_argument('--controller',
+                        choices=['elementary', 'pi'],
+                        default='elementary',
+                        help='Step size controller used by the solve and make_star workloads')
+    parser.add_argument('--variable',
+                        choices=['radius', 'log_radius'],
+                        default='radius',
+                        help='Independent variable used by the solve and make_star workloads')
+    parser.add_argument('--table-tolerance',
+                        type=float,
+                        default=None,
+                        help='Relative error of the physics tables used by the solve and make_star workloads, or direct physics if not given')
+    parser.add_argument('--jit',
+                        action='store_true',
+                        help='Compile the steps of the fused engine with Numba if it is installed')
+    parser.add_argument('--method',
+                        choices=['bisect', 'illinois', 'brent', 'ksection'],
+                        default='bisect',
+                        help='Root finder used by make_star')
+    parser.add_argument('--starlist',
+                        default='starlist.txt',
+                        help='Starlist the make_star workloads are taken from')
+    parser.add_argument('--stars',
+                        type=int,
+                        default=2,
+                        help='Number of starlist rows to run make_star on, 0 to skip')
+    parser.add_argument('--rows',
+                        type=int,
+                        default=100000,
+                        help='Rows of the synthetic profile used for the I/O workloads')
+    parser.add_argument('--copies',
+                        type=int,
+                        default=50,
+                        help='Copies of each core type star used for the plot workloads')
+    parser.add_argument('--repeats',
+                        type=int,
+                        default=1,
+                        help='Times each solve and I/O workload is run, the best time is kept')
+    parser.add_argument('--results',
+                        default='benchmarks/results.jsonl',
+                        help='JSON lines file the results are added to and compared with')
+    parser.add_argument('--no-save',
+                        action='store_true',
+                        help='Compare with earlier results without adding this run')
+    args = parser.parse_args()
+
+    main(args)
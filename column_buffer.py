@@ -0,0 +1,53 @@
+import numpy as np
+
+
+class ColumnBuffer:
+    """
+    Growable array that stores values column by column along its last
+    axis. Capacity doubles whenever it runs out so appending is amortized
+    O(1) instead of copying the whole history like np.append does.
+    """
+
+    def __init__(self, values=None, capacity=64):
+        """
+        Sets initial values
+
+        Args:
+            values (nd.array): Starting data, columns along the last axis,
+                or None to start empty
+            capacity (int): Number of columns to allocate up front
+        """
+        values = np.asarray([] if values is None else values, dtype=float)
+        self.size = values.shape[-1]
+        self.buffer = np.empty(values.shape[:-1] + (max(capacity, self.size), ))
+        self.buffer[..., :self.size] = values
+
+    def __len__(self):
+        return self.size
+
+    def append(self, column):
+        """
+        Adds a column to the end of the buffer, growing it if it is full
+
+        Args:
+            column (float or nd.array): Value(s) for the new column
+        """
+        if self.size == self.buffer.shape[-1]:
+            grown = np.empty(self.buffer.shape[:-1] + (max(1, 2 * self.size), ))
+            grown[..., :self.size] = self.buffer
+            self.buffer = grown
+
+        self.buffer[..., self.size] = column
+        self.size += 1
+
+    def truncate(self, size):
+        """
+        Drops every column from size onwards while keeping the capacity
+        """
+        self.size = min(self.size, max(size, 0))
+
+    def view(self):
+        """
+        Returns a view of the filled part of the buffer
+        """
+        return self.buffer[..., :self.size]
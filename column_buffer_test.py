@@ -0,0 +1,58 @@
+"""
+Checks ColumnBuffer grows and truncates like a plain list of columns
+"""
+import numpy as np
+import pytest
+from column_buffer import ColumnBuffer
+
+
+@pytest.mark.parametrize("capacity", [0, 1, 3, 64])
+def test_growth(capacity):
+    buffer = ColumnBuffer(capacity=capacity)
+    capacities = set()
+    for i in range(200):
+        buffer.append(i * 0.5)
+        capacities.add(buffer.buffer.shape[-1])
+
+    assert len(buffer) == 200
+    np.testing.assert_array_equal(buffer.view(), np.arange(200) * 0.5)
+
+    # Doubling keeps the number of copies logarithmic
+    assert len(capacities) <= 9
+    assert buffer.buffer.shape[-1] < 400
+
+
+def test_rows():
+    start = np.arange(6.0).reshape(2, 3)
+    buffer = ColumnBuffer(start, capacity=2)
+    assert len(buffer) == 3
+    np.testing.assert_array_equal(buffer.view(), start)
+
+    columns = [np.array([i, -i]) for i in range(10)]
+    for column in columns:
+        buffer.append(column)
+
+    expected = np.hstack([start, np.transpose(columns)])
+    np.testing.assert_array_equal(buffer.view(), expected)
+
+
+def test_values_copied():
+    start = np.ones(4)
+    buffer = ColumnBuffer(start)
+    start[0] = 5
+    assert buffer.view()[0] == 1
+
+
+def test_truncate():
+    buffer = ColumnBuffer(np.arange(10.0), capacity=10)
+    buffer.truncate(4)
+    assert len(buffer) == 4
+    assert buffer.buffer.shape[-1] == 10
+
+    buffer.truncate(20)
+    assert len(buffer) == 4
+    buffer.truncate(-1)
+    assert len(buffer) == 0
+
+    buffer.append(7)
+    np.testing.assert_array_equal(buffer.view(), [7])
@@ -1,5 +1,399 @@
 import numpy as np
 import math
+from column_buffer import ColumnBuffer
+
+# Runge-Kutta-Fehlberg coefficients. The fourth order solution is kept and
+# the fifth order one is used for the error.
+RKF45_C = np.array([0, 1 / 4, 3 / 8, 12 / 13, 1, 1 / 2])
+RKF45_A = np.array([
+    [0, 0, 0, 0, 0],
+    [1 / 4, 0, 0, 0, 0],
+    [3 / 32, 9 / 32, 0, 0, 0],
+    [1932 / 2197, -7200 / 2197, 7296 / 2197, 0, 0],
+    [439 / 216, -8, 3680 / 513, -845 / 4104, 0],
+    [-8 / 27, 2, -3544 / 2565, 1859 / 4104, -11 / 40],
+])
+RKF45_B5 = np.array([16 / 135, 0, 6656 / 12825, 28561 / 56430, -9 / 50, 2 / 55])
+RKF45_B4 = np.array([25 / 216, 0, 1408 / 2565, 2197 / 4104, -1 / 5, 0])
+
+# Cash-Karp coefficients, the fifth order solution is kept
+CASH_KARP_C = np.array([0, 1 / 5, 3 / 10, 3 / 5, 1, 7 / 8])
+CASH_KARP_A = np.array([
+    [0, 0, 0, 0, 0],
+    [1 / 5, 0, 0, 0, 0],
+    [3 / 40, 9 / 40, 0, 0, 0],
+    [3 / 10, -9 / 10, 6 / 5, 0, 0],
+    [-11 / 54, 5 / 2, -70 / 27, 35 / 27, 0],
+    [1631 / 55296, 175 / 512, 575 / 13824, 44275 / 110592, 253 / 4096],
+])
+CASH_KARP_B5 = np.array([37 / 378, 0, 250 / 621, 125 / 594, 0, 512 / 1771])
+CASH_KARP_B4 = np.array([
+    2825 / 27648, 0, 18575 / 48384, 13525 / 55296, 277 / 14336, 1 / 4
+])
+
+# Dormand-Prince 5(4) coefficients. The last stage is the derivative at the
+# end of the step, which the fourth order solution needs.
+DOPRI5_C = np.array([0, 1 / 5, 3 / 10, 4 / 5, 8 / 9, 1, 1])
+DOPRI5_B5 = np.array(
+    [35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84, 0])
+DOPRI5_A = np.array([
+    [0, 0, 0, 0, 0, 0],
+    [1 / 5, 0, 0, 0, 0, 0],
+    [3 / 40, 9 / 40, 0, 0, 0, 0],
+    [44 / 45, -56 / 15, 32 / 9, 0, 0, 0],
+    [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729, 0, 0],
+    [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656, 0],
+    DOPRI5_B5[:6],
+])
+DOPRI5_B4 = np.array([
+    5179 / 57600, 0, 7571 / 16695, 393 / 640, -92097 / 339200, 187 / 2100,
+    1 / 40
+])
+
+# Dormand-Prince 8(5,3) coefficients from Hairer's DOP853. E5 and E3 are
+# the differences of the eighth order solution from the fifth and third
+# order ones.
+DOP853_C = np.array([
+    0, 0.05260015195876773, 0.0789002279381516, 0.1183503419072274,
+    0.2816496580927726, 0.3333333333333333, 0.25, 0.3076923076923077,
+    0.6512820512820513, 0.6, 0.8571428571428571, 1.0])
+DOP853_A = np.zeros((12, 12))
+DOP853_A[1, [0]] = [
+    0.05260015195876773]
+DOP853_A[2, [0, 1]] = [
+    0.0197250569845379, 0.0591751709536137]
+DOP853_A[3, [0, 2]] = [
+    0.02958758547680685, 0.08876275643042054]
+DOP853_A[4, [0, 2, 3]] = [
+    0.2413651341592667, -0.8845494793282861, 0.924834003261792]
+DOP853_A[5, [0, 3, 4]] = [
+    0.037037037037037035, 0.17082860872947386, 0.12546768756682242]
+DOP853_A[6, [0, 3, 4, 5]] = [
+    0.037109375, 0.17025221101954405, 0.06021653898045596,
+    -0.017578125]
+DOP853_A[7, [0, 3, 4, 5, 6]] = [
+    0.03709200011850479, 0.17038392571223998, 0.10726203044637328,
+    -0.015319437748624402, 0.008273789163814023]
+DOP853_A[8, [0, 3, 4, 5, 6, 7]] = [
+    0.6241109587160757, -3.3608926294469414, -0.868219346841726,
+    27.59209969944671, 20.154067550477894, -43.48988418106996]
+DOP853_A[9, [0, 3, 4, 5, 6, 7, 8]] = [
+    0.47766253643826434, -2.4881146199716677, -0.590290826836843,
+    21.230051448181193, 15.279233632882423, -33.28821096898486,
+    -0.020331201708508627]
+DOP853_A[10, [0, 3, 4, 5, 6, 7, 8, 9]] = [
+    -0.9371424300859873, 5.186372428844064, 1.0914373489967295,
+    -8.149787010746927, -18.52006565999696, 22.739487099350505,
+    2.4936055526796523, -3.0467644718982196]
+DOP853_A[11, [0, 3, 4, 5, 6, 7, 8, 9, 10]] = [
+    2.273310147516538, -10.53449546673725, -2.0008720582248625,
+    -17.9589318631188, 27.94888452941996, -2.8589982771350235,
+    -8.87285693353063, 12.360567175794303, 0.6433927460157636]
+DOP853_B = np.array([
+    0.054293734116568765, 0, 0,
+    0, 0, 4.450312892752409,
+    1.8915178993145003, -5.801203960010585, 0.3111643669578199,
+    -0.1521609496625161, 0.20136540080403034, 0.04471061572777259])
+DOP853_E5 = np.array([
+    0.01312004499419488, 0, 0,
+    0, 0, -1.2251564463762044,
+    -0.4957589496572502, 1.6643771824549864, -0.35032884874997366,
+    0.3341791187130175, 0.08192320648511571, -0.022355307863886294])
+DOP853_E3 = np.array([
+    -0.18980075407240762, 0, 0,
+    0, 0, 4.450312892752409,
+    1.8915178993145003, -5.801203960010585, -0.4226823213237919,
+    -0.1521609496625161, 0.20136540080403034, 0.02265179219836082])
+
+
+# Limits of the PI step size controller. A step can grow by at most
+# PI_MAX_FACTOR and shrink by at most PI_MIN_FACTOR at a time.
+PI_SAFETY = 0.9
+PI_MIN_FACTOR = 0.2
+PI_MAX_FACTOR = 5
+
+
+def pi_step_factor(error, previous_error, accepted, after_rejection,
+                   error_order):
+    """
+    Factor to scale the step size by, from the proportional-integral
+    controller of Hairer and Wanner. The integral part is the error of the
+    last accepted step, which damps the accept/reject cycles of a purely
+    proportional controller. Works on single stars and arrays of them.
+
+    Args:
+        error (float or nd.array): Error norm of the step, 1 is on tolerance
+        previous_error (float or nd.array): Error norm of the last accepted
+            step
+        accepted (bool or nd.array): Whether the step was accepted
+        after_rejection (bool or nd.array): Whether the step before this one
+            was rejected. A step is not allowed to grow straight after one.
+        error_order (int): Order of the error estimate
+
+    Returns:
+        (float or nd.array): Factor to multiply the step size by
+    """
+    k = error_order + 1
+    error = np.maximum(error, 1e-10)
+    with np.errstate(divide="ignore", over="ignore"):
+        grow = PI_SAFETY * error**(-0.7 / k) * previous_error**(0.4 / k)
+        shrink = PI_SAFETY * error**(-1 / k)
+
+    max_factor = np.where(after_rejection, 1, PI_MAX_FACTOR)
+    return np.where(accepted, np.clip(grow, PI_MIN_FACTOR, max_factor),
+                    np.clip(shrink, PI_MIN_FACTOR, 1))
+
+
+# Fourth order Rosenbrock method with a third order error estimate, the
+# Kaps-Rentrop scheme with Shampine's parameters. Each row of A and C is the
+# weight of the earlier stages in a stage, X is where it is evaluated and
+# dfdx is weighted by GAMMA_X.
+ROS4_GAMMA = 1 / 2
+ROS4_A = np.array([[0, 0, 0], [2, 0, 0], [48 / 25, 6 / 25, 0]])
+ROS4_C = np.array([[0, 0, 0], [-8, 0, 0], [372 / 25, 12 / 5, 0],
+                   [-112 / 125, -54 / 125, -2 / 5]])
+ROS4_X = np.array([0, 1, 3 / 5])
+ROS4_GAMMA_X = np.array([1 / 2, -3 / 2, 121 / 50, 29 / 250])
+ROS4_B = np.array([19 / 9, 1 / 2, 25 / 108, 125 / 108])
+ROS4_E = np.array([17 / 54, 7 / 36, 0, 125 / 108])
+
+
+def numerical_jacobian(function, x, y, f=None):
+    """
+    Forward difference Jacobian of the system y' = function(x, y). Each
+    variable is stepped by a small fraction of its own size so variables
+    of very different scales are all resolved.
+
+    Args:
+        function (function x, y: nd.array): Derivatives of the system
+        x (float): Point to evaluate at
+        y (nd.array): State to evaluate at
+        f (nd.array): function(x, y), if it is already known
+
+    Returns:
+        (nd.array, nd.array): df/dy with one column per variable, and df/dx
+    """
+    if f is None:
+        f = function(x, y)
+    eps = np.sqrt(np.finfo(float).eps)
+
+    jacobian = np.empty((len(y), len(y)))
+    for index in range(len(y)):
+        shifted = np.array(y, dtype=float)
+        delta = eps * max(abs(shifted[index]), 1)
+        shifted[index] += delta
+        jacobian[:, index] = (function(x, shifted) - f) / delta
+
+    delta = eps * max(abs(x), 1)
+    dfdx = (function(x + delta, y) - f) / delta
+
+    return jacobian, dfdx
+
+
+def rosenbrock_step(function, x, y, step_size, jacobian, dfdx, f=None):
+    """
+    Takes one step of the fourth order Kaps-Rentrop Rosenbrock method.
+    Being linearly implicit it stays stable for stiff systems at step sizes
+    where an explicit Runge-Kutta step blows up. The fourth stage reuses the
+    derivatives of the third, so a step costs two calls of function.
+
+    Args:
+        function (function x, y: nd.array): Derivatives of the system
+        x (float): Start of the step
+        y (nd.array): State at the start of the step
+        step_size (float): Length of the step
+        jacobian, dfdx (nd.array): From numerical_jacobian at x, y
+        f (nd.array): function(x, y), if it is already known
+
+    Returns:
+        (nd.array, nd.array): Fourth order solution at the end of the step
+            and its error estimate
+    """
+    h = step_size
+    if f is None:
+        f = function(x, y)
+
+    # Rows are scaled by their variable so the solve stays well conditioned
+    # when the variables differ by tens of orders of magnitude
+    scale = np.maximum(np.abs(y), 1)
+    w = (np.eye(len(y)) / (ROS4_GAMMA * h) - jacobian) / scale[:, None]
+
+    stages = np.zeros((4, len(y)))
+    derivs = f
+    for stage in range(4):
+        if 0 < stage < 3:
+            derivs = function(x + ROS4_X[stage] * h,
+                              combine_stages(y, ROS4_A[stage], stages))
+        b = (derivs + h * ROS4_GAMMA_X[stage] * dfdx +
+             combine_stages(0, ROS4_C[stage], stages) / h)
+        stages[stage] = np.linalg.solve(w, b / scale)
+
+    return (combine_stages(y, ROS4_B, stages),
+            combine_stages(0, ROS4_E, stages))
+
+
+def combine_stages(y, coefficients, kutta):
+    """
+    Adds the weighted kutta constants onto y one stage at a time. The sum is
+    always taken in the same order so a single state and an array of states
+    give identical results.
+
+    Args:
+        y (nd.array): State the step started from
+        coefficients (nd.array): Weight of each kutta constant
+        kutta (nd.array): Kutta constants, one stage per row
+    """
+    result = y
+    for weight, k in zip(coefficients, kutta):
+        if weight:
+            result = result + weight * k
+
+    return result
+
+
+class ButcherTableau:
+    """
+    Coefficients of an explicit embedded Runge-Kutta method. Stage i is
+    evaluated at x + c[i] * step_size from y plus the kutta constants of
+    the earlier stages weighted by row i of a. The solution weighted by b
+    is kept and the one weighted by b_hat is used to estimate its error.
+    A method whose last stage is evaluated at that solution, at the end of
+    the step, is first same as last (fsal) and its last stage is the first
+    stage of the next step.
+    """
+
+    def __init__(self, name, c, a, b, b_hat, error_order, b_low=None):
+        """
+        Args:
+            name (str): Name of the method
+            c, a, b, b_hat (nd.array): Coefficients of the method
+            error_order (int): Order of the error estimate, the error
+                shrinks like step_size**(error_order + 1)
+            b_low (nd.array): Weights of a lower order solution. If given
+                the error is scaled down by it as in DOP853.
+        """
+        self.name = name
+        self.c = np.asarray(c, dtype=float)
+        self.a = np.asarray(a, dtype=float)
+        self.b = np.asarray(b, dtype=float)
+        self.b_hat = np.asarray(b_hat, dtype=float)
+        self.b_low = None if b_low is None else np.asarray(b_low, dtype=float)
+        self.error_order = error_order
+        self.stages = len(self.c)
+        last = self.a[-1]
+        self.fsal = bool(self.c[-1] == 1 and np.array_equal(
+            last, self.b[:len(last)]) and not self.b[len(last):].any())
+
+    def __repr__(self):
+        return "ButcherTableau({})".format(self.name)
+
+    def solution(self, y, kutta, tolerance=None):
+        """
+        Combines the kutta constants of a step into its solution
+
+        Args:
+            y (float or nd.array): Value at the start of the step
+            kutta (list or nd.array): Kutta constant of every stage
+            tolerance (tuple): Absolute and relative tolerance. If given the
+                error is measured against atol + rtol * |y_new| instead of
+                relative to the embedded solution.
+
+        Returns:
+            (float or nd.array, float or nd.array): Solution at the end of
+                the step and its error
+        """
+        y_new = combine_stages(y, self.b, kutta)
+        y_hat = combine_stages(y, self.b_hat, kutta)
+
+        if tolerance is None:
+            scale = y_hat
+        else:
+            atol, rtol = tolerance
+            scale = atol + rtol * np.abs(y_new)
+        error = np.abs((y_new - y_hat) / scale)
+
+        if self.b_low is not None:
+            low = np.abs((y_new - combine_stages(y, self.b_low, kutta)) / scale)
+            error = error * error / np.maximum(
+                np.sqrt(error * error + 0.01 * low * low),
+                np.finfo(float).tiny)
+
+        # A stage that went out of range gives nan, which must not pass as
+        # a small error
+        return y_new, np.nan_to_num(error, nan=np.inf, posinf=np.inf)
+
+    def step(self, function, x, y, step_size, tolerance=None,
+             first_stage=None):
+        """
+        Takes one step of y' = function(x, y)
+
+        Args:
+            function (function x, y: nd.array): Derivatives of the system
+            x (float or nd.array): Start of the step
+            y (nd.array): State at the start of the step, the variables may
+                have a further axis for many systems at once
+            step_size (float or nd.array): Length of the step
+            tolerance (tuple): Passed on to solution
+            first_stage (nd.array): function(x, y) if it is already known,
+                which saves the first call of function
+
+        Returns:
+            (nd.array, nd.array): Solution at the end of the step and the
+                error of every variable
+        """
+        kutta = np.zeros((self.stages, ) + np.shape(y))
+        start = 0
+        if first_stage is not None:
+            kutta[0] = step_size * first_stage
+            start = 1
+
+        for stage in range(start, self.stages):
+            kutta[stage] = step_size * function(
+                x + self.c[stage] * step_size,
+                combine_stages(y, self.a[stage], kutta))
+
+        return self.solution(y, kutta, tolerance)
+
+
+RKF45 = ButcherTableau("fehlberg", RKF45_C, RKF45_A, RKF45_B4, RKF45_B5, 4)
+CASH_KARP = ButcherTableau("cash_karp", CASH_KARP_C, CASH_KARP_A,
+                           CASH_KARP_B5, CASH_KARP_B4, 4)
+DOPRI5 = ButcherTableau("dopri5", DOPRI5_C, DOPRI5_A, DOPRI5_B5, DOPRI5_B4, 4)
+DOP853 = ButcherTableau("dop853", DOP853_C, DOP853_A, DOP853_B,
+                        DOP853_B - DOP853_E5, 7, DOP853_B - DOP853_E3)
+
+# Methods a Star can be made with, by name
+TABLEAUS = {
+    tableau.name: tableau
+    for tableau in [RKF45, CASH_KARP, DOPRI5, DOP853]
+}
+
+
+def hermite(x_start, x_end, start, end, x):
+    """
+    Cubic Hermite interpolation across steps from the value and derivative
+    at both ends of each step.
+
+    Args:
+        x_start, x_end (nd.array): Start and end of the step each point is in
+        start, end (nd.array): Value and derivative, shape (2, ...), at the
+            start and end of the step
+        x (nd.array): Points to evaluate at
+
+    Returns:
+        (nd.array): Value and derivative at x, shape (2, len(x))
+    """
+    h = x_end - x_start
+    t = (x - x_start) / h
+    t2 = t * t
+    t3 = t2 * t
+
+    value = ((2 * t3 - 3 * t2 + 1) * start[0] + (t3 - 2 * t2 + t) * h * start[1]
+             + (3 * t2 - 2 * t3) * end[0] + (t3 - t2) * h * end[1])
+    derivative = ((6 * t2 - 6 * t) * (start[0] - end[0]) / h +
+                  (3 * t2 - 4 * t + 1) * start[1] + (3 * t2 - 2 * t) * end[1])
+
+    return np.array([value, derivative])
 
 
 class DifferentialEquation:
@@ -31,10 +425,49 @@ class DifferentialEquation:
         """
         self.name = name
         self.boundaries = []
-        self.val = []
+        self.values = ColumnBuffer()
         self.de_relation = None
         self.step = []
         self.current = []
+        self.previous = []
+        self.accepted = []
+        self.store_steps = True
+
+    @property
+    def val(self):
+        """
+        View of every accepted step, one column per step
+        """
+        return self.values.view()
+
+    @val.setter
+    def val(self, val):
+        self.values = ColumnBuffer(val)
+
+    # Attributes get_state saves besides the stored values
+    state_attributes = ["current", "previous", "accepted", "step"]
+
+    def get_state(self):
+        """
+        Everything needed to carry on integrating from the last step,
+        used to checkpoint a Star
+
+        Returns:
+            (dict): Arrays keyed by attribute name
+        """
+        state = {"val": self.val}
+        for attribute in self.state_attributes:
+            state[attribute] = np.asarray(getattr(self, attribute),
+                                          dtype=float)
+        return state
+
+    def set_state(self, state):
+        """
+        Restores the values and attributes saved by get_state
+        """
+        self.val = state["val"]
+        for attribute in self.state_attributes:
+            setattr(self, attribute, np.array(state[attribute]))
 
     def set_boundaries(self, boundary_cond):
         """
@@ -47,6 +480,7 @@ class DifferentialEquation:
         self.boundaries = boundary_cond + [0]
         self.val = np.array(self.boundaries).reshape(-1, 1)
         self.current = self.boundaries
+        self.accepted = self.boundaries
 
     def set_derivative_relation(self, differential_equation):
         """
@@ -72,6 +506,7 @@ class DifferentialEquation:
 
         self.val = np.array(self.boundaries).reshape(-1, 1)
         self.current = self.boundaries
+        self.accepted = self.boundaries
 
     def solve_differential_step(self,
                                 x_val,
@@ -105,11 +540,34 @@ class DifferentialEquation:
 
     def add_differential_step(self):
         """
-        Adds the small step as a new set of value to the outvalues
+        Adds the small step as a new set of value to the outvalues. When
+        store_steps is off only the current value moves forward and the
+        outvalues are left to add_dense_steps.
         """
-        self.val = np.append(self.val, self.step.reshape(-1, 1), axis=1)
+        if self.store_steps:
+            self.values.append(self.step)
+        self.previous = self.accepted
+        self.accepted = self.step
         self.current = self.step
 
+    def dense_steps(self, x_start, x_end, x_points):
+        """
+        Interpolates the last step, from x_start to x_end, at x_points
+        using the values and derivatives at both ends of it
+
+        Returns:
+            (nd.array): Values, one column per point in x_points
+        """
+        return hermite(x_start, x_end, np.asarray(self.previous[:2]),
+                       np.asarray(self.accepted[:2]), np.asarray(x_points))
+
+    def add_dense_steps(self, steps):
+        """
+        Adds interpolated columns to the outvalues
+        """
+        for column in np.asarray(steps).T:
+            self.values.append(column)
+
     def now(self, order=None):
         """
         Get the value of the Differentiall equation right now
@@ -123,36 +581,55 @@ class DifferentialEquation:
 
     def data(self, order=None):
         """
-        Returns full rows of data
+        Returns a view of full rows of data
         """
 
         if order:
-            return np.copy(self.val[order, :])
+            return self.val[order, :]
         else:
-            return np.copy(self.val[0, :])
+            return self.val[0, :]
+
+    def data_at(self, x_grid, x_points, order=None):
+        """
+        Returns rows of data at any x by interpolating between the stored
+        steps. Points outside of x_grid are nan.
+
+        Args:
+            x_grid (nd.array): x value of every stored step
+            x_points (nd.array): x values to evaluate at
+            order (int): 0 for values and 1 for derivatives
+        """
+        x_grid = np.asarray(x_grid)
+        x_points = np.asarray(x_points, dtype=float)
+        step = np.clip(
+            np.searchsorted(x_grid, x_points, side="right") - 1, 0,
+            len(x_grid) - 2)
+
+        rows = hermite(x_grid[step], x_grid[step + 1], self.val[:2, step],
+                       self.val[:2, step + 1], x_points)
+        rows[:, (x_points < x_grid[0]) | (x_points > x_grid[-1])] = np.nan
+
+        if order:
+            return rows[order]
+        else:
+            return rows[0]
 
 
 class RungeKutta(DifferentialEquation):
-    def __init__(self, name="DE Solver"):
+    state_attributes = DifferentialEquation.state_attributes + [
+        "hold", "intermediate", "kutta", "error"
+    ]
+
+    def __init__(self, name="DE Solver", tableau=RKF45):
         """
-        Sets initial values
+        Sets initial values. tableau is the ButcherTableau of the embedded
+        Runge-Kutta method used for each step.
         """
-        self.kutta = [0, 0, 0, 0, 0, 0]
-
-        self.y_adj = [
-            lambda y, k: y, lambda y, k: y + k[0] / 4,
-            lambda y, k: y + k[0] * 3 / 32 + k[1] * 9 / 32,
-            lambda y, k: y + k[0] * 1932 / 2197 - k[1] * 7200 / 2197 + k[2] * 7296 / 2197,
-            lambda y, k: y + k[0] * 439 / 216 - k[1] * 8 + k[2] * 3680 / 513 - k[3] * 845 / 4104,
-            lambda y, k: y - k[0] * 8 / 27 + k[1] * 2 - k[2] * 3544 / 2565 + k[3] * 1859 / 4104 - k[4] * 11 / 40,
-            lambda y, k: y
-        ]
-        self.x_adj = [
-            lambda x, step: x, lambda x, step: x + step / 4,
-            lambda x, step: x + step * 3 / 8,
-            lambda x, step: x + step * 12 / 13, lambda x, step: x + step,
-            lambda x, step: x + step / 2
-        ]
+        self.tableau = tableau
+        self.kutta = [0] * tableau.stages
+        # Absolute and relative tolerance of the error, None for the error
+        # relative to the embedded solution
+        self.tolerance = None
 
         self.intermediate = []
         self.hold = []
@@ -161,16 +638,19 @@ class RungeKutta(DifferentialEquation):
         super().__init__(name)
 
     def solve_runge_kutta_const(self, x_val, step_size, state_vars,
-                                kutta_const):
+                                kutta_const, reuse_first=False):
         """
         Runge-kutta method provides a correction factor to a first order
-        PDE. A fourth order solution is used here. 
+        PDE. The stages of self.tableau are solved one at a time.
 
         Args:
             x_val (float): dependent variable at location of evaluation
             step_size (float): Small step forward being used for calculation
             state_vars (dict): Set of constants that can be used by de_relation
             kutta_const (int): Kutta constant is being solved for
+            reuse_first (bool): Whether the derivative held at the start of
+                the step is already de_relation there, as it is after
+                solve_de_value, so the first stage need not evaluate it
 
         Returns:
             (nd.array): Adjusted step after making runge-kutta correction
@@ -179,9 +659,12 @@ class RungeKutta(DifferentialEquation):
             self.hold = self.now()
             self.intermediate = np.copy(self.hold)
 
-        x_adj = self.x_adj[kutta_const](x_val, step_size)
+        x_adj = x_val + self.tableau.c[kutta_const] * step_size
 
-        result = self.de_relation(self.intermediate, x_adj, state_vars)
+        if kutta_const == 0 and reuse_first:
+            result = self.hold[1]
+        else:
+            result = self.de_relation(self.intermediate, x_adj, state_vars)
         if math.isnan(result):
             print(self.name)
             for item in state_vars:
@@ -190,7 +673,13 @@ class RungeKutta(DifferentialEquation):
 
         self.kutta[kutta_const] = step_size * self.intermediate[1]
 
-        self.intermediate[0] = max(self.y_adj[kutta_const + 1](self.hold[0], self.kutta), 0)
+        if kutta_const + 1 < self.tableau.stages:
+            self.intermediate[0] = max(
+                combine_stages(self.hold[0],
+                               self.tableau.a[kutta_const + 1], self.kutta),
+                0)
+        else:
+            self.intermediate[0] = max(self.hold[0], 0)
 
     def use_intermediate(self):
         """
@@ -206,26 +695,22 @@ class RungeKutta(DifferentialEquation):
         """
         self.current = np.copy(self.hold)
 
-    def solve_rk_step(self):
+    def use_step(self):
         """
-        Use the calculated runge-kutta constants to determine the 4th and 5th
-        order solutions as well as their error between the two.
+        Sets the current value to the solution of the step, so the
+        equations can be solved at the end of the step before it is added
         """
+        self.current = self.step
 
-        self.kutta_5th_sol = (
-            self.hold[0] + self.kutta[0] * 16 / 135 +
-            self.kutta[2] * 6656 / 12825 + self.kutta[3] * 28561 / 56430 -
-            self.kutta[4] * 9 / 50 + self.kutta[5] * 2 / 55)
-
-        self.kutta_4th_sol = (
-            self.hold[0] + self.kutta[0] * 25 / 216 +
-            self.kutta[2] * 1408 / 2565 + self.kutta[3] * 2197 / 4104 -
-            self.kutta[4] / 5 + self.kutta[5] * 0)
-
-        self.step = np.array([max(self.kutta_4th_sol, 0), 0])
+    def solve_rk_step(self):
+        """
+        Use the calculated runge-kutta constants to determine the solution
+        of the step and its error against the embedded solution.
+        """
 
-        self.error = abs(
-            (self.kutta_4th_sol - self.kutta_5th_sol) / self.kutta_5th_sol)
+        solution, self.error = self.tableau.solution(self.hold[0], self.kutta,
+                                                     self.tolerance)
+        self.step = np.array([max(solution, 0), 0])
 
     def solve_de_value(self, x_val, step_size, state_vars):
         """
@@ -0,0 +1,189 @@
+"""
+Checks the Butcher tableaus and step size control of desolver
+"""
+import numpy as np
+import pytest
+import desolver as de
+
+# Order of the kept solution, the error estimate and the low order solution
+ORDERS = {
+    "fehlberg": (4, 5, None),
+    "cash_karp": (5, 4, None),
+    "dopri5": (5, 4, None),
+    "dop853": (8, 5, 3),
+}
+
+
+def square_a(tableau):
+    a = np.zeros((tableau.stages, tableau.stages))
+    a[:, :tableau.a.shape[1]] = tableau.a
+    return a
+
+
+def order_errors(tableau, weights):
+    """
+    How far weights miss the quadrature conditions sum(b c**(q-1)) = 1/q
+    for q = 1 to 9 and the remaining conditions up to fourth order
+    """
+    c, a = tableau.c, square_a(tableau)
+    quadrature = [weights @ c**(q - 1) - 1 / q for q in range(1, 10)]
+    trees = [
+        weights @ a @ c - 1 / 6,
+        weights @ (c * (a @ c)) - 1 / 8,
+        weights @ a @ c**2 - 1 / 12,
+        weights @ a @ a @ c - 1 / 24,
+    ]
+    return np.abs(quadrature), np.abs(trees)
+
+
+def test_every_tableau_has_orders():
+    assert sorted(ORDERS) == sorted(de.TABLEAUS)
+
+
+@pytest.mark.parametrize("name", sorted(de.TABLEAUS))
+def test_stages_consistent(name):
+    tableau = de.TABLEAUS[name]
+    np.testing.assert_allclose(square_a(tableau).sum(axis=1), tableau.c,
+                               atol=1e-14)
+    assert not np.triu(square_a(tableau)).any()
+
+
+@pytest.mark.parametrize("name", sorted(de.TABLEAUS))
+def test_order_conditions(name):
+    tableau = de.TABLEAUS[name]
+    for weights, order in zip([tableau.b, tableau.b_hat, tableau.b_low],
+                              ORDERS[name]):
+        if order is None:
+            assert weights is None
+            continue
+
+        quadrature, trees = order_errors(tableau, weights)
+        assert quadrature[:order].max() < 1e-14
+        assert quadrature[order] > 1e-6
+        if order >= 4:
+            assert trees.max() < 1e-14
+
+
+@pytest.mark.parametrize("name", sorted(de.TABLEAUS))
+def test_local_error_order(name):
+    """
+    The error of one step of y' = y shrinks like step_size**(order + 1)
+    """
+    tableau = de.TABLEAUS[name]
+    order = ORDERS[name][0]
+    # Steps large enough for the error of dop853 to stay above round off
+    steps = np.array([1, 0.5]) * (0.5 if order > 5 else 0.1)
+    errors = [
+        abs(tableau.step(lambda x, y: y, 0, np.ones(1), step)[0][0] -
+            np.exp(step)) for step in steps
+    ]
+    assert np.log2(errors[0] / errors[1]) == pytest.approx(order + 1, abs=0.3)
+
+
+@pytest.mark.parametrize("name", sorted(de.TABLEAUS))
+def test_error_estimate(name):
+    tableau = de.TABLEAUS[name]
+    y, error = tableau.step(lambda x, y: y, 0, np.ones(1), 0.1,
+                            tolerance=(1e-12, 1e-12))
+    assert np.all(np.isfinite(error)) and error[0] > 0
+
+    y, error = tableau.step(lambda x, y: y * np.nan, 0, np.ones(1), 0.1)
+    assert error[0] == np.inf
+
+
+def test_pi_step_factor_limits():
+    assert de.pi_step_factor(0, 1, True, False, 4) == de.PI_MAX_FACTOR
+    assert de.pi_step_factor(1e10, 1, False, False, 4) == de.PI_MIN_FACTOR
+    assert de.pi_step_factor(1e10, 1, True, False, 4) == de.PI_MIN_FACTOR
+
+    # A rejected step never grows, nor does one straight after a rejection
+    assert de.pi_step_factor(1.01, 1, False, False, 4) < 1
+    assert de.pi_step_factor(1e-6, 1, True, True, 4) == 1
+
+
+def test_pi_step_factor_values():
+    k = 5
+    factor = de.pi_step_factor(0.5, 0.25, True, False, 4)
+    assert factor == pytest.approx(de.PI_SAFETY * 0.5**(-0.7 / k) *
+                                   0.25**(0.4 / k))
+
+    factor = de.pi_step_factor(2, 0.25, False, False, 4)
+    assert factor == pytest.approx(de.PI_SAFETY * 2**(-1 / k))
+
+
+def test_pi_step_factor_damped():
+    """
+    A growing error holds back the next step more than a steady one
+    """
+    steady = de.pi_step_factor(0.5, 0.5, True, False, 4)
+    growing = de.pi_step_factor(0.5, 0.01, True, False, 4)
+    assert growing < steady
+
+
+def test_pi_step_factor_arrays():
+    error = np.array([0, 0.5, 2, 1e10, np.inf])
+    previous = np.full(5, 0.5)
+    accepted = error <= 1
+    after_rejection = np.array([False, True, False, False, False])
+    factors = de.pi_step_factor(error, previous, accepted, after_rejection, 7)
+
+    expected = [
+        de.pi_step_factor(*args, 7)
+        for args in zip(error, previous, accepted, after_rejection)
+    ]
+    np.testing.assert_array_equal(factors, expected)
+    assert np.all((factors >= de.PI_MIN_FACTOR) &
+                  (factors <= de.PI_MAX_FACTOR))
+
+
+def test_fsal_detection():
+    fsal = {name: tableau.fsal for name, tableau in de.TABLEAUS.items()}
+    assert fsal == {
+        "fehlberg": False,
+        "cash_karp": False,
+        "dopri5": True,
+        "dop853": False
+    }
+
+    dopri5 = de.DOPRI5
+    a = dopri5.a.copy()
+    a[-1, 0] += 1e-3
+    changed = de.ButcherTableau("changed", dopri5.c, a, dopri5.b,
+                                dopri5.b_hat, 4)
+    assert not changed.fsal
+
+
+def oscillator(calls):
+    def function(x, y):
+        calls.append((x, y))
+        return np.array([y[1], -y[0] * (1 + x)])
+    return function
+
+
+@pytest.mark.parametrize("name", sorted(de.TABLEAUS))
+def test_last_stage_at_solution(name):
+    tableau = de.TABLEAUS[name]
+    calls = []
+    y_new, error = tableau.step(oscillator(calls), 0.5, np.array([1.0, 0.3]),
+                                0.1)
+
+    assert len(calls) == tableau.stages
+    x, y = calls[-1]
+    assert tableau.fsal == (x == 0.5 + 0.1 and np.array_equal(y, y_new))
+
+
+@pytest.mark.parametrize("name", sorted(de.TABLEAUS))
+def test_first_stage_reused(name):
+    tableau = de.TABLEAUS[name]
+    y = np.array([1.0, 0.3])
+    first = oscillator([])(0.5, y)
+
+    calls = []
+    fresh = tableau.step(oscillator(calls), 0.5, y, 0.1)
+    reused_calls = []
+    reused = tableau.step(oscillator(reused_calls), 0.5, y, 0.1,
+                          first_stage=first)
+
+    assert len(reused_calls) == len(calls) - 1
+    np.testing.assert_array_equal(reused[0], fresh[0])
+    np.testing.assert_array_equal(reused[1], fresh[1])
@@ -0,0 +1,239 @@
+"""
+Whole Runge-Kutta steps of the fused Star engine, written as scalar loops so
+Numba can compile them. A compiled step evaluates every stage, the
+structure equations and the error estimate without going back to Python.
+Numba is optional, without it JIT_AVAILABLE is False and stars made with
+jit=True use the fused engine instead.
+"""
+import math
+import numpy as np
+
+try:
+    import numba
+except ImportError:  # Optional, the fused engine is used without it
+    numba = None
+
+JIT_AVAILABLE = numba is not None
+
+# Core types by the number the compiled code knows them as
+CORES = {"Hydrogen": 0, "Helium": 1, "Carbon": 2}
+
+
+def jit(function):
+    """
+    Compiles function with Numba if it is installed
+    """
+    if numba is None:
+        return function
+    # Divide by zero to inf or nan like NumPy floats do in the uncompiled
+    # engine, instead of raising ZeroDivisionError
+    return numba.njit(cache=True, error_model="numpy")(function)
+
+
+@jit
+def structure(r, y, constants, core, derivs, eqs):
+    """
+    Same arithmetic as the kernel of make_structure_kernel for one star,
+    writing the derivatives and equations into derivs and eqs.
+
+    Args:
+        r (float): Radius
+        y (nd.array): DE values ordered as DE_ORDER, negative values are
+            taken as zero
+        constants (nd.array): physics_constants followed by
+            kernel_constants and G
+        core (int): Core type as numbered in CORES
+        derivs, eqs (nd.array): Filled with the derivatives ordered as
+            DE_ORDER and the equations ordered as EQ_ORDER
+    """
+    deg_p = constants[0]
+    deg_dp = constants[1]
+    gas = constants[2]
+    rad_p = constants[3]
+    rad_dp = constants[4]
+    ff = constants[5]
+    hm = constants[6]
+    pp = constants[7]
+    cno = constants[8]
+    he = constants[9]
+    cc = constants[10]
+    k_es = constants[11]
+    four_pi = constants[12]
+    rad_grad = constants[13]
+    conv_grad = constants[14]
+    G = constants[15]
+
+    clipped = np.maximum(y, 0.0)
+    T = clipped[1]
+    rho = clipped[2]
+    L = clipped[3]
+    M = clipped[4]
+
+    rho_3 = rho / 1e3
+    rho_5 = rho / 1e5
+    T_6 = T / 1e6
+
+    k_ff = ff * rho_3**0.7 * T**-3.5
+    k_h = hm * rho_3**0.5 * T**9.0
+
+    rho_23 = rho**(2 / 3)
+    pressure = deg_p * rho_23 * rho + gas * rho * T + rad_p * T**4.0
+    pressure_temp_grad = gas * rho + rad_dp * T**3.0
+    pressure_density_grad = deg_dp * rho_23 + gas * T
+
+    energy_pp = pp * rho_5 * T_6**4.0
+    energy_cno = cno * rho_5 * T_6**19.9
+    energy_He = he * rho_5**2.0 * (T / 1e8)**44.0
+    energy_C = cc * rho_5 * (T / 1e9)**30.0
+
+    k_bf = max(k_es, k_ff)
+    opacity = k_h * k_bf / (k_h + k_bf)
+    if core == 0:
+        energygen = energy_pp + energy_cno
+    elif core == 1:
+        energygen = energy_He
+    else:
+        energygen = energy_C
+
+    r2 = r * r
+    dT = -min(rad_grad * opacity * rho * L / (r2 * T**3.0),
+              conv_grad * T * M * rho / (pressure * r2))
+    derivs[0] = opacity * rho
+    derivs[1] = dT
+    derivs[2] = -(G * M * rho / r2 + pressure_temp_grad * dT) / pressure_density_grad
+    derivs[3] = four_pi * r2 * rho * energygen
+    derivs[4] = four_pi * r2 * rho
+
+    eqs[0] = k_es
+    eqs[1] = k_ff
+    eqs[2] = k_h
+    eqs[3] = opacity
+    eqs[4] = pressure
+    eqs[5] = pressure_temp_grad
+    eqs[6] = pressure_density_grad
+    eqs[7] = energy_pp
+    eqs[8] = energy_cno
+    eqs[9] = energy_He
+    eqs[10] = energy_C
+    eqs[11] = energygen
+
+
+@jit
+def combine(y, coefficients, kutta, out):
+    """
+    combine_stages of desolver written into out, summed in the same order
+    """
+    for i in range(len(y)):
+        result = y[i]
+        for stage in range(len(coefficients)):
+            if coefficients[stage] != 0:
+                result = result + coefficients[stage] * kutta[stage, i]
+        out[i] = result
+
+
+@jit
+def fused_step(x, y, h, first_stage, has_first, c, a, b, b_hat, b_low,
+               has_low, atol, rtol, has_tolerance, log_radius, constants,
+               core, derivs, eqs):
+    """
+    ButcherTableau.step with Star.state_derivs as the function, see
+    make_compiled_step for the arguments. derivs and eqs are left holding
+    the structure equations of the last stage.
+
+    Returns:
+        (nd.array, nd.array): State at the end of the step and the error of
+            every DE
+    """
+    stages = len(c)
+    n = len(y)
+    kutta = np.zeros((stages, n))
+    stage_y = np.empty(n)
+
+    start = 0
+    if has_first:
+        for i in range(n):
+            kutta[0, i] = h * first_stage[i]
+        start = 1
+
+    for stage in range(start, stages):
+        combine(y, a[stage], kutta, stage_y)
+        position = x + c[stage] * h
+        radius = np.exp(position) if log_radius else position
+        structure(radius, stage_y, constants, core, derivs, eqs)
+        for i in range(n):
+            if log_radius:
+                kutta[stage, i] = h * (radius * derivs[i])
+            else:
+                kutta[stage, i] = h * derivs[i]
+
+    y_new = np.empty(n)
+    y_hat = np.empty(n)
+    y_low = np.empty(n)
+    combine(y, b, kutta, y_new)
+    combine(y, b_hat, kutta, y_hat)
+    if has_low:
+        combine(y, b_low, kutta, y_low)
+
+    error = np.empty(n)
+    for i in range(n):
+        if has_tolerance:
+            scale = atol[i] + rtol * abs(y_new[i])
+        else:
+            scale = y_hat[i]
+        error_i = abs((y_new[i] - y_hat[i]) / scale)
+        if has_low:
+            low = abs((y_new[i] - y_low[i]) / scale)
+            error_i = error_i * error_i / max(
+                math.sqrt(error_i * error_i + 0.01 * low * low),
+                2.2250738585072014e-308)
+        # A stage that went out of range gives nan, which must not pass as
+        # a small error
+        if math.isnan(error_i):
+            error_i = math.inf
+        error[i] = error_i
+
+    return y_new, error
+
+
+def make_compiled_step(constants, core, tableau, tolerance=None,
+                       log_radius=False):
+    """
+    Builds a function taking one compiled step of the fused engine
+
+    Args:
+        constants (nd.array): physics_constants followed by
+            kernel_constants and G
+        core (str): One of "Hydrogen", "Helium", "Carbon"
+        tableau (desolver.ButcherTableau): Runge-Kutta method
+        tolerance (tuple): Absolute and relative tolerance of the pi
+            controller, or None to measure the error relative to the
+            embedded solution
+        log_radius (bool): Whether x is ln r rather than r
+
+    Returns:
+        (function x, y, h, first_stage: (y_new, error, end_kernel)):
+            first_stage may be None. end_kernel is the (derivs, eqs) of the
+            last stage, which is at y_new for a first same as last tableau.
+    """
+    constants = np.asarray(constants, dtype=float)
+    core = CORES[core]
+    has_low = tableau.b_low is not None
+    b_low = tableau.b_low if has_low else np.zeros_like(tableau.b)
+    has_tolerance = tolerance is not None
+    atol, rtol = tolerance if has_tolerance else (np.zeros(5), 0.0)
+    atol = np.broadcast_to(np.asarray(atol, dtype=float), (5, )).copy()
+
+    def step(x, y, h, first_stage):
+        derivs = np.empty(5)
+        eqs = np.empty(12)
+        has_first = first_stage is not None
+        if not has_first:
+            first_stage = derivs
+        y_new, error = fused_step(float(x), y, float(h), first_stage,
+                                  has_first, tableau.c, tableau.a, tableau.b,
+                                  tableau.b_hat, b_low, has_low, atol,
+                                  float(rtol), has_tolerance, log_radius,
+                                  constants, core, derivs, eqs)
+        return y_new, error, (derivs, eqs)
+
+    return step
@@ -0,0 +1,51 @@
+"""
+Checks the steps compiled by jit_step give the same stars as the
+uncompiled fused engine
+"""
+import contextlib
+import io
+import numpy as np
+import pytest
+import desolver as de
+import jit_step
+import stellar_properties as starprop
+
+COLUMNS = ["temperature", "density", "mass", "luminosity", "opticaldepth"]
+
+
+def solve(**kwargs):
+    """
+    Solves a fused Star without printing
+
+    Returns:
+        (Star): The solved star
+    """
+    star = starprop.Star(engine="fused", **kwargs)
+    with contextlib.redirect_stdout(io.StringIO()):
+        star.solve()
+    return star
+
+
+@pytest.mark.skipif(not jit_step.JIT_AVAILABLE, reason="Numba not installed")
+@pytest.mark.parametrize("tableau", sorted(de.TABLEAUS))
+@pytest.mark.parametrize("controller", ["elementary", "pi"])
+@pytest.mark.parametrize("core, cent_density, cent_temperature", [
+    ("Hydrogen", 162200, 1.5e7),
+    ("Helium", 2e10, 1e8),
+    ("Carbon", 1e10, 8e8),
+])
+def test_jit_matches_fused(tableau, controller, core, cent_density,
+                           cent_temperature):
+    stars = [
+        solve(core=core, cent_density=cent_density,
+              cent_temperature=cent_temperature, tableau=tableau,
+              controller=controller, jit=jit) for jit in [False, True]
+    ]
+
+    assert stars[0].success == stars[1].success
+    assert stars[0].points == stars[1].points
+    np.testing.assert_array_equal(stars[0].properties["radius"],
+                                  stars[1].properties["radius"])
+    for column in COLUMNS:
+        np.testing.assert_array_equal(stars[0].properties[column].data(0),
+                                      stars[1].properties[column].data(0))
@@ -1,46 +1,330 @@
 import argparse as arg
+import os
+import numpy as np
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from multiprocessing import Pool
 from make_star import make_star
+import jit_step
+import stellar_properties as starprop
+import Use_Data as data
+from work_queue import WorkQueue, Heartbeat, worker_name
 
-def unpack(line):
-    print(line)
+def star_name(line):
     line = line.replace("\n","").split(", ")
-    name = "Tc_{:.2e}_rhoc_guess{:.2e}_Core_{}_Type_{}".format(
+    return "Tc_{:.2e}_rhoc_guess{:.2e}_Core_{}_Type_{}".format(
             float(line[0]), float(line[1]), line[2], line[3])
 
+def unpack(line, engine="object", method="bisect", index=None, cache=None,
+           file_format="txt", catalog=False, checkpoint=None, profile=None,
+           tableau="fehlberg", controller="elementary", variable="radius",
+           table_tolerance=None, table_folder=None, jit=False,
+           output_radii=None, workers=1, written=None):
+    print(line)
+    name = star_name(line)
+    line = line.replace("\n","").split(", ")
+
     args = (float(line[0]), float(line[1]), line[2], name)
-    return make_star(*args)
+    return make_star(*args, engine=engine, method=method, index=index,
+                     cache=cache, file_format=file_format, catalog=catalog,
+                     checkpoint=checkpoint, profile=profile, tableau=tableau,
+                     controller=controller, variable=variable,
+                     table_tolerance=table_tolerance,
+                     table_folder=table_folder, jit=jit,
+                     output_radii=output_radii, workers=workers,
+                     written=written)
+
+def try_unpack(item, **options):
+    """
+    Runs unpack on one numbered starlist line and catches any failure so
+    one bad star does not stop the rest of the sweep
+
+    Returns:
+        (tuple): line number, rho_c or None, and the error or None
+    """
+    number, line = item
+    try:
+        return number, unpack(line, **options), None
+    except Exception:
+        return number, None, traceback.format_exc()
+
+def run_chunk(items, workers, **options):
+    """
+    Runs try_unpack on a few numbered starlist lines in one pool task,
+    giving each star workers processes for its trials
+    """
+    return [try_unpack(item, workers=workers, **options) for item in items]
+
+def run_parallel(file_lines, options, workers=None, chunksize=1, retries=1):
+    """
+    Makes the stars on a pool of workers, reporting each one as it finishes.
+    Stars that fail, or whose worker process dies, are tried again up to
+    retries more times.
+    While there are more stars left than idle workers every star gets one
+    worker. Once only a few stars are left the idle workers are shared
+    between them, so make_star can solve their trials at the same time
+    instead of the sweep waiting on the last stars' serial solves.
+
+    Args:
+        file_lines (list): Starlist lines
+        options (dict): Keyword arguments passed on to unpack
+        workers (int): Number of worker processes, all cores if None
+        chunksize (int): Number of stars handed to a worker at a time
+        retries (int): Number of extra attempts for a failed star
+
+    Returns:
+        (dict, dict): rho_c of the finished stars and the error of the
+            failed ones, both keyed by line number
+    """
+    workers = workers or os.cpu_count()
+    results = {}
+    failed = {}
+    pending = list(enumerate(file_lines))
+
+    for attempt in range(retries + 1):
+        if not pending:
+            break
+        if attempt:
+            print("Retrying {} failed stars, attempt {}".format(
+                len(pending), attempt + 1))
+
+        # Pool workers are daemonic and can't start make_star's own pool,
+        # these can. A crashed worker also breaks the executor instead of
+        # leaving the sweep waiting on its lost task forever.
+        executor = ProcessPoolExecutor(workers)
+        try:
+            running = {}
+            count = 0
+            waiting = list(pending)
+            while waiting or running:
+                idle = workers - sum(
+                    share for share, chunk in running.values())
+                while waiting and idle > 0:
+                    if len(waiting) >= idle:
+                        chunk, waiting = waiting[:chunksize], waiting[chunksize:]
+                        share = 1
+                    else:
+                        chunk, waiting = waiting[:1], waiting[1:]
+                        share = idle // len(waiting + chunk)
+                    future = executor.submit(run_chunk, chunk, share,
+                                             **options)
+                    running[future] = share, chunk
+                    idle -= share
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in finished:
+                    share, chunk = running.pop(future)
+                    try:
+                        outcomes = future.result()
+                    except Exception as error:
+                        # Every star of a chunk whose worker died is failed
+                        # so it is retried
+                        broken = broken or isinstance(error, BrokenProcessPool)
+                        outcomes = [(number, None, traceback.format_exc())
+                                    for number, line in chunk]
+                    for number, rho_c, error in outcomes:
+                        count += 1
+                        line = file_lines[number].strip()
+                        if error is None:
+                            results[number] = rho_c
+                            failed.pop(number, None)
+                            print("[{}/{}] Made star {}: rho_c = {}".format(
+                                count, len(pending), line, rho_c))
+                        else:
+                            failed[number] = error
+                            print("[{}/{}] Failed making star {}".format(
+                                count, len(pending), line))
+
+                # The other chunks on a broken executor fail as well, the
+                # stars still waiting go to a new one
+                if broken:
+                    print("A worker process died, starting new workers")
+                    executor.shutdown(wait=False)
+                    executor = ProcessPoolExecutor(workers)
+        finally:
+            executor.shutdown()
+
+        pending = [(number, file_lines[number]) for number in sorted(failed)]
+
+    return results, failed
+
+def queue_worker(path, options, lease_time=600, max_attempts=2):
+    """
+    Makes stars leased from the work queue at path until none are left
+
+    Args:
+        path (str): Location of the work queue
+        options (dict): Keyword arguments passed on to unpack
+        lease_time (float): Seconds a lease lasts without a heartbeat
+        max_attempts (int): Leases a star gets before it is failed
+
+    Returns:
+        (int): Number of stars this worker made
+    """
+    queue = WorkQueue(path, lease_time, max_attempts)
+    worker = worker_name()
+    made = 0
+
+    while True:
+        job = queue.lease(worker)
+        if job is None:
+            break
+
+        job_id, line = job
+        print("Leased star", job_id, line, "on", worker)
+        written = []
+        with Heartbeat(queue, job_id, worker):
+            job_id, rho_c, error = try_unpack(job, written=written, **options)
+
+        if error is None:
+            # The .star file if both formats were written
+            if queue.complete(job_id, worker, written[-1], rho_c):
+                made += 1
+            else:
+                print("Lost the lease of star", line, "before it was done")
+        else:
+            print("Failed making star", line)
+            print(error)
+            queue.fail(job_id, worker, error)
+
+    return made
+
+def run_queue(path, file_lines, options, workers=None, parallel=False,
+              lease_time=600, max_attempts=2):
+    """
+    Adds the starlist to the work queue at path and works on it until no
+    star is left. Any number of these can run at once on machines sharing
+    the queue file, and re-running picks up where an interrupted run
+    stopped.
+    """
+    queue = WorkQueue(path, lease_time, max_attempts)
+    print("Added {} new stars to the queue {}".format(queue.add(file_lines),
+                                                     path))
+
+    if parallel:
+        workers = workers or os.cpu_count()
+        with Pool(workers) as pool:
+            made = [pool.apply_async(queue_worker, (path, options, lease_time,
+                                                    max_attempts))
+                    for i in range(workers)]
+            made = sum(result.get() for result in made)
+    else:
+        # This process isn't a pool worker, so each star can use the
+        # workers for its trials
+        made = queue_worker(path, dict(options, workers=workers or 1),
+                            lease_time, max_attempts)
+
+    print("Made {} stars, queue is now {}".format(made, queue.counts()))
+
+def report_failures(file_lines, failed, path=None):
+    """
+    Prints the stars that failed with their errors and optionally writes
+    their starlist lines to path so they can be run again
+    """
+    if not failed:
+        print("All {} stars made".format(len(file_lines)))
+        return
+
+    print("Failed making {} of {} stars:".format(len(failed), len(file_lines)))
+    for number in sorted(failed):
+        print(file_lines[number].strip())
+        print(failed[number])
+
+    if path is not None:
+        with open(path, "w") as failed_file:
+            failed_file.writelines(file_lines[number] for number in sorted(failed))
+        print("Failed stars written to", path)
+
+def check_args(parser, args):
+    """
+    Stops with a usage error for options that don't work together, instead
+    of every star failing with the same ValueError
+    """
+    try:
+        starprop.check_options(args.engine, args.variable,
+                               args.table_tolerance, args.jit,
+                               args.output_radii)
+    except ValueError as error:
+        parser.error(str(error))
+
 
 def main(args):
-    pool = Pool()
     file = open(args.fileName, 'r')
     file_lines = file.readlines()
     file_lines = [file for file in file_lines if '#' not in file]
+    if args.jit and not jit_step.JIT_AVAILABLE:
+        print("Numba is not installed, using the uncompiled fused engine")
+    output_radii = None
+    if args.output_radii is not None:
+        start, stop, points = args.output_radii
+        output_radii = np.geomspace(start, stop, int(points)).tolist()
+    options = dict(engine=args.engine,
+                   method=args.method,
+                   index=args.index,
+                   cache=args.cache,
+                   file_format=args.format,
+                   catalog=args.catalog,
+                   checkpoint=args.checkpoint,
+                   profile=args.profile,
+                   tableau=args.tableau,
+                   controller=args.controller,
+                   variable=args.variable,
+                   table_tolerance=args.table_tolerance,
+                   table_folder=args.tables,
+                   jit=args.jit,
+                   output_radii=output_radii)
+    failed = {}
     last_rho_c = 0
+    if args.queue:
+        run_queue(args.queue, file_lines, options, args.workers, args.parallel,
+                  args.lease, args.retries + 1)
+        return
+
     if args.parallel:
         print("Running Parallel")
-        results = pool.map(unpack, file_lines)
+        results, failed = run_parallel(file_lines, options, args.workers,
+                                       args.chunksize, args.retries)
 
     else:
-        for line in file_lines:
+        # Write each star while the next one is being solved
+        writer = data.BackgroundWriter() if args.write_behind else None
+        names = {}
+        for number, line in enumerate(file_lines):
             line = line.replace("\n","").split(", ")
 
             print()
-            print(line)
-            if last_rho_c and args.adaptive:
-                name = "Tc_{:.2e}_rhoc_guess{:.2e}_Core_{}_Type_{}".format(
-                        float(line[0]), last_rho_c, line[2], line[3])
-            else:
-                name = "Tc_{:.2e}_rhoc_guess{:.2e}_Core_{}_Type_{}".format(
-                        float(line[0]), float(line[1]), line[2], line[3])
+            print("[{}/{}]".format(number + 1, len(file_lines)), line)
+            name = ", ".join(line)
+            for attempt in range(args.retries + 1):
+                try:
+                    if last_rho_c and args.adaptive:
+                        rho_c = last_rho_c
+                    else:
+                        rho_c = float(line[1])
+                    name = "Tc_{:.2e}_rhoc_guess{:.2e}_Core_{}_Type_{}".format(
+                            float(line[0]), rho_c, line[2], line[3])
+                    names[name] = number
 
-            try:
-                if last_rho_c and args.adaptive:
-                    last_rho_c = make_star(float(line[0]), last_rho_c, line[2], name)
-                else:
-                    last_rho_c = make_star(float(line[0]), float(line[1]), line[2], name)
-            except:
-                print("Failed making star %s"%(name))
+                    last_rho_c = make_star(float(line[0]), rho_c, line[2], name,
+                                           writer=writer,
+                                           workers=args.workers or 1,
+                                           **options)
+                    failed.pop(number, None)
+                    break
+                except Exception:
+                    failed[number] = traceback.format_exc()
+                    print("Failed making star %s"%(name))
+
+        # A star whose file could not be written is not made
+        if writer is not None:
+            writer.close()
+            for filename, error in writer.errors:
+                failed[names[filename]] = "Failed writing {}: {!r}".format(
+                    filename, error)
+
+    report_failures(file_lines, failed, args.failed)
 
 
 if __name__ == '__main__':
@@ -53,6 +337,87 @@ if __name__ == '__main__':
     parser.add_argument('--adaptive',
                         action='store_true',
                         help='Use the previous solutions rho_c as the guess for this one. May speed up if stars change linearly')
+    parser.add_argument('--engine',
+                        choices=['object', 'fused', 'batch', 'rosenbrock'],
+                        default='object',
+                        help='Star integration engine. fused evaluates all the structure equations in one array based kernel, batch also solves the starting trials of each star together, rosenbrock takes linearly implicit steps, which only costs more here since the steps of every engine are held at the step size cap rather than by stiffness')
+    parser.add_argument('--tableau',
+                        choices=['fehlberg', 'cash_karp', 'dopri5', 'dop853'],
+                        default='fehlberg',
+                        help='Embedded Runge-Kutta method of the object, fused and batch engines. dop853 takes far larger steps where the star is smooth')
+    parser.add_argument('--controller',
+                        choices=['elementary', 'pi'],
+                        default='elementary',
+                        help='Step size controller. pi sets each step from the error of this step and the last accepted one, and does not grow the step straight after a rejection')
+    parser.add_argument('--variable',
+                        choices=['radius', 'log_radius'],
+                        default='radius',
+                        help='Independent variable the fused, rosenbrock and batch engines step in. log_radius steps in ln r, so steps grow with the star instead of being capped in metres')
+    parser.add_argument('--table-tolerance',
+                        type=float,
+                        default=None,
+                        help='Interpolate the equation of state, opacity and energy generation of the fused, rosenbrock and batch engines from tables within this relative error, e.g. 1e-6. Slower than the direct physics, which are only a few powers, so it is not a performance option')
+    parser.add_argument('--tables',
+                        default=None,
+                        help='Folder to keep the physics tables in, so every worker and later run loads them instead of building them')
+    parser.add_argument('--output-radii',
+                        nargs=3,
+                        type=float,
+                        default=None,
+                        metavar=('START', 'STOP', 'POINTS'),
+                        help='Only store POINTS log spaced radii from START to STOP metres and the surface, so every star file has the same fixed resolution. Needs a Star engine, not batch')
+    parser.add_argument('--jit',
+                        action='store_true',
+                        help='Compile each step of the fused engine with Numba, needs --engine fused and no --table-tolerance. Falls back to the uncompiled fused engine, with the same results, if Numba is not installed')
+    parser.add_argument('--method',
+                        choices=['bisect', 'illinois', 'brent', 'ksection'],
+                        default='bisect',
+                        help='Root finder used to shoot for rho_c. illinois and brent work on log(rho_c), but Lum_error jumps at the root where trials hit the step cap, so brent and illinois take about as many solves as bisect. ksection tries k points of log(rho_c) each round, k being the number of processes the star gets (see --workers), or 3 in turn with one')
+    parser.add_argument('--index',
+                        default=None,
+                        help='Path of a solved star index (e.g. Star_Files/star_index.sqlite). Stars start from a bracket around solved neighbours and are added once converged')
+    parser.add_argument('--cache',
+                        default=None,
+                        help='Folder of cached results (e.g. Star_Files/cache). Stars already made with the same parameters are not solved again')
+    parser.add_argument('--format',
+                        choices=['txt', 'star', 'both'],
+                        default='txt',
+                        help='Star file format. star files are binary columns with a header of the star parameters and can be memory mapped')
+    parser.add_argument('--catalog',
+                        action='store_true',
+                        help='Add each saved star to the Star_Files catalog used by the HR and mass-radius plots')
+    parser.add_argument('--write-behind',
+                        action='store_true',
+                        help='Write each star file on a background thread while the next star is solved. Stars whose file fails to be written are reported as failed at the end')
+    parser.add_argument('--workers',
+                        type=int,
+                        default=None,
+                        help='Number of worker processes. With --parallel stars share all cores by default, and the last few stars of a sweep split the idle workers between their trials. Otherwise each star solves its trials on this many processes, one by default')
+    parser.add_argument('--chunksize',
+                        type=int,
+                        default=1,
+                        help='Number of stars handed to a worker at a time with --parallel')
+    parser.add_argument('--retries',
+                        type=int,
+                        default=1,
+                        help='Number of times a star that failed is tried again')
+    parser.add_argument('--failed',
+                        default=None,
+                        help='File to write the starlist lines of failed stars to, so they can be run again')
+    parser.add_argument('--queue',
+                        default=None,
+                        help='Path of a shared work queue (e.g. Star_Files/work_queue.sqlite). The starlist is added to it and stars are leased from it, so workers on several machines can share a sweep and resume it after an interruption')
+    parser.add_argument('--lease',
+                        type=float,
+                        default=600,
+                        help='Seconds a --queue star stays leased without a heartbeat from its worker')
+    parser.add_argument('--checkpoint',
+                        default=None,
+                        help='Folder to checkpoint stars in (e.g. Star_Files/checkpoints). Interrupted integrations and root searches carry on from their last checkpoint')
+    parser.add_argument('--profile',
+                        default=None,
+                        help='Folder to write a JSON profile of each star to (e.g. Star_Files/profiles): steps, right hand side evaluations, step sizes, time spent and peak memory of the make_star process (trial pool workers are not included)')
     args = parser.parse_args()
+    check_args(parser, args)
 
     main(args)
@@ -21,11 +21,264 @@ Takes in intial guesses for central temperature and pressure
 as well as the core type and uses them to create a star and save
 a text file.
 """
+import inspect
+import json
+from functools import partial
+from multiprocessing import Pool, current_process
+import os
+import time
 import stellar_properties as starprop
 import Use_Data as data
+import root_finding as rf
+from star_batch import StarBatch
+from star_index import StarIndex
+from result_cache import ResultCache, cache_key, SOLVER_VERSION
+from star_catalog import StarCatalog, summarize
+from profiler import merge, peak_memory
 
 
-def make_star(central_temperature, central_density, core_type, name):
+def solve_trials(central_densities, central_temperature, core_type, name,
+                 engine="object", X=0.70, Y=0.28, Z=0.02, Xc=0.004,
+                 checkpoint=None, profile=False, tableau="fehlberg",
+                 controller="elementary", variable="radius",
+                 table_tolerance=None, table_folder=None, jit=False,
+                 output_radii=None):
+    """
+    Solves one trial star for every central density given. With the batch
+    engine several trials are integrated together by a StarBatch, a lone
+    trial is faster on the fused Star engine. Otherwise one Star is solved
+    after the other with the chosen Star engine, checkpointing each one in
+    the checkpoint folder if it is given. With a table_tolerance every
+    trial shares the same physics tables, kept in table_folder if given.
+    jit compiles the steps of the fused Star engine if Numba is installed.
+    With output_radii the Stars only store those radii and their surface.
+
+    Returns:
+        (list): Solved stars in the same order as central_densities
+    """
+    # Stepping in ln r needs step sizes in ln r
+    steps = starprop.LOG_RADIUS_STEPS if variable == "log_radius" else {}
+
+    if engine == "batch" and len(central_densities) > 1:
+        batch = StarBatch(
+            [float(rho_c) for rho_c in central_densities],
+            float(central_temperature),
+            core_type,
+            X=X,
+            Y=Y,
+            Z=Z,
+            Xc=Xc,
+            name=name,
+            tableau=tableau,
+            controller=controller,
+            variable=variable,
+            table_tolerance=table_tolerance,
+            table_folder=table_folder,
+            **steps)
+        batch.solve()
+        return batch.stars
+
+    if engine == "batch":
+        engine = "fused"
+
+    stars = []
+    for rho_c in central_densities:
+        star_checkpoint = None
+        if checkpoint is not None:
+            star_checkpoint = "{}/{}_rhoc_{!r}.npz".format(
+                checkpoint, name, float(rho_c))
+
+        star = starprop.Star(
+            X=X,
+            Y=Y,
+            Z=Z,
+            Xc=Xc,
+            cent_density=float(rho_c),
+            cent_temperature=float(central_temperature),
+            core=core_type,
+            name=name,
+            engine=engine,
+            tableau=tableau,
+            controller=controller,
+            variable=variable,
+            table_tolerance=table_tolerance,
+            table_folder=table_folder,
+            jit=jit,
+            output_radii=output_radii,
+            checkpoint=star_checkpoint,
+            profile=profile,
+            **steps)
+        star.solve()
+        stars.append(star)
+
+    return stars
+
+
+SAVE_VARIABLE = [
+    'opticaldepth', 'temperature', 'density', 'luminosity', 'mass',
+    'opticaldepth_deriv', 'temperature_deriv', 'density_deriv',
+    'luminosity_deriv', 'mass_deriv', "k_es", "k_ff", "k_h", "opacity",
+    "pressure", "pressure_temp_grad", "pressure_density_grad", "energy_pp",
+    "energy_cno", "energy_He", "energy_C", "energygen"
+]
+
+
+def star_profile(star):
+    """
+    Gathers the columns make_star saves from a solved star
+
+    Returns:
+        (list): Radius followed by every SAVE_VARIABLE column
+    """
+    array2D = [[] for i in range(len(SAVE_VARIABLE) + 1)]
+    array2D[0] = star.properties['radius']
+
+    for index, variable in enumerate(SAVE_VARIABLE):
+        if "_deriv" in variable:
+            deriv = 1
+            variable = variable.replace("_deriv", "")
+        else:
+            deriv = 0
+        array2D[index + 1] = star.properties[variable].data(deriv)
+
+    return array2D
+
+
+def trial_result(star):
+    """
+    Keeps what make_star needs from a solved trial star
+
+    Returns:
+        (tuple): Luminosity error, saved columns, whether the star reached
+            its surface and its profile counters if it was profiled
+    """
+    profile = None
+    if star.profile is not None:
+        profile = dict(star.profile.as_dict(), rho_c=star.cent_density)
+    return Lum_error(star), star_profile(star), star.success, profile
+
+
+def solve_trial(args, central_density):
+    """
+    Solves a single trial star in a worker process. Stars can't be pickled
+    so only their trial_result is sent back.
+
+    Args:
+        args (tuple): Arguments of solve_trials after the central densities
+        central_density (float): Central density of the trial
+    """
+    star, = solve_trials([central_density], *args)
+    return trial_result(star)
+
+
+def resume_bracket(points, to_x):
+    """
+    Rebuilds the narrowest bracket around the root from the points an
+    interrupted search tried
+
+    Args:
+        points (list): (rho_c, error) of every solved trial
+        to_x (function rho_c: x): Variable the search works on
+
+    Returns:
+        (tuple or None): guess, low and high as (x, error) pairs, or None if
+            no two points bracket the root
+    """
+    brackets = [(low, high) for low, high in zip(sorted(points),
+                                                 sorted(points)[1:])
+                if np.sign(low[1]) != np.sign(high[1])]
+    if not brackets:
+        return None
+
+    low, high = min(brackets, key=lambda pair: pair[1][0] - pair[0][0])
+    low, high = (to_x(low[0]), low[1]), (to_x(high[0]), high[1])
+    return min(low, high, key=lambda point: abs(point[1])), low, high
+
+
+def write_star(array2D, header, filename, folder="Star_Files",
+               save=data.array2D2txt, catalog=False, **kwargs):
+    """
+    Saves a profile with save and adds the file it was written to, which
+    array2D2txt numbers if the name is taken, to the catalog. Takes the
+    arguments of array2D2txt, so it can also run on a BackgroundWriter.
+
+    Returns:
+        (str): Path of the file written
+    """
+    filepath = save(array2D, header, filename, folder, **kwargs)
+    # Summarize the star for the plots without reading the file back
+    if catalog:
+        StarCatalog(folder).add_profile(os.path.basename(filepath), array2D,
+                                        header)
+    return filepath
+
+
+def catalog_file(filepath, catalog=True):
+    """
+    Adds a star file that is already saved to the catalog, read from the
+    file itself with its modification time so refresh can tell if it
+    changes
+    """
+    if catalog:
+        folder, file = os.path.split(filepath)
+        StarCatalog(folder).add(file, summarize(filepath),
+                                os.stat(filepath).st_mtime)
+
+
+def make_star(central_temperature, central_density, core_type, name,
+              engine="object", method="bisect", index=None, X=0.70, Y=0.28,
+              Z=0.02, Xc=0.004, cache=None, writer=None, file_format="txt",
+              catalog=False, workers=1, checkpoint=None, profile=None,
+              tableau="fehlberg", controller="elementary", variable="radius",
+              table_tolerance=None, table_folder=None, jit=False,
+              output_radii=None, written=None):
+    """
+    Shoots for the central density of a star and saves its profile. The
+    paths of the files saved are appended to the written list if one is
+    given, unless they are handed to a background writer.
+
+    Returns:
+        (float): Central density found
+    """
+    starprop.check_options(engine, variable, table_tolerance, jit,
+                           output_radii)
+
+    start_time = time.perf_counter()
+    times = {"solve": 0.0, "io": 0.0}
+    solves = [0]
+
+    # Hand the finished profile to the background writer if there is one
+    if writer is None:
+        write_file = write_star
+    else:
+        write_file = partial(writer.submit, write=write_star)
+
+    def write(array2D, header, metadata, missing_only=False):
+        # file_format is "txt", "star" or "both", the catalog describes the
+        # .star file if there is one
+        txt_file = data.txt_path(name)
+        star_file = data.txt_path(name, extension=".star")
+        paths = []
+        if file_format != "star":
+            if missing_only and os.path.exists(txt_file):
+                catalog_file(txt_file, catalog and file_format == "txt")
+                paths.append(txt_file)
+            else:
+                paths.append(write_file(
+                    array2D, header, name,
+                    catalog=catalog and file_format == "txt"))
+        if file_format != "txt":
+            if missing_only and os.path.exists(star_file):
+                catalog_file(star_file, catalog)
+                paths.append(star_file)
+            else:
+                paths.append(write_file(array2D, header, name,
+                                        save=data.array2D2bin,
+                                        catalog=catalog, metadata=metadata))
+
+        # The background writer only knows the path once it has written
+        if written is not None and writer is None:
+            written.extend(paths)
 
     rho_c = central_density
     rho_c_low =  300
@@ -37,92 +290,233 @@ def make_star(central_temperature, central_density, core_type, name):
         rho_c_high = 90000000000
     tolerance = 0.0001
     rho_tolerance = 0.000001
-    i = 1
-    error =10000
 
-    star = starprop.Star(
-       cent_density=float(rho_c),
+    # Everything asked for, the cache key of the star. A warm start only
+    # moves the result within rho_tolerance, so it is left out of the key
+    # and a star found in the index is still found in the cache.
+    parameters = {
+        key: value.default
+        for key, value in inspect.signature(
+            starprop.Star.__init__).parameters.items()
+        if key not in ["self", "name", "table_folder"]
+    }
+    parameters.update(
+        X=X,
+        Y=Y,
+        Z=Z,
+        Xc=Xc,
         cent_temperature=float(central_temperature),
+        cent_density=float(rho_c),
         core=core_type,
-        name=name)
+        engine=engine,
+        tableau=tableau,
+        controller=controller,
+        variable=variable,
+        table_tolerance=table_tolerance,
+        jit=jit,
+        output_radii=None if output_radii is None else [
+            float(radius) for radius in output_radii],
+        method=method,
+        tolerance=tolerance,
+        rho_tolerance=rho_tolerance,
+        rho_c_low=rho_c_low,
+        rho_c_high=rho_c_high)
 
-    star_low = starprop.Star(
-        cent_density=float(rho_c_low),
-        cent_temperature=float(central_temperature),
-        core=core_type,
-        name=name)
+    # Number of points tried at once by k-section
+    k = workers if workers > 1 else 3
+    if method == "ksection":
+        parameters.update(k=k)
 
-    star_high = starprop.Star(
-        cent_density=float(rho_c_high),
-        cent_temperature=float(central_temperature),
-        core=core_type,
-        name=name)
+    # Reuse the saved profile if this exact star was already made
+    if cache is not None:
+        cache = ResultCache(cache)
+        key = cache_key(parameters)
 
-    good_solve = star.solve()
-    good_solve1 = star_low.solve()
-    good_solve2 = star_high.solve()
+        hit = cache.load(key)
+        if hit is not None:
+            array2D, header, rho_c = hit
+            print("Cached star:", name)
+            write(array2D, header, {
+                "parameters": parameters,
+                "rho_c": rho_c,
+                "solver_version": SOLVER_VERSION
+            }, missing_only=True)
+            return rho_c
 
-    low_err = Lum_error(star_low)
-    reg_err = Lum_error(star)
-    high_err = Lum_error(star_high)
+    # Start from a tight bracket around already solved neighbours if we can
+    if index is not None:
+        index = StarIndex(index)
+        warm_start = index.bracket(central_temperature, core_type, X, Y, Z,
+                                   Xc)
+        if warm_start is not None:
+            rho_c, rho_c_low, rho_c_high = warm_start
+            print("Warm start: ", rho_c_low, rho_c, rho_c_high)
 
-    while abs(error) > tolerance:
+            # The binary star files record the bracket actually searched
+            parameters = dict(parameters, cent_density=float(rho_c),
+                              rho_c_low=rho_c_low, rho_c_high=rho_c_high)
 
-        print("Low: ", rho_c_low, low_err)
-        print("Med: ", rho_c, reg_err)
-        print("Hig: ", rho_c_high, high_err)
-        error = reg_err
+    # Bisection works on rho_c directly, the other methods on log(rho_c)
+    if method == "bisect":
+        to_x, to_rho = float, float
+    else:
+        to_x, to_rho = np.log, np.exp
 
-        if np.abs(reg_err) < tolerance or abs(rho_c_high-rho_c_low) < rho_tolerance:
-            print(reg_err<tolerance, abs(rho_c_high-rho_c_low) < rho_tolerance)
-            break
+    # Only the error of every trial is kept, the profiles just for the best
+    # trial and the last trials solved, one of which the search returns
+    trials = {}
+    profiles = {}
+    args = (central_temperature, core_type, name, engine, X, Y, Z, Xc,
+            checkpoint, profile is not None, tableau, controller, variable,
+            table_tolerance, table_folder, jit, output_radii)
 
-        if np.sign(reg_err) == np.sign(low_err):
-            rho_c_low = rho_c
-            low_err = reg_err
+    # Every solved trial is saved so an interrupted search can carry on
+    points = []
+    if checkpoint is not None:
+        os.makedirs(checkpoint, exist_ok=True)
+        bracket_path = "{}/{}_bracket.json".format(checkpoint, name)
+        # A solved trial doesn't depend on where the search started, so a
+        # search resumes even if the index gives another warm start now
+        bracket_key = json.dumps(
+            {key: value for key, value in parameters.items()
+             if key not in ["cent_density", "rho_c_low", "rho_c_high"]},
+            sort_keys=True, default=str)
+        if os.path.exists(bracket_path):
+            with open(bracket_path) as bracket_file:
+                saved = json.load(bracket_file)
+            if saved["parameters"] == bracket_key:
+                points = saved["points"]
 
+    # Solve trials on a pool of workers, unless this already is a worker
+    pool = None
+    if workers > 1 and not current_process().daemon:
+        pool = Pool(workers)
+
+    def lum_errors(xs):
+        start = time.perf_counter()
+        densities = [to_rho(x) for x in xs]
+        if pool is None:
+            results = [trial_result(star) for star in
+                       solve_trials(densities, *args)]
         else:
-            rho_c_high = rho_c
-            high_err = reg_err
+            results = pool.map(partial(solve_trial, args), densities)
 
-        if i > 60:
-            print("Outside of tolerance")
-            break
+        latest = {}
+        for x, (error, array2D, success, trial_profile) in zip(xs, results):
+            trials[x] = error, success, trial_profile
+            latest[x] = array2D
+            points.append((float(to_rho(x)), float(error)))
+            print("Try: ", to_rho(x), error)
 
-        rho_c = (rho_c_high+rho_c_low)/2
-        star = starprop.Star(
-           cent_density=float(rho_c),
-            cent_temperature=float(central_temperature),
-            core=core_type,
-            name=name)
-        good_solve = star.solve()
-        reg_err = Lum_error(star)
+        best = min(trials, key=lambda x: abs(trials[x][0]))
+        if best not in latest:
+            latest[best] = profiles[best]
+        profiles.clear()
+        profiles.update(latest)
 
-        i += 1
+        if checkpoint is not None:
+            with open(bracket_path + ".tmp", "w") as bracket_file:
+                json.dump({"parameters": bracket_key, "points": points},
+                          bracket_file)
+            os.replace(bracket_path + ".tmp", bracket_path)
 
+        times["solve"] += time.perf_counter() - start
+        solves[0] += len(xs)
+        return [result[0] for result in results]
 
-    save_variable = [
-        'opticaldepth', 'temperature', 'density', 'luminosity', 'mass',
-        'opticaldepth_deriv', 'temperature_deriv', 'density_deriv',
-        'luminosity_deriv', 'mass_deriv', "k_es", "k_ff", "k_h", "opacity",
-        "pressure", "pressure_temp_grad", "pressure_density_grad", "energy_pp",
-        "energy_cno", "energy_He", "energy_C", "energygen"
-    ]
+    def lum_error(x):
+        return lum_errors([x])[0]
 
-    print("Saving star:", name)
-    deriv = 0
-    array2D = [[] for i in range(len(save_variable) + 1)]
-    array2D[0] = star.properties['radius']
+    def converged(low, high, guess):
+        return (abs(guess[1]) < tolerance or
+                abs(to_rho(high[0]) - to_rho(low[0])) < rho_tolerance)
+
+    try:
+        bracket = resume_bracket(points, to_x)
+        if bracket is not None:
+            guess, low, high = bracket
+            print("Resuming search: ", to_rho(low[0]), to_rho(high[0]),
+                  "after", len(points), "solves")
 
-    for index, variable in enumerate(save_variable):
-        if "_deriv" in variable:
-            derive = 1
-            variable = variable.replace("_deriv", "")
         else:
-            deriv = 0
-        array2D[index + 1] = star.properties[variable].data(deriv)
+            x_start = [to_x(rho_c), to_x(rho_c_low), to_x(rho_c_high)]
+            guess, low, high = zip(x_start, lum_errors(x_start))
+
+            print("Low: ", rho_c_low, low[1])
+            print("Med: ", rho_c, guess[1])
+            print("Hig: ", rho_c_high, high[1])
+
+            # Plain bisection keeps its original bracket so existing runs
+            # solve the same trials
+            if method != "bisect":
+                low, high = rf.expand_bracket(
+                    lum_error, low, high,
+                    lambda x, direction: to_x(to_rho(x) * 10.0**direction))
 
+        bracket_solves = solves[0]
+        options = {}
+        if method == "ksection":
+            options = {"func_many": lum_errors, "k": k}
+        x, error = rf.ROOT_FINDERS[method](lum_error, guess, low, high,
+                                           converged, **options)
+
+        # A point from before the search was resumed, or whose profile was
+        # dropped, has to be solved again
+        if x not in profiles:
+            lum_error(x)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    error, success = trials[x][:2]
+    array2D = profiles[x]
+    rho_c = to_rho(x)
+    print("Solved: ", rho_c, error, "after", len(trials), "solves")
+
+    if checkpoint is not None and os.path.exists(bracket_path):
+        os.remove(bracket_path)
+
+    if index is not None:
+        index.add(central_temperature, core_type, rho_c, error, success,
+                  name, X, Y, Z, Xc)
+
+    print("Saving star:", name)
     print("Writing star:", name)
-    data.array2D2txt(array2D, ["radius"] + save_variable, name)
+    start = time.perf_counter()
+    write(array2D, ["radius"] + SAVE_VARIABLE, {
+        "parameters": parameters,
+        "rho_c": rho_c,
+        "lum_error": float(error),
+        "success": bool(success),
+        "solves": len(trials),
+        "solver_version": SOLVER_VERSION
+    })
+
+    if cache is not None:
+        cache.store(key, array2D, ["radius"] + SAVE_VARIABLE, rho_c)
+    times["io"] += time.perf_counter() - start
+
+    # Report where the time of this star went
+    if profile is not None:
+        trial_profiles = [trial[2] for trial in trials.values()]
+        times["total"] = time.perf_counter() - start_time
+        report = {
+            "name": name,
+            "parameters": parameters,
+            "rho_c": rho_c,
+            "success": bool(success),
+            "solves": solves[0],
+            "bracket_solves": bracket_solves,
+            "root_iterations": solves[0] - bracket_solves,
+            "times": times,
+            "peak_memory_mb": peak_memory(),
+            "peak_memory_scope": "make_star process only" if pool is None
+            else "make_star process only, trial pool workers not included",
+            "totals": merge(trial_profiles),
+            "trials": trial_profiles
+        }
+        os.makedirs(profile, exist_ok=True)
+        with open("{}/{}.json".format(profile, name), "w") as profile_file:
+            json.dump(report, profile_file, indent=1, default=str)
 
     return rho_c
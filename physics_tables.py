@@ -0,0 +1,322 @@
+"""
+Lookup tables of the equation of state, opacity and energy generation of
+one composition. Every quantity is tabulated as log10 over a regular grid of
+(log10 rho, log10 T), refined until interpolating it is within a relative
+error bound. Tables are cached on disk and memory mapped, so the trial
+stars of make_star and the workers of a pool all share one copy.
+Interpolating costs more than the analytic physics of stellar_properties,
+so the tables are for physics that are costlier to evaluate, not a speedup.
+"""
+import hashlib
+import json
+import math
+import os
+import numpy as np
+from pathlib import Path
+
+# Bump whenever the tabulated physics or the layout of the tables changes
+TABLE_VERSION = "1"
+
+# Quantities a physics function returns, in order
+QUANTITIES = [
+    "k_ff", "k_h", "pressure", "pressure_temp_grad", "pressure_density_grad",
+    "energy_pp", "energy_cno", "energy_He", "energy_C"
+]
+
+# Grid covered by the tables as (start, stop) of log10 rho and log10 T. States
+# outside of it are evaluated directly.
+LOG_RHO_RANGE = (-8, 12)
+LOG_T_RANGE = (3, 10)
+
+# Finest grid tried when refining towards the error bound, points per decade
+MAX_PER_DECADE = 64
+
+# Step used for the derivatives of the bicubic tables, in decades
+DERIVATIVE_STEP = 1e-4
+
+# Tables this process already has, keyed by their cache key
+_loaded = {}
+
+
+def hermite_basis(t):
+    """
+    Cubic Hermite basis functions on [0, 1], for the values and the slopes
+    at both ends
+    """
+    t2 = t * t
+    t3 = t2 * t
+    return ((2 * t3 - 3 * t2 + 1, -2 * t3 + 3 * t2),
+            (t3 - 2 * t2 + t, t3 - t2))
+
+
+class PhysicsTables:
+    """
+    Interpolates the quantities of a physics function from tables of their
+    log10. Bicubic tables (order 3) hold the values with their derivatives
+    in log10 rho, log10 T and both, bilinear ones (order 1) only the values.
+    Calling the tables works like calling the physics function, on single
+    states or arrays of them.
+    """
+
+    def __init__(self, physics, tables, axes, order=3):
+        """
+        Args:
+            physics (function rho, T: tuple): Direct evaluation, used for
+                states outside of the tables
+            tables (nd.array): log10 of every quantity, shaped (quantities,
+                1 or 4, rho points, T points)
+            axes (list): (start, step, points) of log10 rho and log10 T
+            order (int): 1 for bilinear and 3 for bicubic interpolation
+        """
+        self.physics = physics
+        # A plain array over the same memory, indexing a memmap goes through
+        # its Python hooks on every lookup
+        self.tables = np.asarray(tables)
+        self.axes = [(float(start), float(step), int(points))
+                     for start, step, points in axes]
+        self.order = order
+        # Quantities that are zero everywhere, like carbon burning without
+        # any carbon, have no log10 to tabulate
+        self.zero = ~np.isfinite(tables[:, 0, 0, 0])
+
+    def __call__(self, rho, T):
+        if np.ndim(rho) == 0 and np.ndim(T) == 0:
+            return self.single(rho, T)
+
+        rho = np.asarray(rho, dtype=float)
+        T = np.asarray(T, dtype=float)
+        shape = np.broadcast(rho, T).shape
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cells = []
+            inside = np.ones(shape, dtype=bool)
+            for value, (start, step, points) in zip(
+                    (np.log10(rho), np.log10(T)), self.axes):
+                position = (value - start) / step
+                index = np.floor(position)
+                inside &= (index >= 0) & (index < points - 1)
+                index = np.where(inside, index, 0).astype(int)
+                cells.append((index, position - index, step))
+            (i, u, du), (j, v, dv) = cells
+            i, j = np.broadcast_to(i, shape), np.broadcast_to(j, shape)
+
+        if self.order == 1:
+            f = self.tables[:, 0]
+            log_values = ((1 - u) * (1 - v) * f[:, i, j] +
+                          u * (1 - v) * f[:, i + 1, j] +
+                          (1 - u) * v * f[:, i, j + 1] +
+                          u * v * f[:, i + 1, j + 1])
+        else:
+            (u0, u1), (su0, su1) = hermite_basis(u)
+            (v0, v1), (sv0, sv1) = hermite_basis(v)
+            log_values = 0
+            for di, (wu, su) in enumerate([(u0, su0), (u1, su1)]):
+                for dj, (wv, sv) in enumerate([(v0, sv0), (v1, sv1)]):
+                    f, f_rho, f_T, f_both = np.moveaxis(
+                        self.tables[:, :, i + di, j + dj], 1, 0)
+                    log_values = log_values + (
+                        wu * wv * f + su * du * wv * f_rho +
+                        wu * sv * dv * f_T + su * du * sv * dv * f_both)
+
+        with np.errstate(invalid="ignore"):
+            values = 10.0**log_values
+        values[self.zero] = 0
+
+        if not inside.all():
+            direct = np.array(np.broadcast_arrays(*self.physics(rho, T)))
+            values = np.where(inside, values, direct)
+
+        return tuple(values)
+
+    def single(self, rho, T):
+        """
+        Same as calling the tables, for a single state. Skips the array
+        bookkeeping since the fused Star engine asks for one state at a time.
+        """
+        (rho_start, rho_step, rho_points), (T_start, T_step,
+                                            T_points) = self.axes
+        if not (rho > 0 and T > 0):
+            return self.physics(rho, T)
+        u = (math.log10(rho) - rho_start) / rho_step
+        v = (math.log10(T) - T_start) / T_step
+        i, j = math.floor(u), math.floor(v)
+        if not (0 <= i < rho_points - 1 and 0 <= j < T_points - 1):
+            return self.physics(rho, T)
+        u, v = u - i, v - j
+
+        # The corner values and slopes of every quantity, one row each
+        corners = self.tables[:, :, i:i + 2, j:j + 2].reshape(
+            len(self.tables), -1)
+        if self.order == 1:
+            weights = [(1 - u) * (1 - v), (1 - u) * v, u * (1 - v), u * v]
+        else:
+            (u0, u1), (su0, su1) = hermite_basis(u)
+            (v0, v1), (sv0, sv1) = hermite_basis(v)
+            su0, su1 = su0 * rho_step, su1 * rho_step
+            sv0, sv1 = sv0 * T_step, sv1 * T_step
+            weights = [u0 * v0, u0 * v1, u1 * v0, u1 * v1,
+                       su0 * v0, su0 * v1, su1 * v0, su1 * v1,
+                       u0 * sv0, u0 * sv1, u1 * sv0, u1 * sv1,
+                       su0 * sv0, su0 * sv1, su1 * sv0, su1 * sv1]
+
+        with np.errstate(invalid="ignore"):
+            values = 10.0**corners.dot(weights)
+        values[self.zero] = 0
+        return tuple(values)
+
+    def max_error(self):
+        """
+        Largest relative error of the tables against the physics function,
+        checked at the centre of every cell where interpolating is least
+        accurate
+
+        Returns:
+            (float): Relative error
+        """
+        centres = [start + step * (np.arange(points - 1) + 0.5)
+                   for start, step, points in self.axes]
+        log_rho, log_T = np.meshgrid(*centres, indexing="ij")
+        rho, T = 10.0**log_rho, 10.0**log_T
+
+        exact = np.array(np.broadcast_arrays(*self.physics(rho, T)))
+        table = np.array(self(rho, T))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            error = np.abs(table / exact - 1)
+        return float(np.max(np.where(exact == 0, 0, error)))
+
+
+def tabulate(physics, per_decade, order):
+    """
+    Evaluates physics over the table grid
+
+    Args:
+        physics (function rho, T: tuple): Quantities ordered as QUANTITIES
+        per_decade (int): Grid points per decade of rho and T
+        order (int): 1 for bilinear and 3 for bicubic tables
+
+    Returns:
+        (nd.array, list): Tables and the (start, step, points) of each axis
+    """
+    axes = []
+    for start, stop in (LOG_RHO_RANGE, LOG_T_RANGE):
+        points = (stop - start) * per_decade + 1
+        axes.append((start, 1 / per_decade, points))
+    log_rho, log_T = np.meshgrid(
+        *[start + step * np.arange(points) for start, step, points in axes],
+        indexing="ij")
+
+    def log_physics(log_rho, log_T):
+        with np.errstate(divide="ignore"):
+            return np.log10(np.array(np.broadcast_arrays(
+                *physics(10.0**log_rho, 10.0**log_T))))
+
+    tables = [log_physics(log_rho, log_T)]
+    if order == 3:
+        e = DERIVATIVE_STEP
+        tables += [
+            (log_physics(log_rho + e, log_T) -
+             log_physics(log_rho - e, log_T)) / (2 * e),
+            (log_physics(log_rho, log_T + e) -
+             log_physics(log_rho, log_T - e)) / (2 * e),
+            (log_physics(log_rho + e, log_T + e) -
+             log_physics(log_rho + e, log_T - e) -
+             log_physics(log_rho - e, log_T + e) +
+             log_physics(log_rho - e, log_T - e)) / (4 * e * e),
+        ]
+
+    # Quantities that are zero everywhere have nan derivatives, they are
+    # never interpolated
+    tables = np.nan_to_num(np.stack(tables, axis=1), nan=0, neginf=-np.inf)
+    return tables, axes
+
+
+def build_tables(physics, tolerance, order=3):
+    """
+    Doubles the resolution of the tables until they are within tolerance of
+    physics
+
+    Args:
+        physics (function rho, T: tuple): Quantities ordered as QUANTITIES
+        tolerance (float): Largest relative error allowed
+        order (int): 1 for bilinear and 3 for bicubic tables
+
+    Returns:
+        (PhysicsTables): Tables within tolerance
+    """
+    per_decade = 4
+    while per_decade <= MAX_PER_DECADE:
+        tables = PhysicsTables(physics, *tabulate(physics, per_decade, order),
+                               order)
+        if tables.max_error() <= tolerance:
+            return tables
+        per_decade *= 2
+
+    raise ValueError("Tables of order {} can't reach a tolerance of {} with "
+                     "{} points per decade".format(order, tolerance,
+                                                   MAX_PER_DECADE))
+
+
+def table_key(composition, tolerance, order):
+    """
+    Hashes everything that decides the tables
+
+    Returns:
+        (str): Hex digest used as the file name
+    """
+    text = json.dumps(
+        dict(composition,
+             tolerance=tolerance,
+             order=order,
+             log_rho_range=LOG_RHO_RANGE,
+             log_T_range=LOG_T_RANGE,
+             table_version=TABLE_VERSION),
+        sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def load_tables(physics, composition, tolerance, folder=None, order=3):
+    """
+    Returns the tables of a composition, building them only if neither this
+    process nor the cache folder already has them
+
+    Args:
+        physics (function rho, T: tuple): Direct evaluation for the
+            composition, ordered as QUANTITIES
+        composition (dict): Everything physics depends on, e.g. X, Y, Z, Xc
+        tolerance (float): Largest relative error of the tables
+        folder (str): Folder the tables are cached in, or None to keep them
+            in this process only
+        order (int): 1 for bilinear and 3 for bicubic tables
+
+    Returns:
+        (PhysicsTables): Tables for the composition
+    """
+    key = table_key(composition, tolerance, order)
+    if key in _loaded:
+        return _loaded[key]
+
+    path = None if folder is None else Path(folder) / (key + ".npy")
+    if path is not None and path.exists():
+        with open(path.with_suffix(".json")) as header:
+            axes = json.load(header)["axes"]
+        tables = PhysicsTables(physics, np.load(path, mmap_mode="r"), axes,
+                               order)
+    else:
+        tables = build_tables(physics, tolerance, order)
+        if path is not None:
+            # Written under temporary names first so other processes never
+            # read half written tables
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temporary = path.with_name("{}.{}.tmp".format(key, os.getpid()))
+            with open(temporary, "w") as header:
+                json.dump({"axes": tables.axes,
+                           "composition": composition,
+                           "tolerance": tolerance,
+                           "order": order}, header)
+            os.replace(temporary, path.with_suffix(".json"))
+            with open(temporary, "wb") as table_file:
+                np.save(table_file, tables.tables)
+            os.replace(temporary, path)
+
+    _loaded[key] = tables
+    return tables
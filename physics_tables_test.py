@@ -0,0 +1,53 @@
+"""
+Checks the physics tables interpolate within their tolerance and that
+single states and arrays of them give the same values
+"""
+import numpy as np
+import pytest
+import physics_tables
+import stellar_properties as starprop
+
+PHYSICS = starprop.make_physics(0.70, 0.28, 0.02, 0.004)
+
+
+@pytest.fixture(scope="module", params=[(3, 1e-6), (1, 1e-2)])
+def tables(request):
+    order, tolerance = request.param
+    return physics_tables.build_tables(PHYSICS, tolerance, order), tolerance
+
+
+def states(count=500):
+    """
+    Random states inside the table grid
+    """
+    random = np.random.default_rng(370)
+    return (10.0**random.uniform(-6, 10, count),
+            10.0**random.uniform(4, 9, count))
+
+
+def test_within_tolerance(tables):
+    tables, tolerance = tables
+    assert tables.max_error() <= tolerance
+
+    rho, T = states()
+    exact = np.array(np.broadcast_arrays(*PHYSICS(rho, T)))
+    table = np.array(tables(rho, T))
+    error = np.abs(table[exact != 0] / exact[exact != 0] - 1)
+    # Cell centres are where the error peaks, allow for rounding
+    assert error.max() <= 2 * tolerance
+    np.testing.assert_array_equal(table[exact == 0], 0)
+
+
+def test_single_matches_arrays(tables):
+    tables, tolerance = tables
+    rho, T = states(50)
+    table = np.array(tables(rho, T))
+    for index in range(len(rho)):
+        np.testing.assert_allclose(tables(rho[index], T[index]),
+                                   table[:, index], rtol=1e-12)
+
+
+def test_outside_grid_is_direct(tables):
+    tables, tolerance = tables
+    for rho, T in [(1e13, 1e6), (1.0, 1e11), (0.0, 1e6)]:
+        assert tables(rho, T) == PHYSICS(rho, T)
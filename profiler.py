@@ -0,0 +1,95 @@
+"""
+Counters and timers for finding out where the time of a star goes. A Star
+made with profile=True fills a StarProfile as it solves, and make_star
+collects the profiles of all its trials into one JSON report.
+"""
+import sys
+import time
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+class StarProfile:
+    """
+    Counters of one Star.solve. Times are in seconds, step_de includes the
+    time spent on the non differential equations during the step.
+    """
+
+    def __init__(self):
+        self.counters = {
+            "rhs_evaluations": 0,
+            "accepted_steps": 0,
+            "rejected_steps": 0,
+            "min_step_hits": 0,
+            "max_step_hits": 0
+        }
+        self.times = {"step_de": 0.0, "non_de": 0.0}
+        self.step_histogram = {}
+
+    def count(self, name, number=1):
+        self.counters[name] += number
+
+    def add_time(self, name, start):
+        """
+        Adds the time since start, taken from time.perf_counter
+        """
+        self.times[name] += time.perf_counter() - start
+
+    def add_step(self, step_size):
+        """
+        Counts an accepted step in its power of ten bin
+        """
+        key = "1e{}".format(int(np.floor(np.log10(step_size))))
+        self.step_histogram[key] = self.step_histogram.get(key, 0) + 1
+
+    def as_dict(self):
+        """
+        Returns:
+            (dict): Counters, times and histogram ready for JSON
+        """
+        return {
+            "counters": dict(self.counters),
+            "times": {
+                "de": self.times["step_de"] - self.times["non_de"],
+                "non_de": self.times["non_de"]
+            },
+            "step_histogram": dict(self.step_histogram)
+        }
+
+
+def merge(profiles):
+    """
+    Adds up StarProfile.as_dict results, skipping any that are None
+
+    Returns:
+        (dict): Same layout as StarProfile.as_dict
+    """
+    total = StarProfile().as_dict()
+    for profile in profiles:
+        if profile is None:
+            continue
+        for group in total:
+            for key, value in profile[group].items():
+                total[group][key] = total[group].get(key, 0) + value
+
+    return total
+
+
+def peak_memory():
+    """
+    Returns:
+        (float or None): Peak resident memory of this process in MB, None
+            where it can't be measured. Child processes such as pool
+            workers are not included.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    if sys.platform == "darwin":
+        return peak / 1024**2
+    return peak / 1024
@@ -1,4 +1,5 @@
 import numpy as np
+from column_buffer import ColumnBuffer
 
 
 class Equation:
@@ -28,9 +29,48 @@ class Equation:
         Sets initial values
         """
         self.name = name
-        self.val = np.array([])
+        self.values = ColumnBuffer()
         self.step = []
         self.current = []
+        self.store_steps = True
+
+    @property
+    def val(self):
+        """
+        View of every added step
+        """
+        return self.values.view()
+
+    @val.setter
+    def val(self, val):
+        self.values = ColumnBuffer(val)
+
+    # Attributes get_state saves besides the stored values
+    state_attributes = ["current", "step", "hold", "intermediate"]
+
+    def get_state(self):
+        """
+        Everything needed to carry on from the last step, used to
+        checkpoint a Star
+
+        Returns:
+            (dict): Arrays keyed by attribute name
+        """
+        state = {"val": self.val}
+        for attribute in self.state_attributes:
+            if hasattr(self, attribute):
+                state[attribute] = np.asarray(getattr(self, attribute),
+                                              dtype=float)
+        return state
+
+    def set_state(self, state):
+        """
+        Restores the values and attributes saved by get_state
+        """
+        self.val = state["val"]
+        for attribute in self.state_attributes:
+            if attribute in state:
+                setattr(self, attribute, np.array(state[attribute]))
 
     def set_equation(self, equation):
         """
@@ -64,11 +104,20 @@ class Equation:
 
     def add_step(self):
         """
-        Adds the small step as a new set of value to the outvalues
+        Adds the small step as a new set of value to the outvalues. When
+        store_steps is off only the current value moves forward.
         """
-        self.val = np.append(self.val, self.step)
+        if self.store_steps:
+            self.values.append(self.step)
         self.current = np.copy(self.step)
 
+    def add_dense_steps(self, steps):
+        """
+        Adds interpolated values to the outvalues
+        """
+        for value in np.asarray(steps):
+            self.values.append(value)
+
     def now(self, order=None):
         """
         Get the value of the equation right now.
@@ -95,10 +144,10 @@ class Equation:
 
     def data(self, order=None):
         """
-        Returns full rows of data
+        Returns a view of full rows of data
         """
 
         if order:
             pass
 
-        return np.copy(self.val[:])
+        return self.val
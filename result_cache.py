@@ -0,0 +1,112 @@
+"""
+Content addressed cache of finished make_star results. Each entry is keyed
+by a hash of everything that decides the result, so re-running a starlist
+only integrates the stars whose parameters actually changed.
+"""
+import hashlib
+import json
+import os
+import numpy as np
+from pathlib import Path
+
+# Bump whenever a change to the solver changes the profiles it produces so
+# that results cached by older code are never reused
+SOLVER_VERSION = "11"
+
+
+def cache_key(parameters):
+    """
+    Hashes a dictionary of parameters together with the solver version
+
+    Args:
+        parameters (dict): Everything that decides the result, must be
+            serializable to JSON
+
+    Returns:
+        (str): Hex digest used as the entry name
+    """
+    text = json.dumps(
+        dict(parameters, solver_version=SOLVER_VERSION),
+        sort_keys=True,
+        default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Folder of .npz files, one per solved star, holding the saved profile,
+    its header and the converged central density. The least recently used
+    entries are evicted once there are more than max_entries.
+    """
+
+    def __init__(self, folder="Star_Files/cache", max_entries=2000):
+        """
+        Args:
+            folder (str): Folder the entries are kept in
+            max_entries (int): Number of entries kept before evicting
+        """
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+
+    def path(self, key):
+        return self.folder / (key + ".npz")
+
+    def load(self, key):
+        """
+        Looks up an entry, dropping it if it was written by another solver
+        version or cannot be read
+
+        Returns:
+            (tuple or None): (array2D, header, rho_c) or None on a miss
+        """
+        path = self.path(key)
+        if not path.exists():
+            return None
+
+        try:
+            with np.load(path) as entry:
+                if str(entry["solver_version"]) != SOLVER_VERSION:
+                    raise ValueError("Stale cache entry")
+                result = (entry["profile"], list(entry["header"]),
+                          float(entry["rho_c"]))
+        except (OSError, KeyError, ValueError):
+            path.unlink(missing_ok=True)
+            return None
+
+        # Touch the entry so eviction keeps recently used stars
+        os.utime(path)
+        return result
+
+    def store(self, key, array2D, header, rho_c):
+        """
+        Saves an entry. It is written to a temporary file first so other
+        processes never read a half written entry.
+        """
+        temporary = self.folder / "{}.{}.tmp.npz".format(key, os.getpid())
+        np.savez_compressed(
+            temporary,
+            profile=np.array([np.asarray(column) for column in array2D]),
+            header=np.array(header),
+            rho_c=rho_c,
+            solver_version=SOLVER_VERSION)
+        os.replace(temporary, self.path(key))
+
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used entries above max_entries
+        """
+        entries = []
+        for path in self.folder.glob("*.npz"):
+            if ".tmp" in path.suffixes:
+                continue
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                pass
+
+        entries.sort()
+        for mtime, path in entries[:max(len(entries) - self.max_entries, 0)]:
+            path.unlink(missing_ok=True)
@@ -0,0 +1,74 @@
+"""
+Checks ResultCache hits, evicts and drops stale entries
+"""
+import os
+import numpy as np
+import pytest
+import result_cache
+from result_cache import ResultCache, cache_key
+
+HEADER = ["radius", "density"]
+
+
+def profile(scale=1.0):
+    return [np.linspace(0, 1, 20) * scale, np.linspace(5, 2, 20)]
+
+
+def age(cache, key, seconds):
+    """
+    Sets when an entry was last used, as eviction goes by modification time
+    """
+    os.utime(cache.path(key), (seconds, seconds))
+
+
+def test_cache_key():
+    parameters = {"temperature": 1.5e7, "core": "Hydrogen", "X": 0.7}
+    assert cache_key(parameters) == cache_key(dict(reversed(
+        list(parameters.items()))))
+    assert cache_key(parameters) != cache_key(dict(parameters, X=0.71))
+
+
+def test_store_load(tmp_path):
+    cache = ResultCache(tmp_path)
+    assert cache.load("missing") is None
+
+    cache.store("star", profile(), HEADER, 2.5e5)
+    array2D, header, rho_c = cache.load("star")
+
+    np.testing.assert_array_equal(array2D, profile())
+    assert header == HEADER
+    assert rho_c == 2.5e5
+    assert list(tmp_path.glob("*.tmp*")) == []
+
+
+def test_eviction(tmp_path):
+    cache = ResultCache(tmp_path, max_entries=3)
+    for i in range(3):
+        cache.store(str(i), profile(i), HEADER, i)
+        age(cache, str(i), 1000 + i)
+
+    # Using the oldest entry keeps it over the next oldest
+    assert cache.load("0") is not None
+    cache.store("3", profile(3), HEADER, 3)
+
+    remaining = sorted(path.stem for path in tmp_path.glob("*.npz"))
+    assert remaining == ["0", "2", "3"]
+    assert cache.load("1") is None
+
+
+def test_stale(tmp_path, monkeypatch):
+    cache = ResultCache(tmp_path)
+    cache.store("star", profile(), HEADER, 1.0)
+
+    monkeypatch.setattr(result_cache, "SOLVER_VERSION",
+                        result_cache.SOLVER_VERSION + "-new")
+    assert cache.load("star") is None
+    assert not cache.path("star").exists()
+
+
+def test_unreadable(tmp_path):
+    cache = ResultCache(tmp_path)
+    cache.path("broken").write_bytes(b"not an npz file")
+
+    assert cache.load("broken") is None
+    assert not cache.path("broken").exists()
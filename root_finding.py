@@ -0,0 +1,247 @@
+"""
+Root finding strategies used to shoot for the central density of a star.
+Every strategy takes a function to zero, a starting guess and a bracket
+as (x, f(x)) pairs, a convergence test and a maximum number of new
+function evaluations. They all return the best (x, f(x)) they found.
+"""
+import numpy as np
+
+
+def bisect(func, guess, low, high, converged, max_iter=60):
+    """
+    Bisection that starts from the guess and keeps halving the bracket
+    until the guess converges or max_iter new guesses have been tried.
+
+    Args:
+        func (function x: f): Function to find the root of
+        guess, low, high (tuple): (x, f(x)) of the guess and bracket ends
+        converged (function low, high, guess: bool): Convergence test taking
+            the bracket ends and the current guess as (x, f(x)) pairs
+        max_iter (int): Maximum number of calls to func
+
+    Returns:
+        (tuple): (x, f(x)) of the last guess
+    """
+    for i in range(max_iter + 1):
+        if converged(low, high, guess):
+            break
+
+        if np.sign(guess[1]) == np.sign(low[1]):
+            low = guess
+        else:
+            high = guess
+
+        if i == max_iter:
+            print("Outside of tolerance")
+            break
+
+        x = (high[0] + low[0]) / 2
+        guess = (x, func(x))
+
+    return guess
+
+
+def shrink_bracket(guess, low, high):
+    """
+    Uses the guess to replace the bracket end on its side of the root
+    """
+    if np.sign(guess[1]) == np.sign(low[1]):
+        return guess, high
+
+    return low, guess
+
+
+def expand_bracket(func, low, high, widen, max_expand=4):
+    """
+    Widens a bracket whose ends have the same sign by moving the end with
+    the smaller error further out, until the signs differ
+
+    Args:
+        func (function x: f): Function to find the root of
+        low, high (tuple): (x, f(x)) of the bracket ends
+        widen (function x, direction: x): Moves x further out, down for a
+            direction of -1 and up for +1
+        max_expand (int): Maximum number of calls to func
+
+    Returns:
+        (tuple): low and high (x, f(x)) pairs
+    """
+    for i in range(max_expand):
+        if np.sign(low[1]) != np.sign(high[1]):
+            break
+
+        if abs(low[1]) < abs(high[1]):
+            x = widen(low[0], -1)
+            low = (x, func(x))
+        else:
+            x = widen(high[0], 1)
+            high = (x, func(x))
+
+    return low, high
+
+
+def illinois(func, guess, low, high, converged, max_iter=60):
+    """
+    Illinois variant of regula falsi. The end that stays put twice in a row
+    has its value halved so the bracket closes from both sides. Once the
+    bracket is more than four halvings behind where bisection would have
+    taken it, as at a jump in func, it bisects instead, so it never needs
+    more than five more calls than bisection.
+
+    Args are the same as bisect.
+
+    Returns:
+        (tuple): (x, f(x)) of the point with the smallest error
+    """
+    best = min(guess, low, high, key=lambda point: abs(point[1]))
+    if converged(low, high, guess):
+        return guess
+
+    low, high = shrink_bracket(guess, low, high)
+    (a, fa), (b, fb) = low, high
+    side = 0
+    width = abs(b - a)
+
+    for i in range(max_iter):
+        if abs(b - a) <= width / 2**(i - 4):
+            x = (a * fb - b * fa) / (fb - fa)
+        else:
+            x = (a + b) / 2
+        point = (x, func(x))
+        best = min(best, point, key=lambda point: abs(point[1]))
+
+        if np.sign(point[1]) == np.sign(fb):
+            b, fb = point
+            if side == -1:
+                fa /= 2
+            side = -1
+        else:
+            a, fa = point
+            if side == 1:
+                fb /= 2
+            side = 1
+
+        if converged((a, fa), (b, fb), point):
+            return point
+
+    print("Outside of tolerance")
+    return best
+
+
+def brent(func, guess, low, high, converged, max_iter=60):
+    """
+    Brent's method combining inverse quadratic interpolation, the secant
+    method and bisection so it is never slower than bisection.
+
+    Args are the same as bisect.
+
+    Returns:
+        (tuple): (x, f(x)) of the point with the smallest error
+    """
+    if converged(low, high, guess):
+        return guess
+
+    low, high = shrink_bracket(guess, low, high)
+    (a, fa), (b, fb) = low, high
+    if abs(fa) < abs(fb):
+        a, fa, b, fb = b, fb, a, fa
+    c, fc = a, fa
+    d = c
+    bisected = True
+
+    for i in range(max_iter):
+        if fa != fc and fb != fc:
+            x = (a * fb * fc / ((fa - fb) * (fa - fc)) + b * fa * fc /
+                 ((fb - fa) * (fb - fc)) + c * fa * fb / ((fc - fa) *
+                                                          (fc - fb)))
+        else:
+            x = b - fb * (b - a) / (fb - fa)
+
+        if (not (3 * a + b) / 4 < x < b and not b < x < (3 * a + b) / 4) or (
+                bisected and abs(x - b) >= abs(b - c) / 2) or (
+                    not bisected and abs(x - b) >= abs(c - d) / 2):
+            x = (a + b) / 2
+            bisected = True
+        else:
+            bisected = False
+
+        fx = func(x)
+        d, c, fc = c, b, fb
+
+        if np.sign(fa) != np.sign(fx):
+            b, fb = x, fx
+        else:
+            a, fa = x, fx
+
+        if abs(fa) < abs(fb):
+            a, fa, b, fb = b, fb, a, fa
+
+        if converged((a, fa), (b, fb), (b, fb)):
+            return (b, fb)
+
+    print("Outside of tolerance")
+    return (b, fb)
+
+
+def ksection(func, guess, low, high, converged, max_iter=60, func_many=None,
+             k=3):
+    """
+    Generalized bisection that tries k evenly spaced points inside the
+    bracket together and keeps the piece where the sign changes, so the
+    bracket shrinks by a factor of k + 1 every round. A bracket without a
+    sign change is narrowed to the piece next to the point with the
+    smallest error that has the smaller error at its other end.
+
+    Args are the same as bisect, and
+        func_many (function xs: fs): Evaluates func at several points at
+            once, by default one after the other
+        k (int): Number of points tried each round
+
+    Returns:
+        (tuple): (x, f(x)) of the point with the smallest error
+    """
+    if func_many is None:
+        func_many = lambda xs: [func(x) for x in xs]
+
+    if converged(low, high, guess):
+        return guess
+
+    best = min(guess, low, high, key=lambda point: abs(point[1]))
+    low, high = shrink_bracket(guess, low, high)
+
+    for i in range(max_iter):
+        xs = low[0] + (high[0] - low[0]) * np.arange(1, k + 1) / (k + 1)
+        points = [low] + list(zip(xs, func_many(xs))) + [high]
+        best = min([best] + points, key=lambda point: abs(point[1]))
+
+        for point in points[1:-1]:
+            if converged(low, high, point):
+                return point
+
+        for left, right in zip(points[:-1], points[1:]):
+            if np.sign(left[1]) != np.sign(right[1]):
+                low, high = left, right
+                break
+        else:
+            # Without a sign change close in on the smallest error instead
+            # of trying the same points again
+            i = min(range(k + 2), key=lambda i: abs(points[i][1]))
+            if i == k + 1 or (i > 0 and
+                              abs(points[i - 1][1]) < abs(points[i + 1][1])):
+                i -= 1
+            low, high = points[i], points[i + 1]
+
+        guess = min(low, high, key=lambda point: abs(point[1]))
+        if converged(low, high, guess):
+            return guess
+
+    print("Outside of tolerance")
+    return best
+
+
+ROOT_FINDERS = {
+    "bisect": bisect,
+    "illinois": illinois,
+    "brent": brent,
+    "ksection": ksection
+}
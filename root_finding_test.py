@@ -0,0 +1,133 @@
+"""
+Checks the root finding strategies on functions with a known root
+"""
+import contextlib
+import io
+import numpy as np
+import pytest
+import root_finding as rf
+
+ROOT = 2**(1 / 3)
+
+
+def cube(x):
+    return x**3 - 2
+
+
+def jump(x):
+    """
+    Never zero, changes sign at ROOT like the luminosity error of a star
+    """
+    return 1.0 if x > ROOT else -1.0
+
+
+def start(func, guess, low, high):
+    return [(x, func(x)) for x in (guess, low, high)]
+
+
+def counted(func):
+    calls = []
+
+    def wrapped(x):
+        calls.append(x)
+        return func(x)
+    return wrapped, calls
+
+
+def width_converged(tolerance):
+    return lambda low, high, guess: (abs(guess[1]) < 1e-14 or
+                                     abs(high[0] - low[0]) < tolerance)
+
+
+@pytest.mark.parametrize("method", sorted(rf.ROOT_FINDERS))
+def test_finds_root(method):
+    func, calls = counted(cube)
+    converged = lambda low, high, guess: abs(guess[1]) < 1e-10
+    x, error = rf.ROOT_FINDERS[method](func, *start(cube, 1, 0, 4),
+                                       converged)
+
+    assert abs(error) < 1e-10
+    assert x == pytest.approx(ROOT, abs=1e-10)
+    assert error == cube(x)
+    assert len(calls) < 60
+
+
+@pytest.mark.parametrize("method", ["brent", "illinois"])
+def test_faster_than_bisect_on_smooth(method):
+    converged = lambda low, high, guess: abs(guess[1]) < 1e-10
+    counts = {}
+    for name in ("bisect", method):
+        func, calls = counted(cube)
+        rf.ROOT_FINDERS[name](func, *start(cube, 1, 0, 4), converged)
+        counts[name] = len(calls)
+
+    assert counts[method] < counts["bisect"]
+
+
+@pytest.mark.parametrize("method", sorted(rf.ROOT_FINDERS))
+def test_jump(method):
+    func, calls = counted(jump)
+    converged = width_converged(1e-6)
+    with contextlib.redirect_stdout(io.StringIO()):
+        x, error = rf.ROOT_FINDERS[method](func, *start(jump, 1, 0, 4),
+                                           converged)
+    assert x == pytest.approx(ROOT, abs=1e-6)
+
+
+def test_illinois_bounded_by_bisect():
+    counts = {}
+    for name in ("bisect", "illinois"):
+        func, calls = counted(lambda x: jump(x) * (1 + x))
+        with contextlib.redirect_stdout(io.StringIO()):
+            rf.ROOT_FINDERS[name](func, *start(func, 1, 0, 4),
+                                  width_converged(1e-6))
+        counts[name] = len(calls) - 3
+
+    assert counts["illinois"] <= counts["bisect"] + 5
+
+
+def test_ksection_shrinks_by_k_plus_one():
+    func, calls = counted(jump)
+    rounds = []
+    func_many = lambda xs: rounds.append(len(xs)) or [func(x) for x in xs]
+    rf.ksection(func, *start(jump, 1, 0, 4), width_converged(4 / 4**5),
+                func_many=func_many, k=3)
+
+    assert rounds == [3] * 5
+
+
+def test_ksection_without_sign_change():
+    """
+    Both ends above zero, the bracket closes in on the minimum
+    """
+    parabola = lambda x: (x - 1.3)**2 + 1e-3
+    converged = width_converged(1e-6)
+    with contextlib.redirect_stdout(io.StringIO()):
+        x, error = rf.ksection(parabola, *start(parabola, 0, 0, 4),
+                               converged)
+    assert x == pytest.approx(1.3, abs=1e-5)
+
+
+def test_expand_bracket():
+    func, calls = counted(cube)
+    low, high = rf.expand_bracket(func, (1.5, cube(1.5)), (2, cube(2)),
+                                  lambda x, direction: x + direction)
+
+    assert np.sign(low[1]) != np.sign(high[1])
+    assert low == (0.5, cube(0.5))
+    assert calls == [0.5]
+
+
+def test_expand_bracket_gives_up():
+    func, calls = counted(lambda x: 1.0)
+    low, high = rf.expand_bracket(func, (0, 1.0), (1, 1.0),
+                                  lambda x, direction: x + direction,
+                                  max_expand=3)
+    assert len(calls) == 3
+    assert np.sign(low[1]) == np.sign(high[1])
+
+
+def test_shrink_bracket():
+    low, high = (0, -2), (4, 62)
+    assert rf.shrink_bracket((1, -1), low, high) == ((1, -1), high)
+    assert rf.shrink_bracket((2, 6), low, high) == (low, (2, 6))
@@ -0,0 +1,365 @@
+"""
+Solves many stars at once by advancing all of their states together as
+NumPy arrays. Each star keeps its own step size, and stars drop out of the
+arrays as soon as they reach their surface.
+"""
+import numpy as np
+import desolver as de
+import stellar_properties as starprop
+from column_buffer import ColumnBuffer
+
+
+class StarBatch:
+    """
+    Batch of stars integrated in lockstep with the fused structure kernel.
+    Every star uses the same embedded Runge-Kutta method and step size rule
+    as the fused Star engine, and a star's profile does not depend on which
+    other stars share its batch. Powers of arrays can round differently from
+    the scalar ones of a single Star on some CPUs, so profiles agree with
+    the fused engine to about 1e-7 rather than bit for bit. Where that
+    flips whether a step is accepted the steps differ from then on, and the
+    surface radius, mass and luminosity agree to about error_thresh.
+    """
+
+    def __init__(self,
+                 cent_density,
+                 cent_temperature,
+                 core="Hydrogen",
+                 X=0.70,
+                 Y=0.28,
+                 Z=0.02,
+                 Xc=0.004,
+                 cent_opticaldepth=0,
+                 cent_radii=0.01,
+                 step_size=0.1,
+                 error_thresh=1e-5,
+                 max_step=100000,
+                 min_step=0.001,
+                 max_points=5000,
+                 name="Generic Star",
+                 tableau="fehlberg",
+                 controller="elementary",
+                 abs_tolerance=0,
+                 variable="radius",
+                 table_tolerance=None,
+                 table_folder=None):
+        """
+        Sets up one Star per parameter set. Every argument may be a single
+        value shared by all stars or a list with one value per star.
+
+        Args:
+            cent_density (list): Central densities
+            cent_temperature (list): Central temperatures
+            core (str or list): Core type of each star
+            X, Y, Z, Xc (float or list): Composition of each star
+            max_points (int): Stars with more steps than this are stopped
+            name (str or list): Name given to each Star
+            tableau (str): Runge-Kutta method shared by all the stars
+            controller (str): Step size controller, "elementary" or "pi"
+            abs_tolerance (float or list): Absolute tolerance of each DE
+                used by the pi controller
+            variable (str): Independent variable, "radius" or "log_radius".
+                With log_radius the step sizes are in ln r.
+            table_tolerance (float): Relative error of the physics tables,
+                or None to evaluate the physics directly. Tables need every
+                star to have the same composition.
+            table_folder (str): Folder the physics tables are kept in
+        """
+        params = np.broadcast_arrays(
+            np.asarray(cent_density, dtype=float),
+            np.asarray(cent_temperature, dtype=float),
+            np.asarray(core), np.asarray(X, dtype=float),
+            np.asarray(Y, dtype=float), np.asarray(Z, dtype=float),
+            np.asarray(Xc, dtype=float), np.asarray(name))
+        params = [np.atleast_1d(param) for param in params]
+        (self.cent_density, self.cent_temperature, self.core, self.X, self.Y,
+         self.Z, self.Xc, names) = params
+
+        self.error_thresh = error_thresh
+        self.max_step = max_step
+        self.min_step = min_step
+        self.max_points = max_points
+        self.tableau = de.TABLEAUS[tableau]
+        self.controller = controller
+        self.variable = variable
+        self.physics = None
+        if table_tolerance is not None:
+            composition = [self.X, self.Y, self.Z, self.Xc]
+            if any((values != values[0]).any() for values in composition):
+                raise ValueError("Physics tables need every star in the "
+                                 "batch to have the same composition")
+            self.physics = starprop.load_physics_tables(
+                *[values[0] for values in composition], table_tolerance,
+                table_folder)
+        self.tolerance = None
+        if controller == "pi":
+            self.tolerance = (np.broadcast_to(
+                np.asarray(abs_tolerance, dtype=float), (5, ))[:, None],
+                              error_thresh)
+
+        self.stars = [
+            starprop.Star(
+                X=self.X[index],
+                Y=self.Y[index],
+                Z=self.Z[index],
+                Xc=self.Xc[index],
+                cent_density=self.cent_density[index],
+                cent_opticaldepth=cent_opticaldepth,
+                cent_temperature=self.cent_temperature[index],
+                cent_radii=cent_radii,
+                step_size=step_size,
+                error_thresh=error_thresh,
+                max_step=max_step,
+                min_step=min_step,
+                core=str(self.core[index]),
+                name=str(names[index]),
+                engine="fused",
+                tableau=tableau,
+                controller=controller,
+                abs_tolerance=abs_tolerance,
+                variable=variable,
+                table_tolerance=table_tolerance,
+                table_folder=table_folder) for index in range(len(names))
+        ]
+
+        self.state = np.array([star.state for star in self.stars]).T
+        self.radius = np.full(len(self.stars), float(cent_radii))
+        self.step_size = np.full(len(self.stars), float(step_size))
+        self.points = np.ones(len(self.stars), dtype=int)
+        self.success = np.zeros(len(self.stars), dtype=bool)
+        self.active = np.arange(len(self.stars))
+        # Derivatives at each star's state, nan until a step evaluates them
+        self.first_stage = np.full(self.state.shape, np.nan)
+        self.previous_error = np.full(len(self.stars), 1e-4)
+        self.after_rejection = np.zeros(len(self.stars), dtype=bool)
+        self.stalled = np.zeros(len(self.stars), dtype=bool)
+        self.runaway = np.zeros(len(self.stars), dtype=bool)
+        self.history = []
+
+    def make_kernel(self):
+        """
+        Builds the structure kernel for the stars that are still running
+        """
+        return starprop.make_structure_kernel(
+            self.X[self.active],
+            self.Y[self.active],
+            self.Z[self.active],
+            self.Xc[self.active],
+            self.core[self.active],
+            self.stars[0].properties['gamma'],
+            fmin=np.minimum,
+            fmax=np.maximum,
+            physics=self.physics)
+
+    def step(self, kernel):
+        """
+        Takes one Runge-Kutta step for every running star. Stars
+        whose error is over the threshold keep their old state and only
+        shrink their step size.
+
+        Returns:
+            (nd.array): Mask of the running stars that accepted their step
+        """
+        active = self.active
+        x = self.position(self.radius[active])
+        h = self.step_size[active]
+        y = self.state[:, active]
+
+        outputs = []
+
+        def state_derivs(x, y):
+            radius = self.to_radius(x)
+            outputs.append(kernel(radius, np.maximum(y, 0)))
+            return self.variable_derivs(radius, outputs[-1][0])
+
+        first_stage = self.first_stage[:, active]
+        if np.isnan(first_stage).any():
+            first_stage = None
+
+        y_new, error = self.tableau.step(state_derivs, x, y, h,
+                                         self.tolerance, first_stage)
+        error = np.max(error, axis=0)
+
+        if self.controller == "pi":
+            accept = error <= 1
+        else:
+            accept = error <= self.error_thresh
+        # Same as Star.adjust_step_size, a star whose step is rejected at
+        # min_step would retry it forever
+        self.stalled[active[~accept & (h <= self.min_step)]] = True
+        if accept.any():
+            ids = active[accept]
+            self.state[:, ids] = np.maximum(y_new[:, accept], 0)
+            self.radius[ids] = self.to_radius(x[accept] + h[accept])
+            self.points[ids] += 1
+
+            # The last stage of a first same as last tableau is the kernel
+            # at the end of the step, the rejected stars keep their first
+            # stage
+            fsal = self.tableau.fsal and first_stage is not None
+            if fsal:
+                derivs, eqs = outputs[-1]
+            else:
+                derivs, eqs = kernel(self.radius[active],
+                                     self.state[:, active])
+            derivs = np.array(np.broadcast_arrays(*derivs))
+            new_first = self.variable_derivs(self.radius[active], derivs)
+            if fsal:
+                new_first[:, ~accept] = first_stage[:, ~accept]
+            self.first_stage[:, active] = new_first
+            derivs = derivs[:, accept]
+            eqs = np.array(np.broadcast_arrays(*eqs))[:, accept]
+            self.history.append((ids, self.radius[ids], self.state[:, ids],
+                                 derivs, eqs))
+
+            dtau = eqs[3] * self.state[2, ids]**2 / np.abs(derivs[2])
+            done = dtau < 0.00001
+            if self.variable == "log_radius":
+                runaway = ((self.radius[ids] > starprop.MAX_RADIUS) |
+                           (self.state[4, ids] > starprop.MAX_MASS))
+                self.runaway[ids[runaway]] = True
+                done &= ~runaway
+            self.success[ids[done]] = True
+
+        if self.controller == "pi":
+            self.step_size[active] = self.pi_step_size(active, h, error,
+                                                       accept)
+        else:
+            adjust = ~accept | (error < 0.1 * self.error_thresh)
+            self.step_size[active[adjust]] = self.adjust_step_size(
+                h[adjust], error[adjust])
+
+        return accept
+
+    def to_radius(self, x):
+        """
+        Radii at values of the independent variable
+        """
+        if self.variable == "log_radius":
+            return np.exp(x)
+        return x
+
+    def position(self, radius):
+        """
+        Independent variable at radii
+        """
+        if self.variable == "log_radius":
+            return np.log(radius)
+        return radius
+
+    def variable_derivs(self, radius, derivs):
+        """
+        Turns derivatives with respect to radius into derivatives with
+        respect to the independent variable
+        """
+        derivs = np.array(derivs)
+        if self.variable == "log_radius":
+            derivs = radius * derivs
+        return derivs
+
+    def pi_step_size(self, active, step_size, error, accept):
+        """
+        Same pi controller as Star.adjust_step_size, with the error of the
+        last accepted step and the last rejection kept per star
+        """
+        factor = de.pi_step_factor(error, self.previous_error[active], accept,
+                                   self.after_rejection[active],
+                                   self.tableau.error_order)
+        self.previous_error[active[accept]] = np.maximum(error[accept], 1e-4)
+        self.after_rejection[active] = ~accept
+
+        return np.clip(step_size * factor, self.min_step, self.max_step)
+
+    def adjust_step_size(self, step_size, error):
+        """
+        Same step size rule as Star.adjust_step_size applied to an array
+        of stars
+        """
+        new_step = np.clip(
+            step_size * 0.8 *
+            (self.error_thresh / error)**(1 / (self.tableau.error_order + 1)),
+            self.min_step, self.max_step)
+        new_step = np.where(np.isnan(new_step), self.min_step, new_step)
+
+        return np.where(error == 0, step_size * 10, new_step)
+
+    def solve(self):
+        """
+        Steps every star until it reaches its surface or runs over the
+        maximum number of points, then fills in the Star profiles
+
+        Returns:
+            (nd.array): Whether each star reached its surface
+        """
+        kernel = self.make_kernel()
+
+        with np.errstate(all="ignore"):
+            while len(self.active):
+                self.step(kernel)
+
+                running = ~self.success[self.active] & ~self.stalled[
+                    self.active] & ~self.runaway[self.active] & (
+                        self.points[self.active] <= self.max_points)
+                if not running.all():
+                    self.active = self.active[running]
+                    if len(self.active):
+                        kernel = self.make_kernel()
+
+        for index in np.flatnonzero(~self.success):
+            if self.stalled[index]:
+                print("Stopping as a step at min_step was rejected:",
+                      self.stars[index].name)
+            elif self.runaway[index]:
+                print("Stopping as the star is past MAX_RADIUS or MAX_MASS:",
+                      self.stars[index].name)
+            else:
+                print("Stopping based on large number of iterations > 30000:",
+                      self.stars[index].name)
+
+        self.fill_stars()
+        return self.success
+
+    def fill_stars(self):
+        """
+        Copies the recorded steps of every star into its properties and
+        trims them at the photosphere like Star.remove_extra
+        """
+        if self.history:
+            ids, radius, state, derivs, eqs = [
+                np.concatenate(item, axis=-1) for item in zip(*self.history)
+            ]
+        else:
+            ids = np.array([], dtype=int)
+            radius = np.array([])
+            state = derivs = np.empty((5, 0))
+            eqs = np.empty((12, 0))
+
+        order = np.argsort(ids, kind="stable")
+        splits = np.cumsum(np.bincount(ids, minlength=len(self.stars)))[:-1]
+
+        for index, star_ids in enumerate(np.split(order, splits)):
+            star = self.stars[index]
+            star.success = bool(self.success[index])
+            star.run = False
+            star.step_size = self.step_size[index]
+            star.points = int(self.points[index])
+
+            for row, item in enumerate(star.de_list):
+                steps = np.array([state[row, star_ids], derivs[row, star_ids]])
+                star.properties[item].val = np.concatenate(
+                    (star.properties[item].val, steps), axis=1)
+                star.properties[item].current = star.properties[item].val[:, -1]
+
+            for row, item in enumerate(star.eq_list):
+                star.properties[item].val = np.concatenate(
+                    (star.properties[item].val, eqs[row, star_ids]))
+                star.properties[item].current = star.properties[item].val[-1]
+
+            star.radius_buffer = ColumnBuffer(
+                np.concatenate((star.properties['radius'], radius[star_ids])))
+            star.properties['radius'] = star.radius_buffer.view()
+            star.properties['radii'] = star.properties['radius'][-1]
+            star.state = np.array(
+                [star.properties[item].now(0) for item in star.de_list])
+
+            star.remove_extra()
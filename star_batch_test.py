@@ -0,0 +1,88 @@
+"""
+Checks StarBatch solves stars like the fused Star engine and independently
+of the other stars in the batch
+"""
+import contextlib
+import io
+import numpy as np
+import pytest
+import desolver as de
+import stellar_properties as starprop
+from star_batch import StarBatch
+
+STARS = [("Helium", [2e10, 7e9], 1e8), ("Carbon", [1e10, 9e10], 8e8)]
+SURFACE = ["mass", "luminosity"]
+
+
+def quiet(function):
+    """
+    Runs function without printing and returns its result
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function()
+
+
+def solve_batch(cent_densities, cent_temperature, core, **kwargs):
+    batch = StarBatch(cent_densities, cent_temperature, core, **kwargs)
+    quiet(batch.solve)
+    return batch.stars
+
+
+def solve_fused(cent_densities, cent_temperature, core, **kwargs):
+    stars = []
+    for cent_density in cent_densities:
+        star = starprop.Star(cent_density=cent_density,
+                             cent_temperature=cent_temperature, core=core,
+                             engine="fused", **kwargs)
+        quiet(star.solve)
+        stars.append(star)
+    return stars
+
+
+@pytest.mark.parametrize("tableau", sorted(de.TABLEAUS))
+@pytest.mark.parametrize("controller", ["elementary", "pi"])
+@pytest.mark.parametrize("core, cent_densities, cent_temperature", STARS)
+def test_surface_matches_fused(tableau, controller, core, cent_densities,
+                               cent_temperature):
+    options = {"tableau": tableau, "controller": controller}
+    batch = solve_batch(cent_densities, cent_temperature, core, **options)
+    fused = solve_fused(cent_densities, cent_temperature, core, **options)
+
+    for batch_star, fused_star in zip(batch, fused):
+        assert batch_star.success and fused_star.success
+        np.testing.assert_allclose(batch_star.properties["radius"][-1],
+                                   fused_star.properties["radius"][-1],
+                                   rtol=1e-4)
+        for column in SURFACE:
+            np.testing.assert_allclose(
+                batch_star.properties[column].data(0)[-1],
+                fused_star.properties[column].data(0)[-1], rtol=1e-4)
+
+
+@pytest.mark.parametrize("core, cent_densities, cent_temperature", STARS)
+def test_profile_matches_fused_fehlberg(core, cent_densities,
+                                        cent_temperature):
+    batch = solve_batch(cent_densities, cent_temperature, core)
+    fused = solve_fused(cent_densities, cent_temperature, core)
+
+    for batch_star, fused_star in zip(batch, fused):
+        assert batch_star.points == fused_star.points
+        np.testing.assert_allclose(batch_star.properties["radius"],
+                                   fused_star.properties["radius"],
+                                   rtol=1e-8)
+        for column in starprop.DE_ORDER[1:]:
+            np.testing.assert_allclose(
+                batch_star.properties[column].data(0),
+                fused_star.properties[column].data(0), rtol=1e-6)
+
+
+def test_independent_of_batch():
+    alone, = solve_batch([2e10], 1e8, "Helium", tableau="dop853")
+    shared = solve_batch([7e9, 2e10, 5e9, 1e10], 1e8, "Helium",
+                         tableau="dop853")[1]
+
+    np.testing.assert_array_equal(alone.properties["radius"],
+                                  shared.properties["radius"])
+    for column in starprop.DE_ORDER:
+        np.testing.assert_array_equal(alone.properties[column].data(0),
+                                      shared.properties[column].data(0))
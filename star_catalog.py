@@ -0,0 +1,248 @@
+"""
+Catalog of the stars saved in Star_Files with one summary row per star, so
+the HR and mass-radius diagrams only need the catalog instead of every
+profile. Rows are added as make_star saves stars, and refresh re-reads
+only the files that changed since the catalog last saw them.
+"""
+import os
+import sqlite3
+from contextlib import contextmanager
+from multiprocessing import Pool
+import Use_Data as data
+
+# Columns of the catalog after the file name and modification time
+SUMMARY = [
+    "central_temperature", "central_density", "core", "type", "temperature",
+    "luminosity", "radius", "mass", "points"
+]
+
+
+def name_fields(name):
+    """
+    Gets the core and star type from a star name like
+    Tc_1.54e+07_rhoc_guess7.00e+05_Core_Hydrogen_Type_MS
+
+    Returns:
+        (tuple): core and type, "" for any that are missing
+    """
+    fields = name.split("_")
+    core = fields[fields.index("Core") + 1] if "Core" in fields[:-1] else ""
+    kind = fields[fields.index("Type") + 1] if "Type" in fields[:-1] else ""
+    return core, kind
+
+
+def summary_row(first, last, points, name, core=None):
+    """
+    Builds a catalog summary from the first and last rows of a profile
+
+    Args:
+        first, last (dict): Column name to value at the centre and surface
+        points (int): Number of rows in the profile
+        name (str): Star name, used for the core and type
+        core (str): Core type if known, otherwise taken from the name
+
+    Returns:
+        (dict): Value of every SUMMARY column
+    """
+    name_core, kind = name_fields(name)
+    return {
+        "central_temperature": first["temperature"],
+        "central_density": first["density"],
+        "core": name_core if core is None else core,
+        "type": kind,
+        "temperature": last["temperature"],
+        "luminosity": last["luminosity"],
+        "radius": last["radius"],
+        "mass": last["mass"],
+        "points": points
+    }
+
+
+def summarize(filepath):
+    """
+    Reads the summary of a star file from its first and last rows only
+
+    Returns:
+        (dict): Value of every SUMMARY column
+    """
+    name = os.path.basename(filepath).rsplit(".", 1)[0]
+    columns = ["radius", "temperature", "density", "luminosity", "mass"]
+    first, header = data.read_columns(filepath, columns, "first")
+    last, header = data.read_columns(filepath, columns, "last")
+
+    core = None
+    if filepath.endswith(".star"):
+        description = data.bin_header(filepath)
+        points = description["rows"]
+        core = description["metadata"].get("parameters", {}).get("core")
+    else:
+        # Count lines in blocks, every line but the header is a row
+        points = -1
+        with open(filepath, "rb") as text_file:
+            for block in iter(lambda: text_file.read(1 << 20), b""):
+                points += block.count(b"\n")
+
+    return summary_row(dict(zip(header, first[:, 0])),
+                       dict(zip(header, last[:, 0])), points, name, core)
+
+
+class StarCatalog:
+    """
+    SQLite table with one summary row per star file in a folder. Like the
+    StarIndex every call opens its own connection so pool workers can add
+    stars at the same time.
+    """
+
+    def __init__(self, folder="Star_Files", path=None):
+        """
+        Args:
+            folder (str): Folder of star files the catalog describes
+            path (str): Location of the SQLite file, star_catalog.sqlite in
+                folder by default
+        """
+        self.folder = folder
+        self.path = folder + "/star_catalog.sqlite" if path is None else path
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+        with self.connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS stars (
+                    name TEXT PRIMARY KEY,
+                    file TEXT,
+                    mtime REAL,
+                    central_temperature REAL,
+                    central_density REAL,
+                    core TEXT,
+                    type TEXT,
+                    temperature REAL,
+                    luminosity REAL,
+                    radius REAL,
+                    mass REAL,
+                    points INTEGER)""")
+
+    @contextmanager
+    def connect(self):
+        """
+        Opens a new connection that waits on other writers. It commits if
+        the block succeeds, rolls back if not, and is always closed.
+        """
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def add(self, file, summary, mtime=None):
+        """
+        Adds or replaces the row of a star. Rows added without a modification
+        time are trusted the next time refresh sees their file.
+
+        Args:
+            file (str): Name of the star file inside the folder
+            summary (dict): Value of every SUMMARY column
+            mtime (float): Modification time of the file when summarized
+        """
+        self.add_rows([(file, summary, mtime)])
+
+    def add_rows(self, rows):
+        """
+        Adds or replaces many (file, summary, mtime) rows in one transaction
+        """
+        with self.connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO stars VALUES ({})".format(
+                    ",".join("?" * (len(SUMMARY) + 3))),
+                [(file.rsplit(".", 1)[0], file, mtime) +
+                 tuple(summary[item] for item in SUMMARY)
+                 for file, summary, mtime in rows])
+
+    def add_profile(self, file, array2D, header):
+        """
+        Adds a star straight from the profile make_star is saving, so the
+        file does not have to be read back
+
+        Args:
+            file (str): Name the star file is saved as inside the folder
+            array2D (list): Saved columns
+            header (list): Name of each column
+        """
+        first = {item: float(column[0]) for item, column in
+                 zip(header, array2D)}
+        last = {item: float(column[-1]) for item, column in
+                zip(header, array2D)}
+        self.add(file, summary_row(first, last, len(array2D[0]),
+                                   file.rsplit(".", 1)[0]))
+
+    def refresh(self, processes=None):
+        """
+        Brings the catalog up to date with the folder. Only new and changed
+        files are read, in parallel when there are many of them, and rows
+        of deleted files are dropped.
+
+        Args:
+            processes (int): Number of worker processes, all cores if None
+
+        Returns:
+            (int): Number of files that were read
+        """
+        with self.connect() as connection:
+            known = {
+                name: (file, mtime)
+                for name, file, mtime in connection.execute(
+                    "SELECT name, file, mtime FROM stars")
+            }
+
+        files = data.star_files(self.folder)
+        stale = []
+        trusted = []
+        for file in files:
+            mtime = os.stat(self.folder + "/" + file).st_mtime
+            name = file.rsplit(".", 1)[0]
+            if name in known and known[name][0] == file:
+                if known[name][1] is None:
+                    trusted.append((mtime, name))
+                    continue
+                if known[name][1] == mtime:
+                    continue
+            stale.append((file, mtime))
+
+        paths = [self.folder + "/" + file for file, mtime in stale]
+        if len(paths) > 8:
+            with Pool(processes) as pool:
+                summaries = pool.map(summarize, paths)
+        else:
+            summaries = [summarize(path) for path in paths]
+
+        self.add_rows([(file, summary, mtime) for (file, mtime), summary in
+                       zip(stale, summaries)])
+
+        names = set(file.rsplit(".", 1)[0] for file in files)
+        with self.connect() as connection:
+            connection.executemany("UPDATE stars SET mtime = ? WHERE name = ?",
+                                   trusted)
+            connection.executemany("DELETE FROM stars WHERE name = ?",
+                                   [(name, ) for name in known
+                                    if name not in names])
+
+        return len(stale)
+
+    def select(self, columns):
+        """
+        Gets some columns of every star in the catalog
+
+        Args:
+            columns (list): Names of SUMMARY columns
+
+        Returns:
+            (list): One tuple of values per star, ordered by name
+        """
+        for item in columns:
+            if item not in SUMMARY:
+                raise ValueError("No catalog column " + item)
+
+        with self.connect() as connection:
+            return connection.execute(
+                "SELECT {} FROM stars ORDER BY name".format(
+                    ", ".join(columns))).fetchall()
@@ -0,0 +1,122 @@
+"""
+On disk index of converged stars. It remembers the central density each
+star converged to so later runs can start their root search from a tight
+bracket around their neighbours instead of the full density range.
+"""
+import sqlite3
+from contextlib import contextmanager
+import numpy as np
+from pathlib import Path
+
+
+class StarIndex:
+    """
+    SQLite backed table of solved stars keyed by central temperature, core
+    type and composition. Every call opens its own connection so pool
+    workers can read and append to the same file at the same time.
+    """
+
+    def __init__(self, path="Star_Files/star_index.sqlite"):
+        """
+        Opens the index at path, creating it if needed
+
+        Args:
+            path (str): Location of the SQLite file
+        """
+        self.path = str(path)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+
+        with self.connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS stars (
+                    central_temperature REAL,
+                    core TEXT,
+                    X REAL,
+                    Y REAL,
+                    Z REAL,
+                    Xc REAL,
+                    rho_c REAL,
+                    error REAL,
+                    success INTEGER,
+                    name TEXT,
+                    PRIMARY KEY (central_temperature, core, X, Y, Z, Xc))""")
+
+    @contextmanager
+    def connect(self):
+        """
+        Opens a new connection that waits on other writers. It commits if
+        the block succeeds, rolls back if not, and is always closed.
+        """
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def add(self, central_temperature, core, rho_c, error, success, name="",
+            X=0.70, Y=0.28, Z=0.02, Xc=0.004):
+        """
+        Records the converged central density of a star, replacing any
+        earlier entry with the same key
+        """
+        with self.connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO stars VALUES (?,?,?,?,?,?,?,?,?,?)",
+                (float(central_temperature), core, float(X), float(Y),
+                 float(Z), float(Xc), float(rho_c), float(error),
+                 int(bool(success)), name))
+
+    def nearest(self, central_temperature, core, X=0.70, Y=0.28, Z=0.02,
+                Xc=0.004, count=2):
+        """
+        Finds the successfully solved stars with the same core and
+        composition whose central temperatures are closest in log
+
+        Returns:
+            (list): Up to count (central_temperature, rho_c) pairs, nearest first
+        """
+        with self.connect() as connection:
+            rows = connection.execute(
+                """SELECT central_temperature, rho_c FROM stars
+                   WHERE core = ? AND success = 1 AND abs(X - ?) < 1e-9
+                   AND abs(Y - ?) < 1e-9 AND abs(Z - ?) < 1e-9
+                   AND abs(Xc - ?) < 1e-9""",
+                (core, X, Y, Z, Xc)).fetchall()
+
+        log_temp = np.log(central_temperature)
+        rows.sort(key=lambda row: abs(np.log(row[0]) - log_temp))
+        return rows[:count]
+
+    def bracket(self, central_temperature, core, X=0.70, Y=0.28, Z=0.02,
+                Xc=0.004, margin=1.5):
+        """
+        Builds a starting guess and bracket for rho_c from the neighbours of
+        a star. Two neighbours on either side are interpolated in log-log,
+        otherwise the nearest one is used. The bracket spans every
+        neighbour's rho_c widened by margin.
+
+        Returns:
+            (tuple or None): (guess, low, high) central densities, or None
+                when the index has no neighbours
+        """
+        neighbours = self.nearest(central_temperature, core, X, Y, Z, Xc)
+        if not neighbours:
+            return None
+
+        log_temp = np.log(central_temperature)
+        log_temps = np.log([row[0] for row in neighbours])
+        log_rhos = np.log([row[1] for row in neighbours])
+
+        if len(neighbours) == 2 and (log_temps[0] - log_temp) * (
+                log_temps[1] - log_temp) < 0:
+            log_guess = np.interp(log_temp, np.sort(log_temps),
+                                  log_rhos[np.argsort(log_temps)])
+        else:
+            log_guess = log_rhos[0]
+
+        spread = np.max(np.abs(log_rhos - log_guess)) + np.log(margin)
+
+        return (np.exp(log_guess), np.exp(log_guess - spread),
+                np.exp(log_guess + spread))
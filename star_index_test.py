@@ -0,0 +1,50 @@
+"""
+Checks StarIndex brackets a star from its solved neighbours
+"""
+import numpy as np
+import pytest
+from star_index import StarIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = StarIndex(tmp_path / "index.sqlite")
+    # rho_c = T**2 / 1e8 along a line in log-log
+    for temperature in [1e7, 2e7, 4e7]:
+        index.add(temperature, "Hydrogen", temperature**2 / 1e8, 1e-4, True)
+    index.add(3e7, "Hydrogen", 1.0, 0.5, False)
+    index.add(2e7, "Helium", 5e6, 1e-4, True)
+    return index
+
+
+def test_empty(index):
+    assert index.bracket(1.5e7, "Carbon") is None
+    assert index.bracket(1.5e7, "Hydrogen", X=0.5) is None
+
+
+def test_interpolates_between_neighbours(index):
+    guess, low, high = index.bracket(np.sqrt(2) * 1e7, "Hydrogen")
+
+    # Neighbours at 1e7 and 2e7, the bracket spans both widened by margin
+    assert guess == pytest.approx(2e6)
+    assert low == pytest.approx(1e6 / 1.5)
+    assert high == pytest.approx(4e6 * 1.5)
+
+
+def test_nearest_outside(index):
+    guess, low, high = index.bracket(8e7, "Hydrogen")
+
+    # The failed star at 3e7 is never a neighbour
+    assert guess == pytest.approx(16e6)
+    assert low == pytest.approx(4e6 / 1.5)
+    assert high == pytest.approx(16e6 * 4 * 1.5)
+
+
+def test_single_neighbour(index):
+    guess, low, high = index.bracket(1e7, "Helium", margin=2)
+    assert (guess, low, high) == pytest.approx((5e6, 2.5e6, 1e7))
+
+
+def test_replaces(index):
+    index.add(2e7, "Helium", 6e6, 1e-5, True, name="again")
+    assert index.nearest(2e7, "Helium") == [(2e7, 6e6)]
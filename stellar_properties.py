@@ -1,10 +1,18 @@
 """
 Class defining a star and it's various differential equations.
 """
+import json
+import os
+import time
+from functools import partial
 import numpy as np
 import math
 import desolver as de
+import jit_step
+import physics_tables
 import regular_equation as re
+from column_buffer import ColumnBuffer
+from profiler import StarProfile
 
 # m/s^2
 C = 2.98 * 10**8
@@ -22,6 +30,215 @@ Kb = 1.381 * 10**-23
 a = 7.566 * 10**-16
 sigma = 5.67e-8  # W/m^2 * K^-4
 
+# Order of the differential equations in a state vector and of the
+# regular equations returned by the fused kernel
+DE_ORDER = ['opticaldepth', 'temperature', 'density', 'luminosity', 'mass']
+EQ_ORDER = [
+    "k_es", "k_ff", "k_h", "opacity", "pressure", "pressure_temp_grad",
+    "pressure_density_grad", "energy_pp", "energy_cno", "energy_He",
+    "energy_C", "energygen"
+]
+
+# Step sizes in ln r to use with variable="log_radius" in place of the
+# step_size, min_step and max_step defaults, which are in metres
+LOG_RADIUS_STEPS = {"step_size": 0.1, "min_step": 1e-10, "max_step": 0.1}
+
+# Steps in ln r are not held back by the point cap, so a trial that never
+# reaches a surface is stopped as unsuccessful once it is larger or heavier
+# than any star
+MAX_RADIUS = 1e13  # m, about 14000 solar radii
+MAX_MASS = 1e33  # kg, about 500 solar masses
+
+
+def physics_constants(X, Y, Z, Xc):
+    """
+    Composition dependent constants of make_physics
+
+    Returns:
+        (tuple): deg_p, deg_dp, gas, rad_p, rad_dp, ff, hm, pp, cno, he, cc
+    """
+    mu = (2 * X + 0.75 * Y + 0.5 * Z)**-1
+
+    deg_p = (3 * np.pi**2)**(2 / 3) * HBAR**2 / (5 * Me * Mp**(5 / 3))
+    deg_dp = (3 * np.pi**2)**(2 / 3) * HBAR**2 / (3 * Me * Mp**(5 / 3))
+    gas = Kb / (mu * Mp)
+    rad_p = a / 3
+    rad_dp = 4 * a / 3
+
+    ff = 1e24 * (Z + 0.0001)
+    hm = 2.5e-32 * (Z / 0.02)
+
+    pp = 1.07e-7 * X**2
+    cno = 8.24e-26 * 0.03 * X**2
+    he = 3.85e-8 * Y**3
+    cc = 5.0e4 * Xc**2
+
+    return deg_p, deg_dp, gas, rad_p, rad_dp, ff, hm, pp, cno, he, cc
+
+
+def kernel_constants(X, gamma=5 / 3):
+    """
+    Constants make_structure_kernel adds on top of physics_constants
+
+    Returns:
+        (tuple): k_es, four_pi, rad_grad, conv_grad
+    """
+    k_es = 0.02 * (1 + X)
+    four_pi = 4 * np.pi
+    rad_grad = 3 / (64 * np.pi * sigma)
+    conv_grad = (1 - 1 / gamma) * G
+    return k_es, four_pi, rad_grad, conv_grad
+
+
+def make_physics(X, Y, Z, Xc):
+    """
+    Builds the equation of state, opacity and energy generation of one
+    composition as a function of density and temperature alone, which is
+    what physics_tables tabulates.
+
+    Args:
+        X, Y, Z, Xc (float or nd.array): Composition fractions
+
+    Returns:
+        (function rho, T: tuple): Quantities ordered as
+            physics_tables.QUANTITIES
+    """
+    (deg_p, deg_dp, gas, rad_p, rad_dp, ff, hm, pp, cno, he,
+     cc) = physics_constants(X, Y, Z, Xc)
+
+    def physics(rho, T):
+        rho_3 = rho / 1e3
+        rho_5 = rho / 1e5
+        T_6 = T / 1e6
+
+        k_ff = ff * rho_3**0.7 * T**-3.5
+        k_h = hm * rho_3**0.5 * T**9
+
+        rho_23 = rho**(2 / 3)
+        pressure = deg_p * rho_23 * rho + gas * rho * T + rad_p * T**4
+        pressure_temp_grad = gas * rho + rad_dp * T**3
+        pressure_density_grad = deg_dp * rho_23 + gas * T
+
+        energy_pp = pp * rho_5 * T_6**4
+        energy_cno = cno * rho_5 * T_6**19.9
+        energy_He = he * rho_5**2 * (T / 1e8)**44
+        energy_C = cc * rho_5 * (T / 1e9)**30
+
+        return (k_ff, k_h, pressure, pressure_temp_grad,
+                pressure_density_grad, energy_pp, energy_cno, energy_He,
+                energy_C)
+
+    return physics
+
+
+def make_structure_kernel(X, Y, Z, Xc, core, gamma=5 / 3, fmin=min, fmax=max,
+                          physics=None):
+    """
+    Builds a single function that evaluates the equation of state, opacity,
+    energy generation and all five stellar structure derivatives in one
+    pass. Composition dependent constants are folded in ahead of time so
+    the returned function only does the arithmetic that depends on the state.
+
+    Args:
+        X, Y, Z, Xc (float or nd.array): Composition fractions
+        core (str or list): One of "Hydrogen", "Helium", "Carbon", or one
+            per star when the kernel is used for arrays of stars
+        gamma (float): Adiabatic index
+        fmin, fmax (callable): Elementwise min and max. The builtins work for
+            a single star, np.minimum and np.maximum for arrays of stars.
+        physics (function rho, T: tuple): Replaces make_physics, e.g. with
+            physics_tables.PhysicsTables
+
+    Returns:
+        (function r, y: (derivs, eqs)): y is ordered as DE_ORDER, derivs is
+            a tuple in the same order and eqs a tuple ordered as EQ_ORDER
+    """
+    if physics is None:
+        physics = make_physics(X, Y, Z, Xc)
+
+    k_es, four_pi, rad_grad, conv_grad = kernel_constants(X, gamma)
+
+    if isinstance(core, str):
+        core_energy = {
+            "Hydrogen": lambda pp, cno, He, C: pp + cno,
+            "Helium": lambda pp, cno, He, C: He,
+            "Carbon": lambda pp, cno, He, C: C,
+        }[core]
+    else:
+        is_h = np.asarray(core) == "Hydrogen"
+        is_he = np.asarray(core) == "Helium"
+        core_energy = lambda pp, cno, He, C: np.where(
+            is_h, pp + cno, np.where(is_he, He, C))
+
+    def kernel(r, y):
+        tau, T, rho, L, M = y
+
+        (k_ff, k_h, pressure, pressure_temp_grad, pressure_density_grad,
+         energy_pp, energy_cno, energy_He, energy_C) = physics(rho, T)
+        k_bf = fmax(k_es, k_ff)
+        opacity = k_h * k_bf / (k_h + k_bf)
+        energygen = core_energy(energy_pp, energy_cno, energy_He, energy_C)
+
+        r2 = r * r
+        dtau = opacity * rho
+        dT = -fmin(rad_grad * opacity * rho * L / (r2 * T**3),
+                   conv_grad * T * M * rho / (pressure * r2))
+        drho = -(G * M * rho / r2 + pressure_temp_grad * dT) / pressure_density_grad
+        dL = four_pi * r2 * rho * energygen
+        dM = four_pi * r2 * rho
+
+        return ((dtau, dT, drho, dL, dM),
+                (k_es, k_ff, k_h, opacity, pressure, pressure_temp_grad,
+                 pressure_density_grad, energy_pp, energy_cno, energy_He,
+                 energy_C, energygen))
+
+    return kernel
+
+
+def check_options(engine, variable="radius", table_tolerance=None, jit=False,
+                  output_radii=None):
+    """
+    Checks that the options of a Star, StarBatch or make_star run work with
+    the engine, so every entry point rejects the same combinations
+
+    Args:
+        engine (str): One of "object", "fused", "rosenbrock", or "batch"
+            for make_star
+        variable, table_tolerance, jit, output_radii: As given to Star
+
+    Raises:
+        ValueError: For options the engine can't use
+    """
+    state_engines = ["fused", "rosenbrock", "batch"]
+    if variable != "radius" and engine not in state_engines:
+        raise ValueError("variable {} needs the fused, rosenbrock or batch "
+                         "engine".format(variable))
+    if table_tolerance is not None and engine not in state_engines:
+        raise ValueError("table_tolerance needs the fused, rosenbrock or "
+                         "batch engine")
+    if jit and engine != "fused":
+        raise ValueError("jit needs the fused engine")
+    if jit and table_tolerance is not None:
+        raise ValueError("jit can't be used with table_tolerance")
+    if output_radii is not None and engine == "batch":
+        raise ValueError("output_radii needs a Star engine, StarBatch "
+                         "stores every step")
+
+
+def load_physics_tables(X, Y, Z, Xc, tolerance, folder=None):
+    """
+    Tables of make_physics for one composition, see
+    physics_tables.load_tables
+
+    Returns:
+        (physics_tables.PhysicsTables): Tables within tolerance
+    """
+    composition = {"X": X, "Y": Y, "Z": Z, "Xc": Xc}
+    return physics_tables.load_tables(
+        make_physics(X, Y, Z, Xc),
+        {key: float(value) for key, value in composition.items()},
+        tolerance, folder)
+
 
 class Star:
     """
@@ -57,10 +274,69 @@ class Star:
             min_step=0.001,
             core="Hydrogen",
             #core is one of "Hydrogen", "Helium", "Carbon"
-            name="Generic Star"):
+            name="Generic Star",
+            engine="object",
+            tableau="fehlberg",
+            controller="elementary",
+            abs_tolerance=0,
+            variable="radius",
+            table_tolerance=None,
+            table_folder=None,
+            jit=False,
+            output_radii=None,
+            checkpoint=None,
+            checkpoint_every=500,
+            profile=False):
         """
         Initializes star by deffining the equations that make up
-        it's stellar structures, and their differential equations"""
+        it's stellar structures, and their differential equations
+
+        Args:
+            X, Y, Z, Xc (float): Composition fractions
+            cent_density (float): Central density
+            cent_opticaldepth (float): Central optical depth
+            cent_temperature (float): Central temperature
+            cent_radii (float): Radius the integration starts at, in m
+            step_size (float): First step size
+            error_thresh (float): Largest relative error of an accepted step
+            max_step, min_step (float): Bounds of the step size
+            core (str): One of "Hydrogen", "Helium", "Carbon"
+            name (str): Name of the star
+            engine (str): "object" steps every equation as its own object,
+                "fused" steps one state vector with the structure kernel and
+                "rosenbrock" takes linearly implicit steps. The steps of
+                every engine are mostly held at max_step rather than by
+                stiffness, so rosenbrock takes more steps than fused and
+                doesn't finish stars that fused can't.
+            tableau (str): Embedded Runge-Kutta method of the object and
+                fused engines, a key of desolver.TABLEAUS
+            controller (str): "elementary", or "pi" which accepts a step
+                when the error of every DE is at most abs_tolerance +
+                error_thresh * |value| and sets the next step from this
+                error and the last accepted one
+            abs_tolerance (float or list): Absolute tolerance of the pi
+                controller, one value or one per DE
+            variable (str): "radius", or "log_radius" to step the fused and
+                rosenbrock engines in ln r. step_size, min_step and
+                max_step are then in ln r (see LOG_RADIUS_STEPS).
+            table_tolerance (float): Relative error to interpolate the
+                equation of state, opacity and energy generation from
+                physics_tables within, or None to evaluate them directly
+            table_folder (str): Folder the physics tables are kept in
+            jit (bool): Take each fused step with one call compiled by Numba
+                (see jit_step). Without Numba the uncompiled fused engine is
+                used, it gives the same results.
+            output_radii (list): Only store the centre, these radii and the
+                surface, interpolated from the steps that pass over them
+            checkpoint (str): File the integration is saved to every
+                checkpoint_every steps. A star made with the same parameters
+                and checkpoint carries on from the saved step.
+            checkpoint_every (int): Steps between checkpoints
+            profile (bool): Count the steps and time taken in self.profile
+
+        Raises:
+            ValueError: For options the engine can't use, see check_options
+        """
 
         self.name = name
         self.step_size = step_size
@@ -78,6 +354,18 @@ class Star:
         self.Z = Z
         self.mu = (2 * X + 0.75 * Y + 0.5 * Z)**-1
         self.core = core
+        self.engine = engine
+        self.tableau = de.TABLEAUS[tableau]
+        if engine == "batch":
+            raise ValueError("The batch engine is StarBatch, not Star")
+        check_options(engine, variable, table_tolerance, jit, output_radii)
+        self.variable = variable
+        self.table_tolerance = table_tolerance
+        self.physics = None
+        if table_tolerance is not None:
+            self.physics = load_physics_tables(X, Y, Z, Xc, table_tolerance,
+                                               table_folder)
+        self.jit = jit and jit_step.JIT_AVAILABLE
         self.properties = {
             "opacity": re.Equation("Opacity"),
             "k_es": re.Equation("Electron Scattering Opacity"),
@@ -91,11 +379,11 @@ class Star:
             "energy_cno": re.Equation("CNO Cycle Energy Generation"),
             "energy_He": re.Equation("Helium Energy Generation"),
             "energy_C": re.Equation("CNO Cycle Energy Generation"),
-            "density": de.RungeKutta("Density"),
-            "temperature": de.RungeKutta("Temperature"),
-            "mass": de.RungeKutta("Mass"),
-            "luminosity": de.RungeKutta("Luminosity"),
-            "opticaldepth": de.RungeKutta("Optical Depth"),
+            "density": de.RungeKutta("Density", self.tableau),
+            "temperature": de.RungeKutta("Temperature", self.tableau),
+            "mass": de.RungeKutta("Mass", self.tableau),
+            "luminosity": de.RungeKutta("Luminosity", self.tableau),
+            "opticaldepth": de.RungeKutta("Optical Depth", self.tableau),
             "radius": np.array([cent_radii]),
             "radii": cent_radii,
             "gamma": 5 / 3,
@@ -109,13 +397,67 @@ class Star:
             "pressure_density_grad", "energy_pp", "energy_cno", "energy_He",
             "energy_C", "energygen"
         ]
+        self.radius_buffer = ColumnBuffer([cent_radii])
+        self.points = 1
         self.error = [0, 0, 0, 0, 0, 0]
         self.error_thresh = error_thresh
+        self.controller = controller
+        self.abs_tolerance = np.broadcast_to(
+            np.asarray(abs_tolerance, dtype=float), (5, )).copy()
+        self.previous_error = 1e-4
+        self.after_rejection = False
+        self.stalled = False
+        self.profile = StarProfile() if profile else None
 
         self.setup_stellar_equations()
         self.setup_boundary_conditions()
         self.step_non_de()
 
+        self.array_kernel = make_structure_kernel(
+            X, Y, Z, Xc, core, self.properties['gamma'], np.minimum,
+            np.maximum, self.physics)
+
+        self.output_radii = output_radii
+        if self.output_radii is not None:
+            self.output_radii = np.sort(np.asarray(output_radii, dtype=float))
+            for item in self.de_list + self.eq_list:
+                self.properties[item].store_steps = False
+            # Radius, values and derivatives of the DEs at every accepted
+            # step, so the surface can still be found and stored at the end
+            self.step_history = ColumnBuffer(self.history_column()[:, None])
+
+        # Order of the error estimate, which sets how the step size reacts
+        # to the error
+        self.error_order = self.tableau.error_order
+        if self.engine == "rosenbrock":
+            self.error_order = 3
+
+        self.tolerance = None
+        if self.controller == "pi":
+            self.tolerance = (self.abs_tolerance, self.error_thresh)
+            for index, item in enumerate(self.de_list):
+                self.properties[item].tolerance = (self.abs_tolerance[index],
+                                                   self.error_thresh)
+        if self.engine in ["fused", "rosenbrock"]:
+            self.kernel = make_structure_kernel(X, Y, Z, Xc, core,
+                                                self.properties['gamma'],
+                                                physics=self.physics)
+            self.state = np.array(
+                [self.properties[item].now(0) for item in self.de_list])
+            # Derivatives at self.state once a step has evaluated them
+            self.first_stage = None
+        if self.jit:
+            self.compiled_step = jit_step.make_compiled_step(
+                physics_constants(X, Y, Z, Xc) +
+                kernel_constants(X, self.properties['gamma']) + (G, ),
+                core, self.tableau, self.tolerance,
+                variable == "log_radius")
+
+        self.checkpoint = checkpoint
+        self.checkpoint_every = checkpoint_every
+        if self.checkpoint is not None and os.path.exists(self.checkpoint):
+            self.load_checkpoint()
+
     def setup_stellar_equations(self):
         """
         Assigns the stellar properties their differential equation.
@@ -250,10 +592,16 @@ class Star:
         on differential equations and can be calculated dirrectly.
         """
 
+        if self.profile is not None:
+            start = time.perf_counter()
+
         for equation in self.eq_list:
             self.properties[equation].solve_step(
                 self.properties, auto_add=auto_add)
 
+        if self.profile is not None:
+            self.profile.add_time("non_de", start)
+
     def step_de(self):
         """
         Solves the current steps for all the Differential Equations,
@@ -263,14 +611,26 @@ class Star:
         very quickly and so their coupled relationship requires that
         they all use the same input values.
         """
-        radius = self.properties['radius'][-1]
+        if self.engine == "fused":
+            self.step_de_fused()
+            return
+        if self.engine == "rosenbrock":
+            self.step_de_rosenbrock()
+            return
+
+        radius = self.properties['radii']
         nan_problem = False
 
-        for kutta_const in range(6):
+        # Every step after the first starts from derivatives evaluated at
+        # the end of the step before, with the equations solved there
+        reuse_first = self.points > 1
+
+        for kutta_const in range(self.tableau.stages):
 
             for item in self.de_list:
                 self.properties[item].solve_runge_kutta_const(
-                    radius, self.step_size, self.properties, kutta_const)
+                    radius, self.step_size, self.properties, kutta_const,
+                    reuse_first)
 
             self.de_use_intermediate()
             self.step_non_de(auto_add=False)
@@ -278,32 +638,198 @@ class Star:
 
         for item in self.de_list:
             self.properties[item].solve_rk_step()
-            self.properties[item].solve_de_value(radius, self.step_size,
-                                                 self.properties)
 
         for index, item in enumerate(self.de_list):
             self.error[index] = self.properties[item].error
 
+        if self.profile is not None:
+            self.profile.count("rhs_evaluations",
+                               self.tableau.stages - reuse_first)
 
-        if max(self.error) <= self.error_thresh:
+        if self.step_accepted():
+            if self.profile is not None:
+                self.profile.count("rhs_evaluations")
+                self.profile.count("accepted_steps")
+                self.profile.add_step(self.step_size)
 
-            self.properties['radius'] = np.append(
-                self.properties['radius'],
-                self.properties['radius'][-1] + self.step_size)
+            self.add_radius(radius + self.step_size)
             for item in self.de_list:
-                self.properties[item].add_differential_step()
-                self.properties['radii'] = self.properties['radius'][-1]
-
+                self.properties[item].use_step()
             self.step_non_de(auto_add=True)
-            if max(self.error) < 0.1 * self.error_thresh:
+
+            # The derivatives at the new point are also the first stage of
+            # the next step
+            for item in self.de_list:
+                self.properties[item].solve_de_value(radius, self.step_size,
+                                                     self.properties)
+                self.properties[item].add_differential_step()
+            self.add_output_points(radius, radius + self.step_size)
+            if self.controller == "pi" or max(
+                    self.error) < 0.1 * self.error_thresh:
                 self.adjust_step_size()
 
         else:
-            self.adjust_step_size()
+            if self.profile is not None:
+                self.profile.count("rejected_steps")
+            self.adjust_step_size(accepted=False)
             for item in self.de_list:
                 self.properties[item].use_original()
-            for item in self.eq_list:
-                self.properties[item].use_original()
+            # The equations only hold the previous stage, so they are
+            # solved again at the start of the step
+            self.step_non_de(auto_add=False)
+            self.eq_use_intermediate()
+
+    def to_radius(self, x):
+        """
+        Radius at a value of the independent variable
+        """
+        if self.variable == "log_radius":
+            return float(np.exp(x))
+        return x
+
+    def position(self):
+        """
+        Independent variable at the current radius
+        """
+        if self.variable == "log_radius":
+            return float(np.log(self.properties['radii']))
+        return self.properties['radii']
+
+    def state_derivs(self, x, state, outputs=None):
+        """
+        Derivatives of a state vector with respect to the independent
+        variable from the fused kernel. Negative values a trial stage
+        overshoots to are clipped to zero.
+
+        Args:
+            x (float): Independent variable
+            state (nd.array): DE values
+            outputs (list): If given the kernel output is added to it
+        """
+        radius = self.to_radius(x)
+        output = self.kernel(radius, np.maximum(state, 0))
+        if outputs is not None:
+            outputs.append(output)
+
+        derivs = np.array(output[0])
+        if self.variable == "log_radius":
+            derivs = radius * derivs
+        return derivs
+
+    def step_de_fused(self):
+        """
+        Same embedded Runge-Kutta step as step_de but done on a single
+        state vector with the fused structure kernel. Every stage sees
+        one consistent set of DE values, so the equations are only
+        evaluated through the properties once the step is accepted.
+        """
+        x = self.position()
+        h = self.step_size
+
+        # A first same as last tableau evaluates the kernel at the end of
+        # the step as its last stage, which is kept for the accepted step
+        outputs = []
+        if self.jit:
+            y_new, error, end_kernel = self.compiled_step(
+                x, self.state, h, self.first_stage)
+            outputs.append(end_kernel)
+        else:
+            y_new, error = self.tableau.step(
+                partial(self.state_derivs, outputs=outputs), x, self.state,
+                h, self.tolerance, self.first_stage)
+        self.error[:len(y_new)] = error.tolist()
+
+        if self.profile is not None:
+            self.profile.count(
+                "rhs_evaluations",
+                self.tableau.stages - (self.first_stage is not None))
+
+        self.finish_state_step(x, h, y_new,
+                               outputs[-1] if self.tableau.fsal else None)
+
+    def step_de_rosenbrock(self):
+        """
+        Takes a step of the fourth order Kaps-Rentrop Rosenbrock method,
+        with Shampine's parameters and a third order error estimate, on the
+        state vector.
+        The Jacobian of the fused kernel is formed numerically at the start
+        of every step, which costs six kernel calls on top of the three of
+        the step itself.
+        """
+        x = self.position()
+        h = self.step_size
+        y = self.state
+
+        f = self.first_stage
+        if f is None:
+            f = self.state_derivs(x, y)
+        jacobian, dfdx = de.numerical_jacobian(self.state_derivs, x, y, f)
+        y_new, error = de.rosenbrock_step(self.state_derivs, x, y, h,
+                                          jacobian, dfdx, f)
+        if self.tolerance is None:
+            scale = np.maximum(np.abs(y_new), np.finfo(float).tiny)
+        else:
+            scale = self.abs_tolerance + self.error_thresh * np.abs(y_new)
+        self.error[:len(y)] = (np.abs(error) / scale).tolist()
+
+        if self.profile is not None:
+            self.profile.count("rhs_evaluations",
+                               len(y) + 4 - (self.first_stage is not None))
+
+        self.finish_state_step(x, h, y_new)
+
+    def finish_state_step(self, x, h, y_new, end_kernel=None):
+        """
+        Accepts or rejects a step of the state vector engines based on
+        self.error. An accepted step is stored through the properties with
+        the equations solved by the fused kernel at the new state. Its
+        derivatives are kept as the first stage of the next step.
+
+        Args:
+            x (float): Independent variable at the start of the step
+            h (float): Length of the step
+            y_new (nd.array): State at the end of the step
+            end_kernel (tuple): Kernel output at y_new if it is already known
+        """
+        if self.step_accepted():
+            if self.profile is not None:
+                if end_kernel is None:
+                    self.profile.count("rhs_evaluations")
+                self.profile.count("accepted_steps")
+                self.profile.add_step(h)
+                start = time.perf_counter()
+
+            radius = self.properties['radii']
+            new_radius = self.to_radius(x + h)
+            self.state = np.maximum(y_new, 0)
+            self.add_radius(new_radius)
+
+            if end_kernel is None:
+                end_kernel = self.kernel(new_radius, self.state)
+            derivs, eqs = end_kernel
+            self.first_stage = np.array(derivs)
+            if self.variable == "log_radius":
+                self.first_stage = new_radius * self.first_stage
+            for index, item in enumerate(self.de_list):
+                self.properties[item].step = np.array(
+                    [self.state[index], derivs[index]])
+                self.properties[item].add_differential_step()
+            for index, item in enumerate(self.eq_list):
+                self.properties[item].step = eqs[index]
+                self.properties[item].add_step()
+            self.add_output_points(radius, new_radius)
+
+            if self.profile is not None:
+                self.profile.add_time("non_de", start)
+
+            if self.controller == "pi" or max(
+                    self.error) < 0.1 * self.error_thresh:
+                self.adjust_step_size()
+
+        else:
+            if self.profile is not None:
+                self.profile.count("rejected_steps")
+            self.adjust_step_size(accepted=False)
 
     def solve(self):
         """
@@ -312,19 +838,135 @@ class Star:
         """
 
         self.check_stop()
+        saved_points = self.points
 
         while self.run:
-            self.step_de()
+            if self.profile is not None:
+                start = time.perf_counter()
+                self.step_de()
+                self.profile.add_time("step_de", start)
+            else:
+                self.step_de()
             self.check_stop()
             if len(self.properties['radius']) % 2000 == 0:
                 pass
                 #print(self)
                 #print(self.name, self.dtau)
 
+            if (self.checkpoint is not None and self.run
+                    and self.points % self.checkpoint_every == 0
+                    and self.points != saved_points):
+                self.save_checkpoint()
+                saved_points = self.points
+
         self.remove_extra()
+
+        # A finished star doesn't need its checkpoint any more
+        if self.checkpoint is not None and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
         return self.success
 
+    def checkpoint_key(self):
+        """
+        Parameters a checkpoint has to match to be resumed by this star
+        """
+        output_radii = self.output_radii
+        if output_radii is not None:
+            output_radii = output_radii.tolist()
+
+        return json.dumps({
+            "X": self.X,
+            "Y": self.Y,
+            "Z": self.Z,
+            "Xc": self.Xc,
+            "cent_density": self.cent_density,
+            "cent_opticaldepth": self.cent_opticaldepth,
+            "cent_temperature": self.cent_temperature,
+            "cent_radii": self.cent_radii,
+            "error_thresh": self.error_thresh,
+            "max_step": self.max_step,
+            "min_step": self.min_step,
+            "core": self.core,
+            "engine": self.engine,
+            "tableau": self.tableau.name,
+            "controller": self.controller,
+            "abs_tolerance": self.abs_tolerance.tolist(),
+            "variable": self.variable,
+            "table_tolerance": self.table_tolerance,
+            "jit": self.jit,
+            "output_radii": output_radii
+        }, sort_keys=True)
+
+    def save_checkpoint(self):
+        """
+        Saves everything needed to carry on the integration from the last
+        step to the checkpoint file. It is written to a temporary file first
+        so a worker dying mid write leaves the last checkpoint intact.
+        """
+        arrays = {
+            "key": self.checkpoint_key(),
+            "radius": self.radius_buffer.view(),
+            "radii": self.properties['radii'],
+            "step_size": self.step_size,
+            "points": self.points,
+            "error": np.array(self.error, dtype=float),
+            "previous_error": self.previous_error,
+            "after_rejection": self.after_rejection
+        }
+        if self.output_radii is not None:
+            arrays["step_history"] = self.step_history.view()
+        for item in self.de_list + self.eq_list:
+            for attribute, value in self.properties[item].get_state().items():
+                arrays[item + "." + attribute] = value
+        if self.engine in ["fused", "rosenbrock"]:
+            arrays["state"] = self.state
+
+        temporary = self.checkpoint + ".tmp"
+        with open(temporary, "wb") as checkpoint_file:
+            np.savez(checkpoint_file, **arrays)
+        os.replace(temporary, self.checkpoint)
+
+    def load_checkpoint(self):
+        """
+        Carries on from the step saved in the checkpoint file, unless it was
+        saved by a star with other parameters
+
+        Returns:
+            (bool): Whether the checkpoint was loaded
+        """
+        with np.load(self.checkpoint) as saved:
+            if str(saved["key"]) != self.checkpoint_key():
+                print("Checkpoint", self.checkpoint,
+                      "is for another star, starting over")
+                return False
+
+            self.radius_buffer = ColumnBuffer(saved["radius"])
+            self.properties['radius'] = self.radius_buffer.view()
+            self.properties['radii'] = float(saved["radii"])
+            self.step_size = float(saved["step_size"])
+            self.points = int(saved["points"])
+            self.error = saved["error"].tolist()
+            self.previous_error = float(saved["previous_error"])
+            self.after_rejection = bool(saved["after_rejection"])
+            if self.output_radii is not None:
+                self.step_history = ColumnBuffer(saved["step_history"])
+
+            for item in self.de_list + self.eq_list:
+                prefix = item + "."
+                self.properties[item].set_state({
+                    name[len(prefix):]: saved[name]
+                    for name in saved.files if name.startswith(prefix)
+                })
+            if self.engine in ["fused", "rosenbrock"]:
+                self.state = saved["state"]
+
+        print("Resuming", self.name, "from step", self.points)
+        return True
+
     def remove_extra(self):
+        if self.output_radii is not None:
+            self.store_surface()
+            return
 
         tau_infinity = self.properties['opticaldepth'].now(0)
 
@@ -332,22 +974,165 @@ class Star:
         radius_index = np.argmin(tau_adjusted)
         total_length = len(tau_adjusted)
 
-        for item in self.eq_list:
-            self.properties[item].val = self.properties[item].val[:radius_index]
+        for item in self.eq_list + self.de_list:
+            self.properties[item].values.truncate(radius_index)
+
+        self.radius_buffer.truncate(radius_index)
+        self.properties['radius'] = self.radius_buffer.view()
+
+    def history_column(self):
+        """
+        Radius, DE values and DE derivatives at the current step
+        """
+        return np.array([self.properties['radii']] +
+                        [self.properties[item].now(0) for item in self.de_list] +
+                        [self.properties[item].now(1) for item in self.de_list],
+                        dtype=float)
+
+    def store_surface(self):
+        """
+        remove_extra for stars that only store output_radii. The photosphere
+        is found from every accepted step in the same way, the output radii
+        past it are dropped and the step at the photosphere is stored as the
+        last point.
+        """
+        history = self.step_history.view()
+        tau_infinity = self.properties['opticaldepth'].now(0)
+        tau_adjusted = abs((tau_infinity - history[1]) - (2 / 3))
+        surface = history[:, max(np.argmin(tau_adjusted) - 1, 0)]
+        radius = surface[0]
+        count = len(self.de_list)
+
+        keep = int(np.searchsorted(self.radius_buffer.view(), radius,
+                                   side="left"))
+        for item in self.eq_list + self.de_list:
+            self.properties[item].values.truncate(keep)
+        self.radius_buffer.truncate(keep)
+
+        state = surface[1:1 + count]
+        for index, item in enumerate(self.de_list):
+            self.properties[item].add_dense_steps(
+                np.array([[state[index]], [surface[1 + count + index]]]))
+        derivs, eqs = self.array_kernel(np.array([radius]), state[:, None])
+        for index, item in enumerate(self.eq_list):
+            self.properties[item].add_dense_steps(
+                np.broadcast_to(eqs[index], (1, )))
+
+        self.radius_buffer.append(radius)
+        self.properties['radius'] = self.radius_buffer.view()
+
+    def add_radius(self, radius):
+        """
+        Records the radius of a newly accepted step
+        """
+        self.points += 1
+        self.properties['radii'] = radius
+        if self.output_radii is None:
+            self.radius_buffer.append(radius)
+            self.properties['radius'] = self.radius_buffer.view()
+
+    def add_output_points(self, radius_start, radius_end):
+        """
+        Stores the requested output radii that the step from radius_start
+        to radius_end went over. Does nothing unless output_radii was given.
+        """
+        if self.output_radii is None:
+            return
+        self.step_history.append(self.history_column())
+
+        points = self.output_radii[np.searchsorted(
+            self.output_radii, radius_start, side="right"):np.searchsorted(
+                self.output_radii, radius_end, side="right")]
+        if not len(points):
+            return
+
+        states = []
+        for item in self.de_list:
+            steps = self.properties[item].dense_steps(radius_start, radius_end,
+                                                      points)
+            self.properties[item].add_dense_steps(steps)
+            states.append(steps[0])
+
+        derivs, eqs = self.array_kernel(points, np.array(states))
+        for index, item in enumerate(self.eq_list):
+            self.properties[item].add_dense_steps(
+                np.broadcast_to(eqs[index], points.shape))
+
+        for radius in points:
+            self.radius_buffer.append(radius)
+        self.properties['radius'] = self.radius_buffer.view()
+
+    def profile_at(self, radii):
+        """
+        Evaluates the star at any radii between its centre and surface.
+        Differential equations are interpolated between the stored steps and
+        the other equations are solved from the interpolated values.
+
+        Args:
+            radii (nd.array): Radii to evaluate at
+
+        Returns:
+            (dict): Array of values for every property, derivatives of the
+                differential equations are under "<name>_deriv"
+        """
+        radii = np.asarray(radii, dtype=float)
+        profile = {"radius": radii}
 
         for item in self.de_list:
-            self.properties[item].val = self.properties[item].val[:,:radius_index]
+            profile[item] = self.properties[item].data_at(
+                self.properties['radius'], radii, 0)
+            profile[item + "_deriv"] = self.properties[item].data_at(
+                self.properties['radius'], radii, 1)
+
+        with np.errstate(all="ignore"):
+            derivs, eqs = self.array_kernel(
+                radii, np.array([profile[item] for item in self.de_list]))
+        for index, item in enumerate(self.eq_list):
+            profile[item] = np.broadcast_to(eqs[index], radii.shape)
+
+        return profile
 
-        self.properties['radius'] = self.properties['radius'][:radius_index]
+    def error_norm(self):
+        """
+        Largest error on its tolerance over the DEs, used by the pi
+        controller. The step is good enough when this is at most one.
+        """
+        return float(max(self.error[:len(self.de_list)]))
 
-    def adjust_step_size(self):
+    def step_accepted(self):
+        """
+        Whether the step that was just taken is accurate enough to keep
+        """
+        if self.controller == "pi":
+            return self.error_norm() <= 1
+        return max(self.error) <= self.error_thresh
+
+    def adjust_step_size(self, accepted=True):
         """
         Uses a relatively quick, and smart way of adjusting the step size.
         Can increase or decrease depending on the threshold of the
-        ratio
-        """
+        ratio. The pi controller also remembers the error of the last
+        accepted step and whether the last step was rejected.
 
-        if max(self.error) == 0:
+        Args:
+            accepted (bool): Whether the step that was just taken was kept
+        """
+        # Trying a step rejected at min_step again gives the same error
+        if not accepted and self.step_size <= self.min_step:
+            self.stalled = True
+
+        if self.controller == "pi":
+            error = self.error_norm()
+            factor = de.pi_step_factor(error, self.previous_error, accepted,
+                                       self.after_rejection, self.error_order)
+            self.step_size = max(self.min_step,
+                                 min(self.step_size * float(factor),
+                                     self.max_step))
+            if accepted:
+                self.previous_error = max(error, 1e-4)
+            self.after_rejection = not accepted
+
+        elif max(self.error) == 0:
             self.step_size = self.step_size*10
 
         else:
@@ -355,10 +1140,16 @@ class Star:
                 self.min_step,
                     min(
                         self.step_size * 0.8 *
-                        (self.error_thresh / max(self.error))**.2,
+                        (self.error_thresh / max(self.error))**(1 / (self.error_order + 1)),
                         self.max_step)
             )
 
+        if self.profile is not None and max(self.error) != 0:
+            if self.step_size == self.min_step:
+                self.profile.count("min_step_hits")
+            elif self.step_size == self.max_step:
+                self.profile.count("max_step_hits")
+
 
     def de_use_intermediate(self):
         """
@@ -381,6 +1172,14 @@ class Star:
         Checks closeness to tau infinity
         """
 
+        if self.variable == "log_radius" and (
+                self.properties['radii'] > MAX_RADIUS
+                or self.properties['mass'].now(0) > MAX_MASS):
+            print("Stopping as the star is past MAX_RADIUS or MAX_MASS")
+            self.run = False
+            self.success = False
+            return
+
         self.dtau = (self.properties['opacity'].now() *
                      (self.properties['density'].now(0))**2 / abs(
                          self.properties['density'].now(1)))
@@ -389,10 +1188,15 @@ class Star:
             self.run = False
             self.success = True
 
-        elif len(self.properties['radius']) > 5000:
+        elif self.points > 5000:
             print("Stopping based on large number of iterations > 30000")
             self.run = False
             self.success = False
 
+        elif self.stalled:
+            print("Stopping as a step at min_step was rejected")
+            self.run = False
+            self.success = False
+
         else:
             self.run = True
@@ -0,0 +1,201 @@
+"""
+File backed queue of starlist lines shared by main.py workers. Workers on
+any machine that can see the queue file lease one star at a time, keep the
+lease alive with a heartbeat while it is solved, and record the output
+file and converged rho_c when it is done. Stars whose worker died are
+leased again once their lease runs out, so an interrupted sweep resumes
+without redoing finished stars.
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+def worker_name():
+    """
+    Returns:
+        (str): Name of this process that is unique across machines
+    """
+    return "{}:{}".format(socket.gethostname(), os.getpid())
+
+
+class WorkQueue:
+    """
+    SQLite table of jobs, one per starlist line, that are pending, leased,
+    done or failed. The default rollback journal is kept instead of WAL so
+    the file can live on a shared network filesystem.
+    """
+
+    def __init__(self, path="Star_Files/work_queue.sqlite", lease_time=600,
+                 max_attempts=3):
+        """
+        Opens the queue at path, creating it if needed
+
+        Args:
+            path (str): Location of the SQLite file
+            lease_time (float): Seconds a lease lasts without a heartbeat
+            max_attempts (int): Leases a star gets before it is failed
+        """
+        self.path = str(path)
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+        with self.connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY,
+                    line TEXT UNIQUE,
+                    status TEXT DEFAULT 'pending',
+                    worker TEXT,
+                    lease_until REAL,
+                    attempts INTEGER DEFAULT 0,
+                    output TEXT,
+                    rho_c REAL,
+                    error TEXT,
+                    updated REAL)""")
+
+    @contextmanager
+    def connect(self):
+        """
+        Opens a new connection that waits on other writers. It commits if
+        the block succeeds, rolls back if not, and is always closed.
+        """
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def add(self, lines):
+        """
+        Adds starlist lines that are not in the queue yet
+
+        Returns:
+            (int): Number of lines added
+        """
+        lines = [line.strip() for line in lines if line.strip()]
+        with self.connect() as connection:
+            before = connection.total_changes
+            connection.executemany(
+                "INSERT OR IGNORE INTO jobs (line, updated) VALUES (?, ?)",
+                [(line, time.time()) for line in lines])
+            return connection.total_changes - before
+
+    def lease(self, worker):
+        """
+        Takes the next pending star, or a leased one whose lease ran out
+
+        Returns:
+            (tuple or None): (job id, starlist line) or None if nothing is
+                left to do
+        """
+        now = time.time()
+        with self.connect() as connection:
+            # Take the write lock first so no two workers lease the same star
+            connection.execute("BEGIN IMMEDIATE")
+            # A worker that died on a star's last attempt leaves it leased
+            # with no attempts left, it is failed instead of stuck
+            connection.execute(
+                """UPDATE jobs SET status = 'failed', updated = ?,
+                   error = COALESCE(error, 'Lease ran out on the last attempt')
+                   WHERE status = 'leased' AND lease_until < ?
+                   AND attempts >= ?""", (now, now, self.max_attempts))
+            job = connection.execute(
+                """SELECT id, line FROM jobs
+                   WHERE (status = 'pending' OR
+                          (status = 'leased' AND lease_until < ?))
+                   AND attempts < ? ORDER BY id LIMIT 1""",
+                (now, self.max_attempts)).fetchone()
+            if job is not None:
+                connection.execute(
+                    """UPDATE jobs SET status = 'leased', worker = ?,
+                       lease_until = ?, attempts = attempts + 1, updated = ?
+                       WHERE id = ?""",
+                    (worker, now + self.lease_time, now, job[0]))
+
+        return job
+
+    def heartbeat(self, job_id, worker):
+        """
+        Extends the lease of a star this worker is still solving
+
+        Returns:
+            (bool): False if the lease was lost to another worker
+        """
+        with self.connect() as connection:
+            return connection.execute(
+                """UPDATE jobs SET lease_until = ?, updated = ?
+                   WHERE id = ? AND worker = ? AND status = 'leased'""",
+                (time.time() + self.lease_time, time.time(), job_id,
+                 worker)).rowcount == 1
+
+    def complete(self, job_id, worker, output, rho_c):
+        """
+        Records a finished star with its output file and converged rho_c
+
+        Returns:
+            (bool): False if the lease was lost to another worker, whose
+                result is kept
+        """
+        with self.connect() as connection:
+            return connection.execute(
+                """UPDATE jobs SET status = 'done', output = ?, rho_c = ?,
+                   error = NULL, updated = ?
+                   WHERE id = ? AND worker = ? AND status = 'leased'""",
+                (output, float(rho_c), time.time(), job_id,
+                 worker)).rowcount == 1
+
+    def fail(self, job_id, worker, error):
+        """
+        Records a failed attempt. The star goes back to pending until it
+        has used up max_attempts.
+        """
+        with self.connect() as connection:
+            connection.execute(
+                """UPDATE jobs SET status = CASE WHEN attempts < ?
+                   THEN 'pending' ELSE 'failed' END, error = ?, updated = ?
+                   WHERE id = ? AND worker = ? AND status = 'leased'""",
+                (self.max_attempts, error, time.time(), job_id, worker))
+
+    def counts(self):
+        """
+        Returns:
+            (dict): Number of stars with each status
+        """
+        with self.connect() as connection:
+            return dict(
+                connection.execute(
+                    "SELECT status, count(*) FROM jobs GROUP BY status"))
+
+
+class Heartbeat:
+    """
+    Keeps the lease of a job alive from a background thread while the
+    worker is busy solving it. Used as a context manager around the work.
+    """
+
+    def __init__(self, queue, job_id, worker):
+        self.queue = queue
+        self.job_id = job_id
+        self.worker = worker
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.queue.lease_time / 3):
+            if not self.queue.heartbeat(self.job_id, self.worker):
+                print("Lost the lease of job", self.job_id)
+                break
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
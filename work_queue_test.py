@@ -0,0 +1,105 @@
+"""
+Checks WorkQueue leases every star once and recovers from dead workers
+"""
+import time
+import pytest
+import work_queue
+from work_queue import Heartbeat, WorkQueue
+
+LINES = ["1.5e7 Hydrogen", "2e7 Hydrogen", "1e8 Helium"]
+
+
+class Clock:
+    """
+    Stands in for time.time so leases run out without waiting
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(work_queue.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    queue = WorkQueue(tmp_path / "queue.sqlite", lease_time=60,
+                      max_attempts=2)
+    queue.add(LINES)
+    return queue
+
+
+def test_add(queue):
+    assert queue.add(LINES + ["  ", "5e6 Hydrogen\n"]) == 1
+    assert queue.counts() == {"pending": 4}
+
+
+def test_lease_once(queue):
+    jobs = [queue.lease("a"), queue.lease("b"), queue.lease("a")]
+    assert [line for job_id, line in jobs] == LINES
+    assert queue.lease("b") is None
+    assert queue.counts() == {"leased": 3}
+
+
+def test_complete(queue):
+    job_id, line = queue.lease("a")
+    assert not queue.complete(job_id, "b", "other.txt", 1.0)
+    assert queue.complete(job_id, "a", "star.txt", 2.5e5)
+    assert not queue.complete(job_id, "a", "star.txt", 2.5e5)
+    assert queue.counts() == {"done": 1, "pending": 2}
+
+
+def test_fail_until_max_attempts(queue):
+    job_id, line = queue.lease("a")
+    queue.fail(job_id, "a", "diverged")
+    assert queue.counts() == {"pending": 3}
+
+    assert queue.lease("b") == (job_id, line)
+    queue.fail(job_id, "b", "diverged")
+    assert queue.counts() == {"failed": 1, "pending": 2}
+    assert queue.lease("c")[0] != job_id
+
+
+def test_expired_lease(queue, clock):
+    job_id, line = queue.lease("dead")
+    clock.now += 30
+    assert queue.heartbeat(job_id, "dead")
+
+    # The heartbeat pushed the lease out, so it is still held
+    clock.now += 60
+    assert queue.lease("b")[0] != job_id
+
+    clock.now += 31
+    assert queue.lease("c") == (job_id, line)
+    assert not queue.heartbeat(job_id, "dead")
+    assert not queue.complete(job_id, "dead", "dead.txt", 1.0)
+    assert queue.complete(job_id, "c", "star.txt", 2.0)
+
+
+def test_expired_last_attempt(queue, clock):
+    job_id, line = queue.lease("a")
+    queue.fail(job_id, "a", "diverged")
+    assert queue.lease("b") == (job_id, line)
+
+    clock.now += 61
+    assert queue.lease("c")[0] != job_id
+    assert queue.counts() == {"failed": 1, "leased": 1, "pending": 1}
+
+
+def test_heartbeat_thread(tmp_path):
+    queue = WorkQueue(tmp_path / "queue.sqlite", lease_time=0.3)
+    queue.add(LINES[:1])
+    job_id, line = queue.lease("a")
+
+    with Heartbeat(queue, job_id, "a"):
+        time.sleep(0.6)
+        assert queue.lease("b") is None
+
+    assert queue.complete(job_id, "a", "star.txt", 1.0)